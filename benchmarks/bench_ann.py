@@ -0,0 +1,137 @@
+"""Compare recall and latency of compressed FAISS index types to flat.
+
+Vectors come from a saved index (its exact flat copy when compressed) or
+are generated synthetically as normalized clustered vectors, like the
+e5 embeddings of transcript chunks. Each configuration of `ann.INDEX_TYPES`
+is built on them and reports recall@k against exact flat search, search
+latency and index size as JSON.
+
+Usage:
+    python benchmarks/bench_ann.py --vectors 100000 --output ann.json
+    python benchmarks/bench_ann.py --vs-path data/vs
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import faiss  # noqa: E402
+import numpy as np  # noqa: E402
+
+from ann import build_index, index_memory_bytes  # noqa: E402
+
+CONFIGS = [
+    ("flat", {}),
+    ("sq8", {}),
+    ("ivf", {"nprobe": 4}),
+    ("ivf", {"nprobe": 16}),
+    ("ivf", {"nprobe": 64}),
+    ("ivfpq", {"nprobe": 16, "m": 64}),
+    ("ivfpq", {"nprobe": 64, "m": 128}),
+    ("hnsw", {"ef_search": 32}),
+    ("hnsw", {"ef_search": 128}),
+]
+
+
+def synthetic_vectors(
+        n: int,
+        dim: int,
+        n_clusters: int,
+        seed: int
+    ) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, n)
+    noise = rng.standard_normal((n, dim)).astype(np.float32)
+    vectors = centers[labels] + 0.5 * noise
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def saved_vectors(vs_path: str) -> np.ndarray:
+    for name in ("master.faiss", "index.faiss"):
+        path = Path(vs_path) / name
+        if path.exists():
+            index = faiss.read_index(str(path))
+            return index.reconstruct_n(0, index.ntotal)
+    raise FileNotFoundError(f"No index found in {vs_path}")
+
+
+def run(args) -> dict:
+    if args.vs_path:
+        vectors = saved_vectors(args.vs_path)
+    else:
+        vectors = synthetic_vectors(
+            args.vectors, args.dim, args.clusters, args.seed
+        )
+    rng = np.random.default_rng(args.seed + 1)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    noise = rng.standard_normal(queries.shape).astype(np.float32)
+    queries = queries + 0.05 * noise
+    faiss.normalize_L2(queries)
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    results = {"config": vars(args), "n_vectors": len(vectors), "runs": []}
+    flat_latency = None
+    for index_type, params in CONFIGS:
+        t0 = time.perf_counter()
+        index, resolved = build_index(vectors, index_type, **params)
+        build_sec = time.perf_counter() - t0
+
+        latencies = []
+        found = np.empty_like(truth)
+        for i, query in enumerate(queries):
+            t0 = time.perf_counter()
+            _, found[i:i + 1] = index.search(query[None, :], args.k)
+            latencies.append(time.perf_counter() - t0)
+        recall = np.mean([
+            len(set(found[i]) & set(truth[i])) / args.k
+            for i in range(len(queries))
+        ])
+        mean_ms = 1000 * float(np.mean(latencies))
+        if index_type == "flat":
+            flat_latency = mean_ms
+        results["runs"].append({
+            "index_type": index_type,
+            "params": resolved,
+            f"recall@{args.k}": float(recall),
+            "mean_ms": mean_ms,
+            "p99_ms": 1000 * float(np.percentile(latencies, 99)),
+            "speedup_vs_flat": (
+                flat_latency / mean_ms if flat_latency else None
+            ),
+            "memory_mib": index_memory_bytes(index) / 2**20,
+            "build_sec": build_sec,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vs-path", type=str, default=None,
+                        help="Benchmark the vectors of a saved index")
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None,
+                        help="JSON output path, stdout if not set")
+    args = parser.parse_args()
+
+    results = json.dumps(run(args), indent=2)
+    if args.output:
+        Path(args.output).write_text(results, encoding="utf-8")
+    else:
+        print(results)
+
+
+if __name__ == "__main__":
+    main()
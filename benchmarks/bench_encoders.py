@@ -0,0 +1,109 @@
+"""Compare the latency and fp32 parity of the e5 encoder backends.
+
+Passages are transcript chunks of a folder, queries their first words.
+Each backend of `encoders.BACKENDS` is loaded for the given model and
+reports its load time, passage throughput, single-query latency and its
+parity with the fp32 torch embeddings (cosine similarity and top-1
+nearest passage agreement) as JSON.
+
+Usage:
+    python benchmarks/bench_encoders.py --folder data/dash --model large
+    python benchmarks/bench_encoders.py --folder data/dash --model small \
+        --backends torch onnx-int8 --output encoders.json
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import numpy as np  # noqa: E402
+
+from build_dataset import load_txt_file_as_chunks  # noqa: E402
+from encoders import BACKENDS, E5Embeddings, parity_check  # noqa: E402
+
+
+def sample_texts(
+        folder: str,
+        n_passages: int,
+        n_queries: int
+    ) -> tuple[list, list]:
+    passages = []
+    for path in sorted(Path(folder).rglob("*.txt")):
+        passages.extend(c.page_content for c in load_txt_file_as_chunks(path))
+        if len(passages) >= n_passages:
+            break
+    passages = passages[:n_passages]
+    if not passages:
+        raise FileNotFoundError(f"No transcript found in {folder}")
+    queries = [" ".join(p.split()[:8]) for p in passages[:n_queries]]
+    return queries, passages
+
+
+def run(args) -> dict:
+    queries, passages = sample_texts(args.folder, args.passages, args.queries)
+    reference = None
+    results = {
+        "model": args.model,
+        "passages": len(passages),
+        "queries": len(queries),
+        "backends": {},
+    }
+    for backend in args.backends:
+        start = time.perf_counter()
+        embeddings = E5Embeddings(args.model, backend, args.batch_size)
+        load_sec = time.perf_counter() - start
+
+        start = time.perf_counter()
+        embeddings.embed_documents(passages)
+        embed_sec = time.perf_counter() - start
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            embeddings.embed_query(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        if backend == "torch":
+            reference = embeddings
+        report = {
+            "load_sec": load_sec,
+            "passages_per_sec": len(passages) / embed_sec,
+            "query_ms_p50": float(np.percentile(latencies, 50)),
+            "query_ms_p99": float(np.percentile(latencies, 99)),
+        }
+        if backend != "torch":
+            if reference is None:
+                reference = E5Embeddings(args.model, "torch", args.batch_size)
+            report["parity"] = parity_check(
+                embeddings, queries, passages, reference
+            )
+        results["backends"][backend] = report
+        print(f"{backend}: {json.dumps(report)}", file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--folder", type=str, default="data/dash",
+                        help="Folder of transcripts to sample passages from")
+    parser.add_argument("--model", type=str, default="large",
+                        help="e5 model id, or 'large', 'base' or 'small'")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS),
+                        choices=BACKENDS)
+    parser.add_argument("--passages", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--output", type=str, default=None,
+                        help="Write the JSON report to this file")
+    args = parser.parse_args()
+    results = json.dumps(run(args), indent=2)
+    if args.output:
+        Path(args.output).write_text(results, encoding="utf-8")
+    print(results)
+
+
+if __name__ == "__main__":
+    main()
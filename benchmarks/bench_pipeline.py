@@ -0,0 +1,201 @@
+"""Benchmark ingestion, indexing, timestamp alignment and query latency.
+
+Generates a synthetic corpus of timestamped transcripts in the format
+written by `fetch_and_save_transcript`, runs every pipeline stage on it and
+reports throughput and latency as JSON, so results can be compared over
+time.
+
+Usage:
+    python benchmarks/bench_pipeline.py --videos 100 --output bench.json
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import numpy as np  # noqa: E402
+from langchain_core.embeddings import DeterministicFakeEmbedding  # noqa: E402
+
+from build_dataset import (iter_txt_folder_as_documents,  # noqa: E402
+                           load_txt_folder_as_documents)
+from retrieve import (embed_documents_streaming,  # noqa: E402
+                      iter_transcript_chunks)
+from retrieve_timestamp import get_timestamp_for_chunk  # noqa: E402
+from utils import second_to_timestamp  # noqa: E402
+
+WORDS = (
+    "onduleur solaire panneau installation maintenance batterie réseau "
+    "tension courant puissance rendement câble toiture garantie "
+    "production consommation autoconsommation compteur micro-onduleur "
+    "string optimiseur ombrage orientation inclinaison été hiver "
+    "kilowatt heure facture économie entretien nettoyage défaut alarme"
+).split()
+
+
+def write_synthetic_corpus(
+        root: Path,
+        n_videos: int,
+        lines_per_video: int,
+        seed: int = 0
+    ) -> list[Path]:
+    """Write n_videos synthetic transcripts under root/<playlist>/<Title>/."""
+    rng = random.Random(seed)
+    paths = []
+    for video_index in range(n_videos):
+        path = root / "synthetic" / "Synthetic playlist" / f"{video_index}.txt"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lines = [f"# https://www.youtube.com/watch/?v=vid{video_index:05d}\n"]
+        start = 0.0
+        for _ in range(lines_per_video):
+            text = " ".join(rng.choice(WORDS) for _ in range(14))
+            lines.append(f"{second_to_timestamp(start)} {text}.")
+            start += rng.uniform(3.0, 8.0)
+        path.write_text("\n".join(lines), encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+def _latencies(values: list[float]) -> dict:
+    ordered = sorted(values)
+    p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+    return {
+        "count": len(ordered),
+        "mean_ms": 1000 * statistics.fmean(ordered),
+        "p50_ms": 1000 * ordered[len(ordered) // 2],
+        "p95_ms": 1000 * p95,
+        "max_ms": 1000 * ordered[-1],
+    }
+
+
+def _throughput(n_items: int, seconds: float, unit: str) -> dict:
+    return {
+        "seconds": seconds,
+        unit: n_items,
+        f"{unit}_per_sec": n_items / max(seconds, 1e-9),
+    }
+
+
+def run(args) -> dict:
+    rng = random.Random(args.seed)
+    results = {
+        "config": vars(args),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "stages": {},
+    }
+    stages = results["stages"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        t0 = time.perf_counter()
+        paths = write_synthetic_corpus(
+            root, args.videos, args.lines, args.seed
+        )
+        stages["generate"] = _throughput(
+            len(paths), time.perf_counter() - t0, "videos"
+        )
+
+        t0 = time.perf_counter()
+        docs = load_txt_folder_as_documents(root)
+        stages["load_documents"] = _throughput(
+            len(docs), time.perf_counter() - t0, "videos"
+        )
+        del docs
+
+        # unchanged files are served from the file cache
+        t0 = time.perf_counter()
+        n_docs = sum(1 for _ in iter_txt_folder_as_documents(root))
+        stages["load_documents_cached"] = _throughput(
+            n_docs, time.perf_counter() - t0, "videos"
+        )
+
+        if args.load_workers:
+            t0 = time.perf_counter()
+            n_docs = sum(1 for _ in iter_txt_folder_as_documents(
+                root, workers=args.load_workers, use_cache=False
+            ))
+            stages["load_documents_parallel"] = _throughput(
+                n_docs, time.perf_counter() - t0, "videos"
+            )
+
+        t0 = time.perf_counter()
+        chunks = list(iter_transcript_chunks(root))
+        stages["chunking"] = _throughput(
+            len(chunks), time.perf_counter() - t0, "chunks"
+        )
+
+        embeddings = DeterministicFakeEmbedding(size=args.dim)
+        t0 = time.perf_counter()
+        vectorstore = embed_documents_streaming(
+            iter(chunks), embeddings, batch_size=args.batch_size
+        )
+        stages["embedding"] = _throughput(
+            len(chunks), time.perf_counter() - t0, "chunks"
+        )
+
+        sample = rng.sample(chunks, min(args.queries, len(chunks)))
+        vectors = np.asarray(
+            embeddings.embed_documents([c.page_content for c in sample]),
+            dtype=np.float32,
+        )
+        single = []
+        for vector in vectors:
+            t0 = time.perf_counter()
+            vectorstore.index.search(vector[None, :], args.k)
+            single.append(time.perf_counter() - t0)
+        stages["faiss_search"] = _latencies(single)
+        t0 = time.perf_counter()
+        vectorstore.index.search(vectors, args.k)
+        stages["faiss_search_batch"] = _throughput(
+            len(vectors), time.perf_counter() - t0, "queries"
+        )
+
+        alignment = []
+        for chunk in sample:
+            t0 = time.perf_counter()
+            path = Path(chunk.metadata["path"])
+            timed_doc = path.read_text(encoding="utf-8")
+            get_timestamp_for_chunk(chunk.page_content, timed_doc)
+            alignment.append(time.perf_counter() - t0)
+        stages["timestamp_alignment"] = _latencies(alignment)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--videos", type=int, default=100,
+                        help="Number of synthetic videos (10 to 10000)")
+    parser.add_argument("--lines", type=int, default=300,
+                        help="Timestamped lines per video")
+    parser.add_argument("--queries", type=int, default=200,
+                        help="Number of sampled chunks used as queries")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=1024,
+                        help="Dimension of the stand-in embeddings")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--load-workers", type=int, default=4,
+                        help="Processes of the parallel loading stage, "
+                             "0 to skip it")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None,
+                        help="JSON output path, stdout if not set")
+    args = parser.parse_args()
+
+    results = json.dumps(run(args), indent=2)
+    if args.output:
+        Path(args.output).write_text(results, encoding="utf-8")
+    else:
+        print(results)
+
+
+if __name__ == "__main__":
+    main()
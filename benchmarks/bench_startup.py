@@ -0,0 +1,161 @@
+"""Benchmark the import cost of the app and library modules.
+
+Each module is imported in fresh interpreters, as on a cold start or in
+a new worker process, and reports the median import wall time, the
+heavy dependencies the import pulled in, and the slowest imports
+(cumulative, from `python -X importtime`) as JSON, so regressions in
+startup time can be tracked.
+
+Usage:
+    python benchmarks/bench_startup.py --repeats 5 --output startup.json
+    python benchmarks/bench_startup.py --modules search src.dash.app
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+MODULES = [
+    "metrics",
+    "registry",
+    "search",
+    "build_dataset",
+    "retrieve",
+    "src.dash.app",
+]
+# dependencies that should only load when they are used
+HEAVY_MODULES = [
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "langchain_community",
+    "langchain_core",
+    "faiss",
+    "pytube",
+    "youtube_transcript_api",
+    "numpy",
+]
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+heavy = {heavy!r}
+print(json.dumps({{
+    "seconds": elapsed,
+    "heavy": [m for m in heavy if m in sys.modules],
+}}))
+"""
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    paths = [str(ROOT / "src"), str(ROOT), env.get("PYTHONPATH", "")]
+    env["PYTHONPATH"] = os.pathsep.join(p for p in paths if p)
+    return env
+
+
+def _probe(
+        module: str,
+        importtime: bool = False
+    ) -> subprocess.CompletedProcess:
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)]
+    return subprocess.run(
+        cmd, capture_output=True, text=True, cwd=ROOT, env=_env()
+    )
+
+
+def _import_times(stderr: str) -> dict[str, float]:
+    """Parse `-X importtime` output into cumulative milliseconds by module."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+def _slowest_imports(stderr: str, baseline: set[str], top: int) -> list[dict]:
+    """Top cumulative import times.
+
+    The modules every interpreter imports at startup (baseline) are left
+    out, as are submodules, whose time is included in their package's.
+    """
+    rows = [
+        {"module": name, "ms": ms}
+        for name, ms in _import_times(stderr).items()
+        if name not in baseline and "." not in name
+    ]
+    rows.sort(key=lambda r: r["ms"], reverse=True)
+    return rows[:top]
+
+
+def bench_module(
+        module: str,
+        repeats: int,
+        top: int,
+        baseline: set[str]
+    ) -> dict:
+    seconds = []
+    for _ in range(repeats):
+        proc = _probe(module)
+        if proc.returncode != 0:
+            return {"error": proc.stderr.strip().splitlines()[-1]}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        seconds.append(result["seconds"])
+    proc = _probe(module, importtime=True)
+    return {
+        "median_ms": 1000 * statistics.median(seconds),
+        "min_ms": 1000 * min(seconds),
+        "heavy_modules": result["heavy"],
+        "slowest_imports": _slowest_imports(proc.stderr, baseline, top),
+    }
+
+
+def run(args) -> dict:
+    results = {
+        "config": vars(args),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "modules": {},
+    }
+    baseline = set(_import_times(_probe("sys", importtime=True).stderr))
+    for module in args.modules:
+        results["modules"][module] = bench_module(
+            module, args.repeats, args.top, baseline
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--repeats", type=int, default=5,
+                        help="Fresh interpreters per module")
+    parser.add_argument("--top", type=int, default=10,
+                        help="Number of slowest imports reported")
+    parser.add_argument("--output", type=str, default=None,
+                        help="JSON output path, stdout if not set")
+    args = parser.parse_args()
+
+    results = json.dumps(run(args), indent=2)
+    if args.output:
+        Path(args.output).write_text(results, encoding="utf-8")
+    else:
+        print(results)
+
+
+if __name__ == "__main__":
+    main()
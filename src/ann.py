@@ -0,0 +1,187 @@
+import json
+import logging
+import math
+import os
+from pathlib import Path
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+from registry import INDEX_META_NAME
+INDEX_TYPES = ("flat", "ivf", "ivfpq", "sq8", "hnsw")
+DEFAULT_PARAMS = {
+    "flat": {},
+    # nlist=None picks about 4 * sqrt(n) lists
+    "ivf": {"nlist": None, "nprobe": 16},
+    "ivfpq": {"nlist": None, "nprobe": 16, "m": 64, "nbits": 8},
+    "sq8": {},
+    "hnsw": {"M": 32, "ef_construction": 80, "ef_search": 64},
+}
+
+
+def resolve_params(index_type: str, n_vectors: int, **params) -> dict:
+    """Merge params with the defaults of an index type.
+
+    The params that depend on the number of vectors are resolved.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(
+            f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}"
+        )
+    resolved = {**DEFAULT_PARAMS[index_type], **params}
+    if "nlist" in resolved and resolved["nlist"] is None:
+        # faiss wants about 39 training points per centroid
+        resolved["nlist"] = max(
+            1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39)
+        )
+    if "nbits" in resolved:
+        # PQ codebooks need at least 2**nbits training points
+        resolved["nbits"] = max(
+            1, min(resolved["nbits"], int(math.log2(max(n_vectors, 2))))
+        )
+    return resolved
+
+
+def min_training_vectors(index_type: str, params: dict) -> int:
+    """Number of vectors needed to train an index type.
+
+    params are resolved params, see resolve_params.
+    """
+    if index_type == "ivf":
+        return params["nlist"]
+    if index_type == "ivfpq":
+        return max(params["nlist"], 2 ** params["nbits"])
+    if index_type == "sq8":
+        return 1
+    return 0
+
+
+def _factory_string(index_type: str, params: dict) -> str:
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "ivf":
+        return f"IVF{params['nlist']},Flat"
+    if index_type == "ivfpq":
+        return f"IVF{params['nlist']},PQ{params['m']}x{params['nbits']}"
+    if index_type == "sq8":
+        return "SQ8"
+    return f"HNSW{params['M']},Flat"
+
+
+def apply_search_params(index, params: dict) -> None:
+    """Set the search-time parameters of an index.
+
+    They are not always kept by faiss serialization.
+    """
+    space = faiss.ParameterSpace()
+    # params of another index type, e.g. read while the index is rebuilt,
+    # are ignored
+    if "nprobe" in params and faiss.try_extract_index_ivf(index) is not None:
+        space.set_index_parameter(index, "nprobe", params["nprobe"])
+    if "ef_search" in params and hasattr(index, "hnsw"):
+        space.set_index_parameter(index, "efSearch", params["ef_search"])
+
+
+def build_index(vectors: np.ndarray, index_type: str, **params) -> tuple:
+    """Build, train if needed, and fill a faiss index of the given type.
+
+    Args:
+        vectors (np.ndarray): (n, dim) float32 matrix, added in order
+        index_type (str): One of INDEX_TYPES
+        **params: Build and search parameters, see DEFAULT_PARAMS
+    Returns:
+        tuple: (index, resolved params)
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    params = resolve_params(index_type, n, **params)
+    if n < min_training_vectors(index_type, params):
+        raise ValueError(
+            f"A {index_type} index needs at least "
+            f"{min_training_vectors(index_type, params)} vectors, got {n}"
+        )
+    index = faiss.index_factory(
+        dim, _factory_string(index_type, params), faiss.METRIC_L2
+    )
+    if index_type == "hnsw":
+        index.hnsw.efConstruction = params["ef_construction"]
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    apply_search_params(index, params)
+    return index, params
+
+
+def convert_vectorstore(
+        vectorstore: FAISS,
+        index_type: str,
+        **params
+    ) -> tuple[FAISS, dict]:
+    """Rebuild the index of a flat vectorstore with another index type.
+
+    The docstore and the position -> id mapping are shared with the
+    source vectorstore. Below the number of vectors needed to train the
+    index type, e.g. once all the transcripts of a shard are deleted, the
+    index stays flat.
+
+    Returns:
+        tuple[FAISS, dict]: (converted vectorstore, index metadata)
+    """
+    source = vectorstore.index
+    resolved = resolve_params(index_type, source.ntotal, **params)
+    if source.ntotal < min_training_vectors(index_type, resolved):
+        logging.warning(
+            f"{source.ntotal} vector(s) are too few to train a {index_type} "
+            f"index, keeping a flat index"
+        )
+        index_type, params = "flat", {}
+    vectors = source.reconstruct_n(0, source.ntotal)
+    index, params = build_index(vectors, index_type, **params)
+    converted = FAISS(
+        embedding_function=vectorstore.embedding_function,
+        index=index,
+        docstore=vectorstore.docstore,
+        index_to_docstore_id=vectorstore.index_to_docstore_id,
+        normalize_L2=vectorstore._normalize_L2,
+        distance_strategy=vectorstore.distance_strategy,
+    )
+    meta = {
+        "index_type": index_type,
+        "factory": _factory_string(index_type, params),
+        "params": params,
+        "ntotal": index.ntotal,
+        "dim": index.d,
+        "memory_bytes": index_memory_bytes(index),
+    }
+    logging.info(
+        f"Built {meta['factory']} index: {meta['ntotal']} vectors, "
+        f"{meta['memory_bytes'] / 2**20:.1f} MiB "
+        f"(flat: {index_memory_bytes(source) / 2**20:.1f} MiB)"
+    )
+    return converted, meta
+
+
+def index_memory_bytes(index) -> int:
+    """Size of an index once serialized, close to its size in memory."""
+    return int(faiss.serialize_index(index).size)
+
+
+def load_index_meta(vs_path: str | Path) -> dict:
+    """Load the build metadata of the index at vs_path, flat by default."""
+    meta_path = Path(vs_path) / INDEX_META_NAME
+    if not meta_path.exists():
+        return {"index_type": "flat", "params": {}}
+    return json.loads(meta_path.read_text(encoding="utf-8"))
+
+
+def save_index_meta(vs_path: str | Path, meta: dict) -> None:
+    """Write the build metadata of the index at vs_path atomically.
+
+    Readers never see a partial file.
+    """
+    Path(vs_path).mkdir(parents=True, exist_ok=True)
+    meta_path = Path(vs_path) / INDEX_META_NAME
+    tmp_path = meta_path.with_name(INDEX_META_NAME + ".tmp")
+    tmp_path.write_text(json.dumps(meta, indent=1), encoding="utf-8")
+    os.replace(tmp_path, meta_path)
@@ -0,0 +1,341 @@
+import argparse
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+import zstandard
+
+from chunking import parse_timed_lines
+from cleaning import clean_transcript_and_extract_url
+from timestamps import seconds_to_timestamps, timestamps_to_millis
+from urls import video_id_from_url
+from utils import BINARY_SUFFIX
+
+MAGIC = b"TSB1"
+FORMAT_VERSION = 1
+# magic, version, header length
+_PREFIX = struct.Struct("<4sII")
+_ALIGN = 8
+ZSTD_LEVEL = 9
+
+
+def _aligned(n: int) -> int:
+    return -(-n // _ALIGN) * _ALIGN
+
+
+def write_transcript(
+        path: str | Path,
+        lines: list[tuple[str | None, str]],
+        video_id: str | None = None,
+        url: str | None = None,
+        title: str | None = None,
+        language: str | None = None
+    ) -> Path:
+    """Write timed lines to a .tsb file, a columnar binary transcript.
+
+    The file holds a fixed prefix (magic bytes, format version and header
+    length), a JSON header (video metadata, number of lines and section
+    sizes), then, 8-byte aligned: the start time of each line in seconds
+    as float64 (NaN before the first timestamp), the offset of each line
+    in the text as int64 followed by len(text) + 1, and the zstd-compressed
+    text, i.e. the cleaned lines joined by a space. The text is thus the
+    cleaned transcript as clean_transcript_and_extract_url returns it.
+
+    Args:
+        path (str | Path): Output file
+        lines (list[tuple[str | None, str]]): (timestamp, text) lines, as
+            returned by chunking.parse_timed_lines
+        video_id (str | None): YouTube video id
+        url (str | None): Video URL
+        title (str | None): Video title
+        language (str | None): Transcript language code
+    Returns:
+        Path: The written file
+    """
+    path = Path(path)
+    texts = [text for _, text in lines]
+    text = " ".join(texts)
+    starts = np.full(len(lines), np.nan)
+    timed = [i for i, (ts, _) in enumerate(lines) if ts is not None]
+    starts[timed] = timestamps_to_millis([lines[i][0] for i in timed]) / 1000
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    np.cumsum([len(t) + 1 for t in texts], out=offsets[1:])
+    compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    blob = compressor.compress(text.encode("utf-8"))
+
+    header = json.dumps({
+        "video_id": video_id,
+        "url": url,
+        "title": title,
+        "language": language,
+        "count": len(lines),
+        "text_length": len(text),
+        "blob_size": len(blob),
+    }, ensure_ascii=False).encode("utf-8")
+    data_start = _aligned(_PREFIX.size + len(header))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        f.write(b"\0" * (data_start - _PREFIX.size - len(header)))
+        f.write(starts.astype("<f8").tobytes())
+        f.write(offsets.astype("<i8").tobytes())
+        f.write(blob)
+    os.replace(tmp, path)
+    return path
+
+
+class BinaryTranscript:
+    """Memory-mapped reader of a .tsb transcript.
+
+    starts and offsets are read-only views of the file, the text is
+    decompressed on first access.
+
+    Attributes:
+        header (dict): video_id, url, title and language of the video
+        starts (np.ndarray): Start time of each line in seconds
+        offsets (np.ndarray): Offset of each line in text, with a last
+            entry of len(text) + 1
+    """
+
+    def __init__(self, path: str | Path):
+        """Map the file at path and read its header."""
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_size = _PREFIX.unpack_from(self._mmap)
+        if magic != MAGIC or version > FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(
+                f"{self.path} is not a version {FORMAT_VERSION} .tsb "
+                "transcript"
+            )
+        self.header = json.loads(
+            self._mmap[_PREFIX.size:_PREFIX.size + header_size].decode("utf-8")
+        )
+        count = self.header["count"]
+        start = _aligned(_PREFIX.size + header_size)
+        self.starts = np.frombuffer(self._mmap, "<f8", count, start)
+        start += 8 * count
+        self.offsets = np.frombuffer(self._mmap, "<i8", count + 1, start)
+        self._blob_start = start + 8 * (count + 1)
+        self._text: str | None = None
+
+    def __len__(self) -> int:
+        """Number of lines."""
+        return self.header["count"]
+
+    def __enter__(self):
+        """Return the transcript, closed on exit."""
+        return self
+
+    def __exit__(self, *exc):
+        """Close the transcript."""
+        self.close()
+
+    def close(self) -> None:
+        """Release the arrays and unmap the file."""
+        # views of the mmap must be released before it can be closed
+        self.starts = self.offsets = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # arrays still used by the caller, closed once they are freed
+            pass
+
+    @property
+    def url(self) -> str | None:
+        """URL of the video, None if unknown."""
+        return self.header.get("url")
+
+    @property
+    def text(self) -> str:
+        """Cleaned transcript: all the lines joined by a space."""
+        if self._text is None:
+            end = self._blob_start + self.header["blob_size"]
+            self._text = zstandard.ZstdDecompressor().decompress(
+                self._mmap[self._blob_start:end],
+                max_output_size=4 * self.header["text_length"] + 1,
+            ).decode("utf-8")
+        return self._text
+
+    def segment(self, i: int) -> str:
+        """Text of line i."""
+        return self.text[self.offsets[i]:self.offsets[i + 1] - 1]
+
+    def segments(self, start: int = 0, stop: int | None = None) -> list[str]:
+        """Texts of lines start to stop (excluded)."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        text, offsets = self.text, self.offsets
+        return [
+            text[offsets[i]:offsets[i + 1] - 1] for i in range(start, stop)
+        ]
+
+    def between(self, start_sec: float, end_sec: float) -> tuple[int, int]:
+        """Range of the lines starting in [start_sec, end_sec).
+
+        It is found by binary search of the start times.
+        """
+        starts = np.nan_to_num(self.starts, nan=-1.0)
+        return (
+            int(np.searchsorted(starts, start_sec, "left")),
+            int(np.searchsorted(starts, end_sec, "left")),
+        )
+
+    def timestamps(self) -> list[str | None]:
+        """'HH:MM:SS.mmm' start timestamp of each line.
+
+        Lines before the first timestamp get None.
+        """
+        formatted = seconds_to_timestamps(np.nan_to_num(self.starts))
+        return [
+            None if math.isnan(s) else str(ts)
+            for s, ts in zip(self.starts, formatted)
+        ]
+
+    def lines(self) -> list[tuple[str | None, str]]:
+        """(timestamp, text) lines of the transcript.
+
+        They are the ones chunking.parse_timed_lines returns for the
+        equivalent .txt transcript.
+        """
+        return list(zip(self.timestamps(), self.segments()))
+
+
+def read_timed_lines(
+        path: str | Path
+    ) -> tuple[list[tuple[str | None, str]], str | None]:
+    """Return the (timestamp, text) lines and the URL of a transcript.
+
+    The transcript is a .txt or .tsb file, read like
+    chunking.parse_timed_lines.
+    """
+    path = Path(path)
+    if path.suffix == BINARY_SUFFIX:
+        with BinaryTranscript(path) as transcript:
+            return transcript.lines(), transcript.url
+    return parse_timed_lines(
+        path.read_text(encoding="utf-8", errors="ignore")
+    )
+
+
+def read_cleaned_text(path: str | Path) -> tuple[str, str | None]:
+    """Return the cleaned text and the URL of a .txt or .tsb transcript.
+
+    The text is cleaned like clean_transcript_and_extract_url.
+    """
+    path = Path(path)
+    if path.suffix == BINARY_SUFFIX:
+        with BinaryTranscript(path) as transcript:
+            return transcript.text, transcript.url
+    return clean_transcript_and_extract_url(
+        path.read_text(encoding="utf-8", errors="ignore")
+    )
+
+
+def format_timed_text(
+        lines: list[tuple[str | None, str]],
+        url: str | None
+    ) -> str:
+    """Format timed lines in the .txt layout.
+
+    This is the layout written by build_dataset.fetch_and_save_transcript.
+    """
+    out = [f"# {url}\n"] if url else []
+    out += [text if ts is None else f"{ts} {text}" for ts, text in lines]
+    return "\n".join(out)
+
+
+def txt_to_binary(
+        path: str | Path,
+        output_path: str | Path | None = None,
+        language: str | None = None
+    ) -> Path:
+    """Convert a .txt transcript to .tsb, next to it by default.
+
+    The title is the name of its folder, as in the data/dash layout.
+    """
+    path = Path(path)
+    lines, url = read_timed_lines(path)
+    return write_transcript(
+        output_path or path.with_suffix(BINARY_SUFFIX),
+        lines,
+        video_id=video_id_from_url(url),
+        url=url,
+        title=path.parent.name,
+        language=language,
+    )
+
+
+def binary_to_txt(
+        path: str | Path,
+        output_path: str | Path | None = None
+    ) -> Path:
+    """Convert a .tsb transcript back to .txt, next to it by default."""
+    path = Path(path)
+    output_path = Path(output_path or path.with_suffix(".txt"))
+    lines, url = read_timed_lines(path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(format_timed_text(lines, url), encoding="utf-8")
+    return output_path
+
+
+def convert_folder(
+        folder: str | Path,
+        to_binary: bool = True,
+        remove_source: bool = False,
+        language: str | None = None
+    ) -> list[Path]:
+    """Convert every transcript of a folder to .tsb, or back to .txt.
+
+    Converted files are written next to their source, which is kept unless
+    remove_source is set. Where both formats are kept, loaders, listings
+    and the catalog only read the .tsb, see utils.drop_converted. As
+    indexes and caches track files by path, converting re-indexes the
+    transcripts on the next update.
+
+    Returns:
+        list[Path]: The written files
+    """
+    source_suffix = ".txt" if to_binary else BINARY_SUFFIX
+    written = []
+    for path in sorted(Path(folder).rglob(f"*{source_suffix}")):
+        if to_binary:
+            written.append(txt_to_binary(path, language=language))
+        else:
+            written.append(binary_to_txt(path))
+        if remove_source:
+            path.unlink()
+    logging.info(f"Converted {len(written)} transcript(s) under {folder}")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert transcripts between the .txt and .tsb formats"
+    )
+    parser.add_argument("folder", help="Folder of transcripts, e.g. data/dash")
+    parser.add_argument("--to", choices=["binary", "txt"], default="binary")
+    parser.add_argument("--remove-source", action="store_true",
+                        help="Delete each file once converted")
+    parser.add_argument("--language", default=None,
+                        help="Language code stored in the .tsb headers")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    convert_folder(
+        args.folder,
+        to_binary=args.to == "binary",
+        remove_source=args.remove_source,
+        language=args.language,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,94 @@
 import logging
 import random
+import threading
 import time
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import (Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
 from pathlib import Path
 
 from langchain_core.documents import Document
-from pytube import Playlist
-from youtube_transcript_api import YouTubeTranscriptApi
 
-from cleaning import clean_transcript_and_extract_url
-from utils import second_to_timestamp
+from binary_transcripts import (format_timed_text, read_cleaned_text,
+                                 read_timed_lines, write_transcript)
+from chunking import chunk_timed_lines
+from metrics import inc, timed
+from query_cache import LRUCache
+from utils import BINARY_SUFFIX, second_to_timestamp, transcript_paths
 
 
-def fetch_and_save_transcript(video_id: str, output_path: str = "data/transcript.txt"):
-    """Fetches the transcript for a given YouTube video ID and saves it to a text file with timestamps."""
-    ytt_api = YouTubeTranscriptApi()
+# loaded files by (loader, path, mtime, size), see iter_txt_folder
+FILE_CACHE_SIZE = 512
+_file_cache = LRUCache(FILE_CACHE_SIZE)
+_MISSING = object()
+
+
+def _permanent_fetch_errors() -> tuple:
+    """Errors that retrying won't fix.
+
+    youtube_transcript_api is imported on first fetch, so loading
+    transcripts does not import it.
+    """
+    from youtube_transcript_api import (NoTranscriptFound,
+                                        TranscriptsDisabled, VideoUnavailable)
+    return (NoTranscriptFound, TranscriptsDisabled, VideoUnavailable)
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter.
+
+    Tokens refill at `rate` per second up to `capacity`; acquire() blocks
+    until a token is available.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        """Start with a full bucket of capacity tokens."""
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                refill = (now - self._last) * self.rate
+                self._tokens = min(self.capacity, self._tokens + refill)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+@timed("transcript_fetch_seconds")
+def fetch_and_save_transcript(
+        video_id: str,
+        output_path: str = "data/transcript.txt",
+        transcript_api=None
+    ):
+    """Fetches the transcript of a YouTube video and saves it with timestamps.
+
+    The transcript is saved to a text file by default.
+
+    With a .tsb output_path, the transcript is saved in the columnar binary
+    format instead, see binary_transcripts.write_transcript.
+
+    transcript_api is any object with a YouTubeTranscriptApi-like
+    fetch(video_id, languages) method, a YouTubeTranscriptApi by default.
+    """
+    if transcript_api is None:
+        from youtube_transcript_api import YouTubeTranscriptApi
+        transcript_api = YouTubeTranscriptApi()
+    ytt_api = transcript_api
     transcript = ytt_api.fetch(video_id, languages=['fr'])
 
     lines = []
-    url = "# https://www.youtube.com/watch/?v=" + video_id + "\n"
+    url = "https://www.youtube.com/watch/?v=" + video_id
     current_line = ''
     current_start = None
 
@@ -29,58 +100,354 @@ def fetch_and_save_transcript(video_id: str, output_path: str = "data/transcript
 
         if len(current_line) > 80:
             timestamp = second_to_timestamp(current_start)
-            lines.append(f"{timestamp} {current_line.strip()}")
+            lines.append((timestamp, current_line.strip()))
             current_line = ""
             current_start = None
 
     if current_line and current_start:
         timestamp = second_to_timestamp(current_start)
-        lines.append(f"{timestamp} {current_line.strip()}")
-    
-    lines.insert(0, url)
+        lines.append((timestamp, current_line.strip()))
+
+    if Path(output_path).suffix == BINARY_SUFFIX:
+        write_transcript(
+            output_path,
+            lines,
+            video_id=video_id,
+            url=url,
+            title=Path(output_path).parent.name,
+            language=getattr(transcript, "language_code", None),
+        )
+        return
     Path(output_path).parent.mkdir(parents=True, exist_ok=True)
     with open(output_path, "w", encoding="utf-8") as f:
-        f.write("\n".join(lines))
+        f.write(format_timed_text(lines, url))
+
+
+def _fetch_with_retries(
+        video_id: str,
+        output_path: str,
+        transcript_api,
+        bucket: TokenBucket,
+        retries: int,
+        backoff: float
+    ):
+    """Fetch and save one transcript, retrying transient errors.
+
+    Retries wait with exponential backoff and jitter.
+    """
+    permanent_errors = _permanent_fetch_errors()
+    for attempt in range(retries + 1):
+        bucket.acquire()
+        try:
+            fetch_and_save_transcript(video_id, output_path, transcript_api)
+            return
+        except permanent_errors:
+            raise
+        except Exception as e:
+            if attempt == retries:
+                raise
+            inc("transcript_fetch_retries_total")
+            delay = backoff * 2 ** attempt * (1 + random.random())
+            logging.warning(
+                f"Fetching {video_id} failed ({e!r}), retrying in {delay:.1f}s"
+            )
+            time.sleep(delay)
+
+
+def fetch_transcripts(
+        videos: dict[str, str],
+        max_workers: int = 4,
+        requests_per_second: float = 1.0,
+        retries: int = 3,
+        backoff: float = 1.0,
+        transcript_api=None
+    ) -> dict[str, str]:
+    """Concurrently fetch and save the transcripts of several videos.
+
+    Requests are spread over a thread pool and rate limited by a token
+    bucket. A failing video is reported and does not stop the others.
+
+    Args:
+        videos (dict[str, str]): Output path of each video ID
+        max_workers (int): Number of concurrent fetches
+        requests_per_second (float): Maximum request rate
+        retries (int): Retries of a video on transient errors
+        backoff (float): Base delay in seconds of the exponential backoff
+        transcript_api: Transcript source, see fetch_and_save_transcript
+
+    Returns:
+        dict[str, str]: Error message of each video that failed
+    """
+    bucket = TokenBucket(requests_per_second)
+    failures: dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            video_id: pool.submit(
+                _fetch_with_retries, video_id, output_path, transcript_api,
+                bucket, retries, backoff
+            )
+            for video_id, output_path in videos.items()
+        }
+        for video_id, future in futures.items():
+            try:
+                future.result()
+                inc("transcripts_fetched_total")
+            except Exception as e:
+                logging.error(
+                    f"Could not fetch transcript of {video_id}: {e!r}"
+                )
+                inc("transcript_fetch_failures_total", error=type(e).__name__)
+                failures[video_id] = repr(e)
+    return failures
 
 
 def fetch_transcripts_from_playlist_id(
         playlist_id: str,
-        output_folder: str = "data/api/"
-    ):
-    """Builds a dataset of transcripts from all videos in a YouTube playlist."""
+        output_folder: str = "data/api/",
+        max_workers: int = 4,
+        requests_per_second: float = 1.0,
+        retries: int = 3,
+        transcript_api=None,
+        binary: bool = False
+    ) -> dict[str, str]:
+    """Builds a dataset of transcripts from all videos in a YouTube playlist.
+
+    Transcripts already saved are skipped, the others are fetched
+    concurrently, see fetch_transcripts. With binary, they are saved as
+    .tsb files instead of .txt.
+
+    Returns:
+        dict[str, str]: Error message of each video that failed
+    """
+    from pytube import Playlist
+
     playlist_url = f"https://www.youtube.com/playlist?list={playlist_id}"
     pl = Playlist(playlist_url)
 
     video_ids = [video.split("v=")[1].split("&")[0] for video in pl.video_urls]
+    videos = {}
     for video_index, video_id in enumerate(video_ids):
-        logging.info(f"Fetching and saving transcript for video {video_id}...")
         output_path=f"{output_folder}/{pl.title}/{video_index}.txt"
-        if Path(output_path).exists():
-            logging.info(f"Transcript already exists at {output_path}, skipping...")
+        saved = [
+            path for path in (output_path, output_path[:-4] + BINARY_SUFFIX)
+            if Path(path).exists()
+        ]
+        if saved:
+            logging.info(
+                f"Transcript already exists at {saved[0]}, skipping..."
+            )
             continue
-        fetch_and_save_transcript(video_id, output_path)
-        sleep_time = 0.8+random.random()
-        time.sleep(sleep_time)
+        if binary:
+            output_path = output_path[:-4] + BINARY_SUFFIX
+        videos[video_id] = output_path
+    logging.info(
+        f"Fetching {len(videos)} transcripts for playlist {playlist_id}..."
+    )
+    return fetch_transcripts(
+        videos,
+        max_workers=max_workers,
+        requests_per_second=requests_per_second,
+        retries=retries,
+        transcript_api=transcript_api,
+    )
+
+
+def _file_cache_key(loader: Callable, path: Path) -> tuple:
+    stat = path.stat()
+    return (loader.__name__, str(path), stat.st_mtime_ns, stat.st_size)
+
 
+def _copy_loaded(result):
+    # cached Documents are shared, callers get their own copies
+    if isinstance(result, Document):
+        return result.model_copy(deep=True)
+    if isinstance(result, list):
+        return [doc.model_copy(deep=True) for doc in result]
+    return result
 
-def load_txt_folder_as_documents(folder: str | Path) -> list[Document]:
+
+def iter_txt_folder(
+        folder: str | Path,
+        loader: Callable,
+        workers: int | None = None,
+        use_cache: bool = True
+    ) -> Iterator:
+    """Lazily apply a file loader to every transcript under a folder.
+
+    Transcripts (.txt or .tsb) are loaded in path order. Results are
+    yielded as soon as each file is loaded, so consumers can start before
+    the whole folder is read. With workers, files are read and cleaned in
+    a process pool, with at most 2 files per worker loaded ahead of the
+    consumer. Loaded files are kept in an in-memory LRU cache keyed by
+    path, mtime and size, so unchanged files are not read again by later
+    calls.
+
+    Args:
+        folder (str | Path): Path to folder with .txt files
+        loader (Callable): Picklable function of a file path, e.g.
+            load_txt_file_as_document
+        workers (int | None): Number of worker processes, None loads files
+            in the calling process
+        use_cache (bool): Read and fill the file cache
+    Yields:
+        The loader result of each file
+    """
+    executor = ProcessPoolExecutor(max_workers=workers) if workers else None
+    window = 2 * workers if workers else 1
+    # (cache key, result or Future of the result)
+    pending: deque[tuple] = deque()
+
+    def collect():
+        key, result = pending.popleft()
+        if isinstance(result, Future):
+            result = result.result()
+        if use_cache:
+            _file_cache.put(key, result)
+        return _copy_loaded(result)
+
+    try:
+        for path in transcript_paths(folder):
+            key = _file_cache_key(loader, path)
+            result = _file_cache.get(key, _MISSING) if use_cache else _MISSING
+            if result is _MISSING:
+                result = (
+                    executor.submit(loader, path) if executor
+                    else loader(path)
+                )
+            pending.append((key, result))
+            if len(pending) >= window:
+                yield collect()
+        while pending:
+            yield collect()
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def iter_txt_folder_as_documents(
+        folder: str | Path,
+        workers: int | None = None,
+        use_cache: bool = True
+    ) -> Iterator[Document]:
+    """Lazily load, clean and yield the transcripts of a folder.
+
+    Transcripts are yielded as langchain Documents, see iter_txt_folder.
+
+    Args:
+        folder (str | Path): Path to folder with .txt files
+        workers (int | None): Number of worker processes cleaning files,
+            None cleans them in the calling process
+        use_cache (bool): Skip re-reading files unchanged since a previous
+            call
+
+    Yields:
+        Document: Cleaned Document with metadata, empty transcripts are
+            skipped
+    """
+    docs = iter_txt_folder(
+        folder, load_txt_file_as_document, workers, use_cache
+    )
+    for doc in docs:
+        if doc is not None:
+            yield doc
+
+
+def iter_txt_folder_as_chunks(
+        folder: str | Path,
+        workers: int | None = None,
+        use_cache: bool = True
+    ) -> Iterator[Document]:
+    """Lazily yield the timed chunks of every transcript of a folder.
+
+    See iter_txt_folder and load_txt_file_as_chunks.
+    """
+    files = iter_txt_folder(
+        folder, load_txt_file_as_chunks, workers, use_cache
+    )
+    for chunks in files:
+        yield from chunks
+
+
+def load_txt_folder_as_documents(
+        folder: str | Path,
+        workers: int | None = None
+    ) -> list[Document]:
     """Load transcript text files from a folder, clean them, 
     and return as list of langchain Documents.
 
+    Use iter_txt_folder_as_documents to process them as they are loaded.
+
     Args:
         folder (str | Path): Path to folder with .txt files
+        workers (int | None): Number of worker processes cleaning files
 
     Returns:
         list[Document]: List of cleaned Documents with metadata
     """
-    folder = Path(folder)
-    docs: list[Document] = []
-    for path in sorted(folder.rglob("*.txt")):
-        raw = path.read_text(encoding="utf-8", errors="ignore")
-        cleaned, url = clean_transcript_and_extract_url(raw)
-        if cleaned:
-            metadata = {"source": path.name, "path": str(path)}
-            if url:
-                metadata["url"] = url
-            docs.append(Document(page_content=cleaned, metadata=metadata))
-    return docs
\ No newline at end of file
+    return list(iter_txt_folder_as_documents(folder, workers))
+
+
+@timed("transcript_load_seconds", kind="document")
+def load_txt_file_as_document(path: str | Path) -> Document | None:
+    """Load a single transcript file and return it as a cleaned Document.
+
+    .tsb files store the cleaned text, and are read without cleaning.
+
+    Args:
+        path (str | Path): Path to the .txt or .tsb file
+
+    Returns:
+        Document | None: Cleaned Document with metadata, or None if the
+            transcript is empty after cleaning
+    """
+    path = Path(path)
+    cleaned, url = read_cleaned_text(path)
+    if not cleaned:
+        return None
+    metadata = {"source": path.name, "path": str(path)}
+    if url:
+        metadata["url"] = url
+    return Document(page_content=cleaned, metadata=metadata)
+
+
+@timed("transcript_load_seconds", kind="chunks")
+def load_txt_file_as_chunks(
+        path: str | Path,
+        chunk_size: int = 700,
+        chunk_overlap: int = 50
+    ) -> list[Document]:
+    """Load a single transcript text file and split it into timed chunks.
+
+    Chunks are built directly from the timestamped lines, so each one
+    carries its exact 'start_ts'/'end_ts' and its 'start_index'/'end_index'
+    offsets in the cleaned transcript. The lines of .tsb files are read
+    without parsing.
+
+    Args:
+        path (str | Path): Path to the .txt or .tsb file
+        chunk_size (int): Maximum chunk length in characters
+        chunk_overlap (int): Maximum overlap between consecutive chunks
+
+    Returns:
+        list[Document]: Chunks as langchain Documents with metadata
+    """
+    path = Path(path)
+    lines, url = read_timed_lines(path)
+    chunks = chunk_timed_lines(lines, chunk_size, chunk_overlap)
+    base_metadata = {"source": path.name, "path": str(path)}
+    if url:
+        base_metadata["url"] = url
+
+    docs = []
+    for chunk in chunks:
+        metadata = {
+            **base_metadata,
+            "start_index": chunk.start_index,
+            "end_index": chunk.end_index,
+        }
+        if chunk.start_ts is not None:
+            metadata["start_ts"] = chunk.start_ts
+        if chunk.end_ts is not None:
+            metadata["end_ts"] = chunk.end_ts
+        docs.append(Document(page_content=chunk.text, metadata=metadata))
+    return docs
@@ -0,0 +1,389 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path, PurePosixPath
+
+from cleaning import URL_RE
+from metrics import inc, timer
+from urls import video_id_from_url
+from utils import (BINARY_SUFFIX, TRANSCRIPT_SUFFIXES, drop_converted,
+                   extract_number_from_name)
+
+CATALOG_NAME = ".catalog.sqlite"
+# files and folders modified less than this before a sync may change again
+# within the same mtime tick, they are checked again by the next sync
+RACY_NS = 2_000_000_000
+# bytes read at the start of a .txt file to find its URL header
+HEADER_BYTES = 4096
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    rel TEXT PRIMARY KEY,
+    playlist TEXT,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    video_id TEXT,
+    indexed_hash TEXT,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    deleted_seq INTEGER
+);
+CREATE TABLE IF NOT EXISTS dirs (
+    rel TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+-- one row per sync that found deleted transcripts, see deletion_mark
+CREATE TABLE IF NOT EXISTS deletions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT
+);
+"""
+# a transcript is pending until the index holds its current content
+_PENDING = "(deleted = 1 OR indexed_hash IS NULL OR indexed_hash != hash)"
+
+
+def file_hash(path: str | Path) -> str:
+    """Return the sha256 hex digest of a file's content."""
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def _read_file(path: Path) -> tuple[str, str | None]:
+    """Return the content hash and the video id of a transcript."""
+    data = path.read_bytes()
+    if path.suffix == BINARY_SUFFIX:
+        from binary_transcripts import BinaryTranscript
+        with BinaryTranscript(path) as transcript:
+            video_id = transcript.header.get("video_id")
+    else:
+        video_id = None
+        head = data[:HEADER_BYTES].decode("utf-8", errors="ignore")
+        for line in head.splitlines():
+            if URL_RE.match(line.strip()):
+                video_id = video_id_from_url(line.strip().lstrip("#").strip())
+                break
+    return hashlib.sha256(data).hexdigest(), video_id
+
+
+def _parent(rel: str) -> str:
+    return rel.rsplit("/", 1)[0] if "/" in rel else ""
+
+
+class Catalog:
+    """Persistent catalog of the transcripts of a folder, in SQLite.
+
+    Each transcript (.txt or .tsb) is recorded with its path, mtime, size,
+    content hash, video id, playlist (its first folder under the root) and
+    the hash of the content last indexed. sync() updates it incrementally:
+    folders whose mtime did not change are not listed again, and only files
+    whose mtime or size changed are read and hashed. Listing transcripts
+    and finding the ones to index then query the catalog instead of the
+    filesystem.
+
+    The database is opened on first use and shared by threads; other
+    processes, e.g. index rebuild jobs, open their own Catalog on the same
+    file.
+    """
+
+    def __init__(self, root: str | Path, db_path: str | Path | None = None):
+        """Catalog the folder root in db_path, in root by default."""
+        self.root = Path(root)
+        self.db_path = Path(db_path) if db_path else self.root / CATALOG_NAME
+        self._lock = threading.RLock()
+        self._conn: sqlite3.Connection | None = None
+        self._last_sync: float | None = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(
+                self.db_path, timeout=30, check_same_thread=False
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            columns = {
+                row[1]
+                for row in self._conn.execute("PRAGMA table_info(transcripts)")
+            }
+            if "deleted_seq" not in columns:
+                # catalogs created before deletions were sequenced
+                self._conn.execute(
+                    "ALTER TABLE transcripts ADD COLUMN deleted_seq INTEGER"
+                )
+        return self._conn
+
+    def close(self) -> None:
+        """Close the database, reopened on next use."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _rel(self, path: str | Path) -> str:
+        path = Path(path)
+        try:
+            return path.relative_to(self.root).as_posix()
+        except ValueError:
+            return path.resolve().relative_to(self.root.resolve()).as_posix()
+
+    def _path(self, rel: str) -> str:
+        return str(self.root / rel) if rel else str(self.root)
+
+    def _under(self, folder: str | Path | None) -> tuple[str, tuple]:
+        """SQL condition selecting the transcripts under folder."""
+        prefix = "" if folder is None else self._rel(folder)
+        if prefix in ("", "."):
+            return "1", ()
+        prefix += "/"
+        return "substr(rel, 1, ?) = ?", (len(prefix), prefix)
+
+    def sync(self, min_interval: float = 0.0) -> dict[str, list[str]]:
+        """Bring the catalog up to date with the folder.
+
+        Folders are only listed again when their mtime changed (an entry
+        was added, removed or renamed), and files only hashed again when
+        their mtime or size changed. Deleted transcripts that were indexed
+        are kept as pending deletions until the index drops them.
+
+        Args:
+            min_interval (float): Skip the sync if the last one ran less
+                than this many seconds ago, to poll from frequent callers
+        Returns:
+            dict[str, list[str]]: Paths 'added', 'modified' and 'removed'
+                since the last sync
+        """
+        changes = {"added": [], "modified": [], "removed": []}
+        with self._lock:
+            now = time.monotonic()
+            last = self._last_sync
+            if last is not None and now - last < min_interval:
+                return changes
+            self._last_sync = now
+            with timer("catalog_sync_seconds"):
+                self._sync(changes)
+        for kind, paths in changes.items():
+            if paths:
+                inc("catalog_changes_total", len(paths), kind=kind)
+        return changes
+
+    def _sync(self, changes: dict[str, list[str]]) -> None:
+        db = self._db()
+        racy = time.time_ns() - RACY_NS
+        known_dirs = dict(db.execute("SELECT rel, mtime_ns FROM dirs"))
+        known_files = {
+            rel: (mtime_ns, size, file_hash)
+            for rel, mtime_ns, size, file_hash in db.execute(
+                "SELECT rel, mtime_ns, size, hash FROM transcripts "
+                "WHERE deleted = 0"
+            )
+        }
+        sub_dirs: dict[str, list[str]] = {}
+        for rel in known_dirs:
+            if rel:
+                sub_dirs.setdefault(_parent(rel), []).append(rel)
+        dir_files: dict[str, list[str]] = {}
+        for rel in known_files:
+            dir_files.setdefault(_parent(rel), []).append(rel)
+
+        seen_dirs: dict[str, int] = {}
+        seen_files: set[str] = set()
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                mtime_ns = os.stat(self._path(rel_dir)).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            # racy folders are listed again by the next sync
+            seen_dirs[rel_dir] = mtime_ns if mtime_ns < racy else -1
+            if known_dirs.get(rel_dir) == mtime_ns:
+                stack.extend(sub_dirs.get(rel_dir, ()))
+                files = dir_files.get(rel_dir, ())
+            else:
+                files = []
+                with os.scandir(self._path(rel_dir)) as entries:
+                    for entry in entries:
+                        rel = (
+                            f"{rel_dir}/{entry.name}" if rel_dir
+                            else entry.name
+                        )
+                        if entry.is_dir():
+                            stack.append(rel)
+                        elif Path(entry.name).suffix in TRANSCRIPT_SUFFIXES:
+                            files.append(rel)
+                # a transcript kept in both formats is catalogued once
+                files = [
+                    p.as_posix()
+                    for p in drop_converted(map(PurePosixPath, files))
+                ]
+            for rel in files:
+                self._sync_file(
+                    db, rel, known_files.get(rel), racy, changes, seen_files
+                )
+
+        removed = set(known_files) - seen_files
+        if removed:
+            seq = db.execute("INSERT INTO deletions DEFAULT VALUES").lastrowid
+        for rel in removed:
+            changes["removed"].append(self._path(rel))
+            # never indexed transcripts are forgotten right away
+            db.execute(
+                "DELETE FROM transcripts "
+                "WHERE rel = ? AND indexed_hash IS NULL",
+                (rel,),
+            )
+            db.execute(
+                "UPDATE transcripts SET deleted = 1, deleted_seq = ? "
+                "WHERE rel = ?",
+                (seq, rel),
+            )
+        db.execute("DELETE FROM dirs")
+        db.executemany("INSERT INTO dirs VALUES (?, ?)", seen_dirs.items())
+        db.commit()
+
+    def _sync_file(self, db, rel, known, racy, changes, seen_files) -> None:
+        path = Path(self._path(rel))
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return
+        seen_files.add(rel)
+        if known is not None and known[:2] == (stat.st_mtime_ns, stat.st_size):
+            return
+        content_hash, video_id = _read_file(path)
+        # racy files are hashed again by the next sync
+        mtime_ns = stat.st_mtime_ns if stat.st_mtime_ns < racy else -1
+        playlist = rel.split("/", 1)[0] if "/" in rel else None
+        db.execute(
+            "INSERT INTO transcripts "
+            "(rel, playlist, mtime_ns, size, hash, video_id) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(rel) DO UPDATE SET mtime_ns = excluded.mtime_ns, "
+            "size = excluded.size, hash = excluded.hash, "
+            "video_id = excluded.video_id, deleted = 0",
+            (rel, playlist, mtime_ns, stat.st_size, content_hash, video_id),
+        )
+        if known is None:
+            changes["added"].append(str(path))
+        elif known[2] != content_hash:
+            changes["modified"].append(str(path))
+
+    def transcripts(self, folder: str | Path | None = None) -> list[dict]:
+        """Return the transcripts under folder (all if None), sorted by path.
+
+        Each has its 'path', 'playlist', 'mtime_ns', 'size', 'hash',
+        'video_id' and index 'status' ('indexed' or 'pending').
+        """
+        where, params = self._under(folder)
+        with self._lock:
+            rows = self._db().execute(
+                f"SELECT rel, playlist, mtime_ns, size, hash, video_id, "
+                f"{_PENDING} FROM transcripts WHERE deleted = 0 AND {where} "
+                f"ORDER BY rel",
+                params,
+            ).fetchall()
+        return [
+            {
+                "path": self._path(rel),
+                "playlist": playlist,
+                "mtime_ns": mtime_ns,
+                "size": size,
+                "hash": content_hash,
+                "video_id": video_id,
+                "status": "pending" if pending else "indexed",
+            }
+            for (
+                rel, playlist, mtime_ns, size, content_hash, video_id, pending
+            ) in rows
+        ]
+
+    def rows(self) -> list[dict[str, str]]:
+        """Return the transcripts as rows of the app's table.
+
+        Like utils.list_txt_rows, rows have a 'name', 'path' and 'status',
+        and are sorted by the number in the filename.
+        """
+        rows = []
+        for transcript in self.transcripts():
+            path = Path(transcript["path"])
+            rows.append({
+                "name": f"{path.parent.name}/{path.name}",
+                "path": transcript["path"],
+                "status": transcript["status"],
+            })
+        return sorted(rows, key=lambda r: extract_number_from_name(r["name"]))
+
+    def playlists(self) -> list[str]:
+        """Return the playlists holding at least one transcript."""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT DISTINCT playlist FROM transcripts "
+                "WHERE deleted = 0 AND playlist IS NOT NULL ORDER BY playlist"
+            ).fetchall()
+        return [playlist for playlist, in rows]
+
+    def pending_playlists(self) -> list[str]:
+        """Return the playlists with changes since their last index update.
+
+        These are the playlists with transcripts added, edited or deleted
+        since then.
+        """
+        with self._lock:
+            rows = self._db().execute(
+                f"SELECT DISTINCT playlist FROM transcripts "
+                f"WHERE playlist IS NOT NULL AND {_PENDING} ORDER BY playlist"
+            ).fetchall()
+        return [playlist for playlist, in rows]
+
+    def deletion_mark(self) -> int:
+        """Return a mark of the deletions recorded so far.
+
+        It is read before the transcripts an index is updated from, see
+        mark_indexed.
+        """
+        with self._lock:
+            (seq,) = self._db().execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM deletions"
+            ).fetchone()
+        return seq
+
+    def mark_indexed(
+            self,
+            folder: str | Path,
+            hashes: dict[str, str],
+            deletions_until: int | None = None
+        ) -> None:
+        """Record the content hash of each path held by the index of folder.
+
+        The deleted transcripts of folder, which the index no longer holds,
+        are forgotten.
+
+        Args:
+            folder (str | Path): Folder of the index
+            hashes (dict[str, str]): Content hash indexed for each path
+            deletions_until (int | None): deletion_mark() read before the
+                index update started: deletions recorded since then, which
+                the update has not seen, stay pending. None forgets all.
+        """
+        where, params = self._under(folder)
+        if deletions_until is not None:
+            where += " AND (deleted_seq IS NULL OR deleted_seq <= ?)"
+            params += (deletions_until,)
+        with self._lock:
+            db = self._db()
+            db.executemany(
+                "UPDATE transcripts SET indexed_hash = ? WHERE rel = ?",
+                [
+                    (content_hash, self._rel(path))
+                    for path, content_hash in hashes.items()
+                ],
+            )
+            db.execute(
+                f"DELETE FROM transcripts WHERE deleted = 1 AND {where}",
+                params,
+            )
+            db.commit()
+        logging.info(
+            f"Catalog: {len(hashes)} transcript(s) of {folder} indexed"
+        )
@@ -0,0 +1,124 @@
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+from cleaning import TIMESTAMP_RE, URL_RE
+
+TIMESTAMP_PREFIX_RE = re.compile(r"^\s*(\d{2}:\d{2}:\d{2}(?:[.,]\d{3})?)")
+
+
+class TimedChunk(NamedTuple):
+    """A chunk of cleaned transcript text with its position and timing.
+
+    start_index and end_index are offsets in the cleaned transcript text
+    (as returned by clean_transcript_and_extract_url), start_ts is the
+    timestamp of the chunk's first line and end_ts the one of its last line.
+    """
+    text: str
+    start_index: int
+    end_index: int
+    start_ts: Optional[str]
+    end_ts: Optional[str]
+
+
+def parse_timed_lines(
+        text: str
+) -> Tuple[List[Tuple[Optional[str], str]], Optional[str]]:
+    """Parse a raw transcript into (timestamp, text) lines and its URL.
+
+    Lines are filtered and cleaned exactly like
+    clean_transcript_and_extract_url does, so joining their texts with a
+    space gives the cleaned transcript. Lines without a timestamp inherit
+    the previous line's timestamp.
+    """
+    lines = []
+    url = None
+    ts = None
+
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+
+        if not line:
+            continue
+
+        if URL_RE.match(line):
+            if url is None:
+                url = line.lstrip("#").strip()
+            continue
+
+        if line.startswith("#"):
+            continue
+
+        m = TIMESTAMP_PREFIX_RE.match(line)
+        if m:
+            ts = m.group(1)
+        line = TIMESTAMP_RE.sub("", line)
+        line = re.sub(r"\s+", " ", line).strip()
+
+        if not line:
+            continue
+        if line.lower() == "no text":
+            continue
+
+        lines.append((ts, line))
+
+    return lines, url
+
+
+def chunk_timed_lines(
+        lines: List[Tuple[Optional[str], str]],
+        chunk_size: int = 700,
+        chunk_overlap: int = 50
+) -> List[TimedChunk]:
+    """Group consecutive transcript lines into chunks in one linear pass.
+
+    Chunks never cut a line: each holds as many whole lines as fit in
+    chunk_size characters (a single longer line makes its own chunk), and
+    starts with the trailing lines of the previous chunk that fit in
+    chunk_overlap characters.
+    """
+    # offsets of each line in the cleaned text, lines joined by a space
+    starts = []
+    cursor = 0
+    for _, txt in lines:
+        starts.append(cursor)
+        cursor += len(txt) + 1
+
+    def end_of(j: int) -> int:
+        return starts[j] + len(lines[j][1])
+
+    chunks = []
+    i = 0
+    n = len(lines)
+    while i < n:
+        j = i + 1
+        while j < n and end_of(j) - starts[i] <= chunk_size:
+            j += 1
+        start, end = starts[i], end_of(j - 1)
+        chunks.append(TimedChunk(
+            text=" ".join(txt for _, txt in lines[i:j]),
+            start_index=start,
+            end_index=end,
+            start_ts=lines[i][0],
+            end_ts=lines[j - 1][0],
+        ))
+        if j == n:
+            break
+        next_i = j
+        while next_i - 1 > i and end - starts[next_i - 1] <= chunk_overlap:
+            next_i -= 1
+        i = next_i
+    return chunks
+
+
+def chunk_timed_transcript(
+        text: str,
+        chunk_size: int = 700,
+        chunk_overlap: int = 50
+) -> Tuple[List[TimedChunk], Optional[str]]:
+    """Chunk a raw timestamped transcript, see chunk_timed_lines.
+
+    Returns:
+        (chunks, url) with the URL found in the transcript header, if any
+    """
+    lines, url = parse_timed_lines(text)
+    return chunk_timed_lines(lines, chunk_size, chunk_overlap), url
@@ -2,6 +2,11 @@ import re
 
 TIMESTAMP_RE = re.compile(r"^\s*\d{2}:\d{2}:\d{2}(?:[.,]\d{3})?\s*")
 URL_RE = re.compile(r"^#?\s*https?://\S+")
+# every "timestamp text" line of a whole transcript, matched in one pass
+TIMED_LINE_RE = re.compile(
+    r"^[^\S\n]*(\d{2}:\d{2}:\d{2}(?:[.,]\d{3})?)[^\S\n]+(.*\S)[^\S\n]*$",
+    re.MULTILINE,
+)
 
 def clean_transcript_and_extract_url(text: str) -> tuple[str, str | None]:
     """Clean a raw transcript text:
@@ -0,0 +1,350 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Iterable
+from pathlib import Path
+
+import faiss
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+
+DOCSTORE_SUFFIX = ".sqlite"
+# holds the generation id of the last completed save, also stored in the
+# docstore: a reader that finds different ids caught a save half-way
+GENERATION_SUFFIX = ".generation"
+# attempts of load_vectorstore to read files of the same generation, and
+# seconds between them
+LOAD_ATTEMPTS = 10
+LOAD_RETRY_SEC = 0.1
+# SQLite's default limit on the number of parameters of a statement
+_MAX_PARAMS = 999
+
+_SCHEMA = """
+CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE docs (
+    id TEXT PRIMARY KEY,
+    page_content TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE positions (position INTEGER PRIMARY KEY, id TEXT NOT NULL);
+"""
+
+
+class SQLiteDocstore(Docstore):
+    """Read-only docstore reading chunks from a SQLite file on demand.
+
+    Only the chunks returned by a search are read and turned into
+    Documents, so a worker does not hold the text of the whole corpus.
+    The connection is opened once and shared by all threads: the
+    docstore keeps reading the file it was opened on even if a rebuild
+    replaces it on disk.
+    """
+
+    def __init__(self, path: str | Path):
+        """Open the SQLite file at path read-only."""
+        self.path = Path(path)
+        self._conn = sqlite3.connect(
+            self.path.resolve().as_uri() + "?mode=ro",
+            uri=True,
+            check_same_thread=False,
+        )
+        self._lock = threading.Lock()
+
+    def _query(self, sql: str, params: Iterable = ()) -> list[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, tuple(params)).fetchall()
+
+    def __len__(self) -> int:
+        """Number of chunks in the docstore."""
+        return self._query("SELECT COUNT(*) FROM docs")[0][0]
+
+    def info(self) -> dict:
+        """Return the vectorstore settings saved with the chunks."""
+        return {
+            key: json.loads(value)
+            for key, value in self._query("SELECT key, value FROM info")
+        }
+
+    def positions(self) -> list[str]:
+        """Return the docstore ids in the order of the index vectors."""
+        rows = self._query("SELECT id FROM positions ORDER BY position")
+        return [row[0] for row in rows]
+
+    def search(self, search: str) -> Document | str:
+        """Return the Document with id search.
+
+        Like InMemoryDocstore, a message is returned if it is not found.
+        """
+        doc = self.mget([search]).get(search)
+        return doc if doc is not None else f"ID {search} not found."
+
+    def mget(self, ids: Iterable[str]) -> dict[str, Document]:
+        """Read several chunks at once, with one query per 999 ids.
+
+        Returns:
+            dict[str, Document]: Found Documents by id
+        """
+        ids = list(dict.fromkeys(ids))
+        docs: dict[str, Document] = {}
+        for i in range(0, len(ids), _MAX_PARAMS):
+            batch = ids[i:i + _MAX_PARAMS]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._query(
+                "SELECT id, page_content, metadata FROM docs "
+                f"WHERE id IN ({placeholders})",
+                batch,
+            )
+            for doc_id, page_content, metadata in rows:
+                docs[doc_id] = Document(
+                    id=doc_id,
+                    page_content=page_content,
+                    metadata=json.loads(metadata),
+                )
+        return docs
+
+    def close(self):
+        """Close the connection to the SQLite file."""
+        with self._lock:
+            self._conn.close()
+
+
+def get_documents(
+        docstore: Docstore,
+        ids: Iterable[str]
+    ) -> dict[str, Document]:
+    """Look several ids up in any docstore.
+
+    A SQLiteDocstore is read in a single query.
+
+    Returns:
+        dict[str, Document]: Found Documents by id
+    """
+    if isinstance(docstore, SQLiteDocstore):
+        return docstore.mget(ids)
+    docs = {}
+    for doc_id in ids:
+        doc = docstore.search(doc_id)
+        if isinstance(doc, Document):
+            docs[doc_id] = doc
+    return docs
+
+
+def read_index(path: str | Path, mmap: bool = True):
+    """Read a faiss index, memory-mapping its vectors when possible.
+
+    A memory-mapped index is backed by the page cache, shared by all the
+    processes reading the same file, instead of being copied in each
+    process. Index types or faiss versions that cannot be mapped are read
+    into memory.
+    """
+    if mmap:
+        # IO_FLAG_MMAP maps IVF inverted lists, IO_FLAG_MMAP_IFC (faiss
+        # >= 1.9) maps the codes of flat, SQ and HNSW storage
+        flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        try:
+            return faiss.read_index(str(path), flags)
+        except RuntimeError as e:
+            logging.warning(
+                f"Cannot memory-map {path} ({e}), reading it in memory"
+            )
+    return faiss.read_index(str(path))
+
+
+def save_vectorstore(
+        vectorstore: FAISS,
+        vs_path: str | Path,
+        index_name: str = "index"
+    ) -> None:
+    """Save a vectorstore as {index_name}.faiss and {index_name}.sqlite.
+
+    The faiss index is written with faiss itself and the chunks go to a
+    SQLite file, so that loading needs no pickle. Both files are written
+    under temporary names then moved in place, the .sqlite first, and a
+    new generation id, stored in the .sqlite, is written to
+    {index_name}.generation last. Moving two files is not atomic: a
+    reader can find the new chunks with the old vectors, which
+    load_vectorstore detects by comparing the generation ids. A legacy
+    {index_name}.pkl is removed.
+    """
+    vs_path = Path(vs_path)
+    vs_path.mkdir(parents=True, exist_ok=True)
+    docstore_path = vs_path / f"{index_name}{DOCSTORE_SUFFIX}"
+    index_path = vs_path / f"{index_name}.faiss"
+    generation_path = vs_path / f"{index_name}{GENERATION_SUFFIX}"
+    tmp_docstore = docstore_path.with_name(docstore_path.name + ".tmp")
+    tmp_index = index_path.with_name(index_path.name + ".tmp")
+    tmp_generation = generation_path.with_name(generation_path.name + ".tmp")
+
+    ids = [
+        vectorstore.index_to_docstore_id[i]
+        for i in range(vectorstore.index.ntotal)
+    ]
+    docs = get_documents(vectorstore.docstore, ids)
+    info = {
+        "normalize_L2": vectorstore._normalize_L2,
+        "distance_strategy": vectorstore.distance_strategy.value,
+        "generation": uuid.uuid4().hex,
+    }
+    tmp_docstore.unlink(missing_ok=True)
+    conn = sqlite3.connect(tmp_docstore)
+    try:
+        conn.executescript(_SCHEMA)
+        conn.executemany(
+            "INSERT INTO info VALUES (?, ?)",
+            ((key, json.dumps(value)) for key, value in info.items()),
+        )
+        conn.executemany("INSERT INTO positions VALUES (?, ?)", enumerate(ids))
+        conn.executemany(
+            "INSERT INTO docs VALUES (?, ?, ?)",
+            (
+                (
+                    doc_id,
+                    docs[doc_id].page_content,
+                    json.dumps(docs[doc_id].metadata, ensure_ascii=False),
+                )
+                for doc_id in ids
+            ),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    faiss.write_index(vectorstore.index, str(tmp_index))
+    tmp_generation.write_text(info["generation"], encoding="utf-8")
+
+    os.replace(tmp_docstore, docstore_path)
+    os.replace(tmp_index, index_path)
+    os.replace(tmp_generation, generation_path)
+    (vs_path / f"{index_name}.pkl").unlink(missing_ok=True)
+
+
+def _read_generation(path: Path) -> str | None:
+    try:
+        return path.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        # saved before generation ids
+        return None
+
+
+def load_vectorstore(
+        vs_path: str | Path,
+        embeddings,
+        index_name: str = "index",
+        writable: bool = False
+    ) -> FAISS:
+    """Load a vectorstore saved with save_vectorstore.
+
+    By default the index is memory-mapped and chunks are read from SQLite
+    on demand: the vectorstore can be searched but not modified. The
+    files are read in the reverse order of save_vectorstore and their
+    generation ids compared, so that the vectors and the chunks always
+    come from the same save; the files are read again while a save is
+    being moved in place. Indexes saved by FAISS.save_local, with an
+    index.pkl, are not loaded: convert them once with
+    migrate_pickled_indexes.
+
+    Args:
+        vs_path (str | Path): Directory holding the index files
+        embeddings: Embedding model of the vectorstore
+        index_name (str): Base name of the index files
+        writable (bool): Read the index and all the chunks in memory, so
+            that documents can be added and deleted
+    Returns:
+        FAISS: Loaded vectorstore
+    """
+    vs_path = Path(vs_path)
+    docstore_path = vs_path / f"{index_name}{DOCSTORE_SUFFIX}"
+    if not docstore_path.exists():
+        if (vs_path / f"{index_name}.pkl").exists():
+            raise FileNotFoundError(
+                f"{vs_path} holds a pickled index ({index_name}.pkl), "
+                f"convert it once with: python src/compact_store.py {vs_path}"
+            )
+        raise FileNotFoundError(f"No {docstore_path.name} in {vs_path}")
+    generation_path = vs_path / f"{index_name}{GENERATION_SUFFIX}"
+    for attempt in range(LOAD_ATTEMPTS):
+        if attempt:
+            time.sleep(LOAD_RETRY_SEC)
+        generation = _read_generation(generation_path)
+        index = read_index(vs_path / f"{index_name}.faiss", mmap=not writable)
+        docstore = SQLiteDocstore(docstore_path)
+        info = docstore.info()
+        if info.get("generation") == generation:
+            break
+        docstore.close()
+        logging.info(f"{vs_path} is being saved, reading it again")
+    else:
+        raise ValueError(
+            f"{index_name}.faiss and {docstore_path.name} in {vs_path} "
+            f"still come from different saves after {LOAD_ATTEMPTS} attempts"
+        )
+    ids = docstore.positions()
+    if index.ntotal != len(ids):
+        docstore.close()
+        raise ValueError(
+            f"{index_name}.faiss has {index.ntotal} vectors but "
+            f"{docstore_path.name} has {len(ids)} chunks"
+        )
+    if writable:
+        docs = docstore.mget(ids)
+        docstore.close()
+        docstore = InMemoryDocstore(docs)
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=dict(enumerate(ids)),
+        normalize_L2=info["normalize_L2"],
+        distance_strategy=DistanceStrategy(info["distance_strategy"]),
+    )
+
+
+def migrate_pickled_indexes(vs_path: str | Path) -> list[str]:
+    """Convert the indexes saved by FAISS.save_local under vs_path.
+
+    Each {index_name}.pkl next to its {index_name}.faiss is unpickled,
+    which runs code from the file: only migrate indexes built by this
+    application. They are saved again with save_vectorstore, which
+    removes the .pkl.
+
+    Returns:
+        list[str]: Names of the converted indexes
+    """
+    migrated = []
+    for pkl_path in sorted(Path(vs_path).glob("*.pkl")):
+        index_name = pkl_path.stem
+        if not pkl_path.with_suffix(".faiss").exists():
+            continue
+        vectorstore = FAISS.load_local(
+            str(vs_path),
+            None,
+            index_name,
+            allow_dangerous_deserialization=True
+        )
+        save_vectorstore(vectorstore, vs_path, index_name)
+        logging.info(f"Converted {pkl_path} to {index_name}{DOCSTORE_SUFFIX}")
+        migrated.append(index_name)
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert indexes saved with pickle (index.pkl) to the "
+                    "index.faiss + index.sqlite format"
+    )
+    parser.add_argument("vs_path", help="Index directory, e.g. data/vs")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if not migrate_pickled_indexes(args.vs_path):
+        logging.info(f"No pickled index found in {args.vs_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,19 +4,62 @@ import os
 from pathlib import Path
 
 import dash_bootstrap_components as dbc
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 
 import dash
-from build_dataset import fetch_transcripts_from_playlist_id
+from catalog import Catalog
 from dash import Input, Output, State, ctx, dcc, html
-from evaluate import generate_url_from_query
-from retrieve import embed_transcripts
-from src.dash.components import (introduction_card, search_bar,
+from metrics import metrics, register_metrics_endpoint, timed
+from query_server import QueryBatcher, register_search_endpoint
+from registry import SHARDS_PATH, list_shards, warm_up
+from src.dash.components import (introduction_card, job_status,
+                                 moments_list, playlist_filter, search_bar,
                                  transcripts_table, upload_bar, video_holder)
-from utils import list_txt_rows
+from src.dash.jobs import JobManager
+
+REBUILD_JOB_PREFIX = "rebuild:"
+FETCH_JOB_PREFIX = "fetch:"
+TRANSCRIPTS_PATH = "data/dash"
+# run in worker processes, imported there, see JobManager.submit
+FETCH_TARGET = "build_dataset:fetch_transcripts_from_playlist_id"
+REBUILD_TARGET = "retrieve:rebuild_shards"
+# seconds between two polls of the transcripts folder
+CATALOG_SYNC_INTERVAL = 10
+# concurrent searches arriving within BATCH_WINDOW_MS are encoded and
+# searched together, at most MAX_BATCH_SIZE at a time
+BATCH_WINDOW_MS = 10
+MAX_BATCH_SIZE = 32
 
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+jobs = JobManager(max_workers=2)
+catalog = Catalog(TRANSCRIPTS_PATH)
+batcher = QueryBatcher(
+    window_ms=BATCH_WINDOW_MS, max_batch_size=MAX_BATCH_SIZE
+)
+# playlists with a saved shard, listed once then refreshed by poll_jobs
+# when rebuilds finish, so that searches do not list the shards folder
+_shards: frozenset[str] | None = None
+
+
+def _saved_shards() -> frozenset[str]:
+    global _shards
+    if _shards is None:
+        _shards = frozenset(list_shards())
+    return _shards
+
+
+def _cache_gauges() -> dict[str, float]:
+    from query_cache import cache_stats
+    return {
+        f"query_cache_{cache}_{stat}": value
+        for cache, stats in cache_stats().items()
+        for stat, value in stats.items()
+    }
+
+
+metrics.add_collector(_cache_gauges)
+metrics.add_collector(batcher.gauges)
+register_metrics_endpoint(app.server)
+register_search_endpoint(app.server, batcher)
 
 first_col = dbc.Col(
     [
@@ -30,8 +73,11 @@ second_col = dbc.Col(
     [
         introduction_card,
         upload_bar,
+        job_status,
         search_bar,
+        playlist_filter,
         video_holder,
+        moments_list,
     ],
     width=9
 )
@@ -41,76 +87,177 @@ app.layout = dbc.Container([
         first_col,
         second_col,
     ]),
-    dcc.Store(id="store-transcripts", data=[], storage_type="session"),
+    dcc.Store(id="store-jobs-seen", data=[]),
 ], fluid=True)
 
 
 @app.callback(
     Output("transcripts-table", "data"),
     Input("upload-btn", "n_clicks"),
-    Input("transcripts-table", "data"),
+    # set by the table on user edits only, not when callbacks write data
+    Input("transcripts-table", "data_timestamp"),
+    State("transcripts-table", "data"),
+    State("transcripts-table", "data_previous"),
     State("upload-input", "value"),
-    prevent_initial_call=True,
 )
-def refresh_table(_, updated_transcripts, playlist_id):
+@timed("dash_callback_seconds", callback="refresh_table")
+def refresh_table(
+        _, __, updated_transcripts, previous_transcripts, playlist_id
+    ):
+    # also called on page load (no trigger), to fill the table
     trigger = ctx.triggered_id
 
     if trigger == "upload-btn" and playlist_id:
-        output_folder=f"data/dash/{playlist_id}"
+        output_folder=f"{TRANSCRIPTS_PATH}/{playlist_id}"
         os.makedirs(output_folder, exist_ok=True)
         logging.info(f"Fetching transcripts for playlist ID: {playlist_id}")
-        fetch_transcripts_from_playlist_id(playlist_id, output_folder)
-    
+        jobs.submit(
+            FETCH_JOB_PREFIX + playlist_id,
+            FETCH_TARGET,
+            playlist_id,
+            output_folder,
+        )
+
     elif trigger == "transcripts-table":
-        old_transcripts = list_txt_rows()
-        prev_paths = {row["path"] for row in (old_transcripts or [])}
+        # rows the user deleted from the table they saw, never a diff with
+        # the folder, which fetch jobs may have filled since
+        prev_paths = {row["path"] for row in (previous_transcripts or [])}
         curr_paths = {row["path"] for row in (updated_transcripts or [])}
-        deleted_paths = prev_paths - curr_paths
+        # paths come from the client, only catalogued transcripts are removed
+        known_paths = {row["path"] for row in catalog.rows()}
+        deleted_paths = (prev_paths - curr_paths) & known_paths
         logging.info(f"Deleted paths: {deleted_paths}")
-        print(f"Deleted paths: {deleted_paths}")
         for path in deleted_paths:
             if Path(path).exists():
                 os.remove(path)
+        catalog.sync()
+    else:
+        catalog.sync(min_interval=CATALOG_SYNC_INTERVAL)
+
+    return catalog.rows()
+
+def _moment_item(moment: dict):
+    return html.Li([
+        html.A(
+            f"{moment['source']} @ {moment['timestamp']}",
+            href=moment["url"],
+            target="_blank",
+        ),
+        html.Div(moment["snippet"], className="text-muted small"),
+    ])
 
-    return list_txt_rows()
 
 @app.callback(
     Output("video-iframe", "src"),
-    Output("store-transcripts", "data"),
+    Output("moments-list", "children"),
     Input("search-btn", "n_clicks"),
     State("search-input", "value"),
-    State("store-transcripts", "data"),
+    State("search-mode", "value"),
+    State("playlist-filter", "value"),
     prevent_initial_call=True,
 )
-def update_video_holder(_, query, vs_transcripts_paths):
+@timed("dash_callback_seconds", callback="update_video_holder")
+def update_video_holder(_, query, mode, playlists):
     if not query:
-        return ""
-    folder_path="data/dash"
-    transcripts = list_txt_rows()
-    paths = {row["path"] for row in (transcripts or [])}
-
-    vs_path = f"data/vs"
-    if (paths - set(vs_transcripts_paths)) or (set(vs_transcripts_paths) - paths):
-        print("Transcripts have changed, re-embedding...")
-        vectorstore = embed_transcripts(folder_path)
-        vectorstore.save_local(vs_path)
-        vs_transcripts_paths = list(paths)
-    else:
-        huggingface_embeddings = HuggingFaceEmbeddings(
-            model_name="intfloat/multilingual-e5-large",
-            model_kwargs={'device':'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
+        return "", []
+
+    # only the shards of the playlists with added, edited or deleted
+    # transcripts, as last seen by the catalog
+    for playlist in catalog.pending_playlists():
+        key = REBUILD_JOB_PREFIX + playlist
+        if jobs.is_active(key):
+            continue
+        logging.info(
+            f"Transcripts of {playlist} have changed, "
+            "scheduling an index rebuild..."
         )
-        vectorstore = FAISS.load_local(
-            vs_path,
-            huggingface_embeddings,
-            allow_dangerous_deserialization=True
+        jobs.submit(
+            key, REBUILD_TARGET, TRANSCRIPTS_PATH, SHARDS_PATH, [playlist]
         )
-    
-    url = generate_url_from_query(query, vectorstore, True)
-    print(f"Generated URL: {url}")
 
-    return url, vs_transcripts_paths
+    if playlists:
+        # values come from the client, only saved shards are searched
+        shards = _saved_shards()
+        playlists = [
+            p for p in playlists if isinstance(p, str) and p in shards
+        ]
+        if not playlists:
+            return "", []
+
+    # the last good shards are used until the rebuild jobs replace them on disk
+    moments = batcher.search(
+        query, k=5, mode=mode or "hybrid", playlists=playlists
+    )
+    if not moments:
+        return "", []
+    url = moments[0]["embed_url"]
+    logging.info(f"Generated URL: {url}")
+
+    alternatives = []
+    if len(moments) > 1:
+        alternatives = [
+            html.H6("Other moments", className="mt-2"),
+            html.Ol([_moment_item(m) for m in moments[1:]]),
+        ]
+    return url, alternatives
+
+def _describe_job(job: dict) -> str:
+    if job["key"].startswith(REBUILD_JOB_PREFIX):
+        playlist = job["key"][len(REBUILD_JOB_PREFIX):]
+        label = f"Index rebuild of playlist {playlist}"
+    else:
+        label = f"Upload of playlist {job['key'][len(FETCH_JOB_PREFIX):]}"
+    if job["status"] == "failed":
+        return f"{label} failed: {job['error']}"
+    if job["status"] == "done" and job["result"]:
+        # fetch jobs return the videos that could not be fetched
+        if isinstance(job["result"], dict):
+            return f"{label} done, {len(job['result'])} video(s) failed"
+    return f"{label}: {job['status']}"
+
+
+@app.callback(
+    Output("job-status", "children"),
+    Output("transcripts-table", "data", allow_duplicate=True),
+    Output("playlist-filter", "options"),
+    Output("store-jobs-seen", "data"),
+    Input("jobs-interval", "n_intervals"),
+    State("store-jobs-seen", "data"),
+    # called on page load too, to fill the playlist filter
+    prevent_initial_call="initial_duplicate",
+)
+@timed("dash_callback_seconds", callback="poll_jobs")
+def poll_jobs(_, seen_jobs):
+    global _shards
+    latest = {}
+    for job in jobs.jobs():
+        latest.setdefault(job["key"], job)
+    status = [html.Div(_describe_job(job)) for job in latest.values()]
+
+    finished = [
+        job for job in jobs.jobs() if job["status"] in ("done", "failed")
+    ]
+    seen = set(seen_jobs or [])
+    new = [job for job in finished if job["id"] not in seen]
+    fetched = any(job["key"].startswith(FETCH_JOB_PREFIX) for job in new)
+    # picks up edits made outside the app too
+    changes = catalog.sync(
+        min_interval=0 if fetched else CATALOG_SYNC_INTERVAL
+    )
+    table = dash.no_update
+    # rebuilds change the index status of transcripts
+    if new or any(changes.values()):
+        table = catalog.rows()
+    options = dash.no_update
+    if ctx.triggered_id is None or any(
+        job["key"].startswith(REBUILD_JOB_PREFIX) for job in new
+    ):
+        options = list_shards()
+        _shards = frozenset(options)
+    return status, table, options, [job["id"] for job in finished]
+
 
 if __name__ == "__main__":
+    # shards are loaded on the first search of their playlist
+    warm_up(None)
     app.run(debug=False, use_reloader=False)
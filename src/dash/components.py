@@ -1,7 +1,6 @@
 import dash_bootstrap_components as dbc
 
 from dash import dash_table, dcc, html
-from utils import list_txt_rows
 
 video_holder = dcc.Loading(
         html.Div(
@@ -17,14 +16,23 @@ video_holder = dcc.Loading(
         fullscreen=True,  # make it cover the whole page
 )
 
+moments_list = html.Div(
+    id="moments-list",
+    style={"maxWidth": 600, "margin": "0 auto"},
+)
+
 
 transcripts_table = dash_table.DataTable(
     id="transcripts-table",
     columns=[
-            {"name": "File Name", "id": "name", "deletable": False, "selectable": False},
-            {"name": "path", "id": "path", "deletable": False, "selectable": False},
+            {"name": name, "id": column, "deletable": False,
+             "selectable": False}
+            for name, column in [
+                ("File Name", "name"), ("Index", "status"), ("path", "path")
+            ]
         ],
-    data=list_txt_rows(), # type: ignore
+    # filled by a callback on page load, importing the app scans no folder
+    data=[],
     hidden_columns=["path"],
     editable=False,
     row_deletable=True,
@@ -58,11 +66,29 @@ introduction_card = dbc.Card(
 search_bar = dbc.InputGroup(
     [
         dbc.Input(placeholder="What can I do for you ?", type="text", id="search-input"),
+        dbc.Select(
+            id="search-mode",
+            options=[
+                {"label": "Hybrid", "value": "hybrid"},
+                {"label": "Semantic", "value": "dense"},
+                {"label": "Keywords", "value": "lexical"},
+            ],
+            value="hybrid",
+            style={"maxWidth": 130},
+        ),
         dbc.Button("Search", color="primary", id="search-btn"),
     ],
     className="mb-3",
 )
 
+playlist_filter = dcc.Dropdown(
+    id="playlist-filter",
+    options=[],
+    multi=True,
+    placeholder="All playlists",
+    className="mb-3",
+)
+
 upload_bar = dbc.InputGroup(
     [
         dbc.Input(
@@ -71,4 +97,12 @@ upload_bar = dbc.InputGroup(
         dbc.Button("Upload", color="primary", id="upload-btn"),
     ],
     className="mb-3",
-)
\ No newline at end of file
+)
+
+job_status = html.Div(
+    [
+        html.Div(id="job-status", className="text-muted small"),
+        dcc.Interval(id="jobs-interval", interval=2000),
+    ],
+    className="mb-3",
+)
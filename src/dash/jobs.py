@@ -0,0 +1,156 @@
+import importlib
+import logging
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+
+# finished jobs kept per key in the job table, newest first
+MAX_FINISHED_JOBS_PER_KEY = 10
+
+
+def _run_target(target: str, *args):
+    """Import the 'module:function' target and call it with args."""
+    module_name, _, name = target.partition(":")
+    return getattr(importlib.import_module(module_name), name)(*args)
+
+
+class JobManager:
+    """Runs heavy work (ingestion, index rebuilds) off the request path.
+
+    Jobs are submitted to a process pool under a key. While a job with the
+    same key is pending or running, new submissions are coalesced into it:
+    a pending job absorbs them, a running job is re-run once after it
+    finishes, so the latest state always gets processed exactly once more.
+    Job states are kept in a job table for status polling; only the latest
+    MAX_FINISHED_JOBS_PER_KEY finished jobs of each key are kept.
+    """
+
+    def __init__(
+            self,
+            max_workers: int = 1,
+            executor_factory: Callable[[], Executor] | None = None
+        ):
+        """Create the queue; its executor is only created on first use."""
+        self._executor_factory = executor_factory or (
+            lambda: ProcessPoolExecutor(max_workers=max_workers)
+        )
+        self._executor: Executor | None = None
+        self._lock = threading.RLock()
+        self._jobs: dict[str, dict] = {}
+        self._futures: dict[str, Future] = {}
+        # key -> id of its pending or running job
+        self._active: dict[str, str] = {}
+        # key -> (fn, args) to run again once its active job is done
+        self._reruns: dict[str, tuple] = {}
+
+    def _get_executor(self) -> Executor:
+        # created on first use, so importing the app spawns no process
+        if self._executor is None:
+            self._executor = self._executor_factory()
+        return self._executor
+
+    def submit(self, key: str, fn: Callable | str, *args) -> str:
+        """Submit fn(*args) under key and return the id of the active job.
+
+        If no job is active under key, a new job is created and its id is
+        returned. If a pending job exists, the submission is coalesced into
+        it and its id is returned. If a job is running, its id is returned
+        and a re-run with the latest args is queued: that re-run gets its
+        own id once it starts, so poll is_active(key) or jobs(key) to follow
+        it.
+
+        fn can be a 'module:function' string, imported by the worker, so
+        that the submitting process does not have to import heavy modules.
+        """
+        with self._lock:
+            job_id = self._active.get(key)
+            if job_id is not None:
+                if self._futures[job_id].running():
+                    self._reruns[key] = (fn, args)
+                    logging.info(f"Job {key} running, queued one re-run")
+                else:
+                    logging.info(f"Job {key} already pending, coalesced")
+                return job_id
+            return self._submit_locked(key, fn, args)
+
+    def _submit_locked(self, key: str, fn: Callable, args: tuple) -> str:
+        job_id = uuid.uuid4().hex[:8]
+        self._jobs[job_id] = {
+            "id": job_id,
+            "key": key,
+            "submitted_at": time.time(),
+            "finished_at": None,
+            "error": None,
+            "result": None,
+        }
+        self._active[key] = job_id
+        if isinstance(fn, str):
+            fn, args = _run_target, (fn, *args)
+        future = self._get_executor().submit(fn, *args)
+        self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+        logging.info(f"Submitted job {key} ({job_id})")
+        return job_id
+
+    def _on_done(self, job_id: str, future: Future):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["finished_at"] = time.time()
+            try:
+                job["result"] = future.result()
+            except Exception as e:
+                logging.error(f"Job {job['key']} ({job_id}) failed: {e!r}")
+                job["error"] = repr(e)
+            key = job["key"]
+            del self._active[key]
+            self._prune_locked(key)
+            rerun = self._reruns.pop(key, None)
+            if rerun is not None:
+                self._submit_locked(key, *rerun)
+
+    def _prune_locked(self, key: str):
+        finished = sorted(
+            (
+                job for job in self._jobs.values()
+                if job["key"] == key and job["finished_at"] is not None
+            ),
+            key=lambda j: j["submitted_at"],
+            reverse=True,
+        )
+        for job in finished[MAX_FINISHED_JOBS_PER_KEY:]:
+            del self._jobs[job["id"]]
+            del self._futures[job["id"]]
+
+    def _status(self, job_id: str) -> str:
+        job = self._jobs[job_id]
+        if job["finished_at"] is None:
+            return "running" if self._futures[job_id].running() else "pending"
+        return "failed" if job["error"] else "done"
+
+    def get(self, job_id: str) -> dict | None:
+        """Return a copy of a job's entry, with its current status."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {**job, "status": self._status(job_id)}
+
+    def jobs(self, key_prefix: str = "") -> list[dict]:
+        """Return all jobs whose key starts with key_prefix, newest first."""
+        with self._lock:
+            return sorted(
+                (
+                    {**job, "status": self._status(job_id)}
+                    for job_id, job in self._jobs.items()
+                    if job["key"].startswith(key_prefix)
+                ),
+                key=lambda j: j["submitted_at"],
+                reverse=True,
+            )
+
+    def is_active(self, key: str) -> bool:
+        """Whether a job is pending or running under key."""
+        with self._lock:
+            return key in self._active
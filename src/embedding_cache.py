@@ -0,0 +1,312 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:  # Windows, caches are not shared between processes
+    fcntl = None
+
+INDEX_NAME = "index.json"
+VECTORS_NAME = "vectors.f32"
+# rows written since the index was last saved, one JSON line per put_many
+LOG_NAME = "index.log"
+LOCK_NAME = ".lock"
+
+
+def cache_key(namespace: str, text: str) -> str:
+    """Return the cache key of a text embedded under a given namespace.
+
+    The namespace identifies the embedding configuration (model name,
+    normalize flag, ...), so the same text embedded by two models gets two
+    different keys.
+    """
+    return hashlib.sha256(
+        f"{namespace}\0{text}".encode()
+    ).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk, content-addressed cache of embedding vectors.
+
+    Vectors live in a memory-mapped float32 matrix (``vectors.f32``) and
+    ``index.json`` maps each key to its row, in least- to most-recently
+    used order. Once ``max_entries`` rows are used, the least recently
+    used rows are evicted and their slots reused.
+
+    Several processes, e.g. parallel index rebuild jobs, can share a cache
+    directory: reads and writes hold a lock file, each put_many appends
+    the rows it wrote to ``index.log`` before releasing the lock, and the
+    other processes replay the new log lines. save() folds the log into
+    ``index.json``, e.g. once per index build.
+    """
+
+    def __init__(
+            self,
+            cache_dir: str | Path = "data/cache/embeddings",
+            max_entries: int = 200_000
+        ):
+        """Open the cache in cache_dir, holding up to max_entries vectors."""
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.dim: int | None = None
+        self._rows: OrderedDict[str, int] = OrderedDict()
+        # row -> key, to drop the key of a row reused by another process
+        self._row_keys: dict[int, str] = {}
+        self._free: set[int] = set()
+        self._capacity = 0
+        self._matrix: np.memmap | None = None
+        self._lock = threading.Lock()
+        self._stamp: tuple | None = None
+        # bytes of index.log already replayed
+        self._log_offset = 0
+        with self._file_lock(exclusive=False):
+            self._load()
+
+    def __len__(self) -> int:
+        """Return the number of cached vectors."""
+        return len(self._rows)
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """Hold the cache's lock file, shared or exclusive."""
+        if fcntl is None or not (exclusive or self.cache_dir.exists()):
+            yield
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_dir / LOCK_NAME, "a+b") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _index_stamp(self) -> tuple | None:
+        try:
+            stat = (self.cache_dir / INDEX_NAME).stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self):
+        """Catch up with the writes of other processes.
+
+        The index is reloaded if another process saved it since our last
+        load or save, otherwise only new log lines are replayed. Must hold
+        the file lock.
+        """
+        if self._index_stamp() != self._stamp:
+            self._load()
+        else:
+            self._replay_log()
+
+    def _load(self):
+        index_path = self.cache_dir / INDEX_NAME
+        vectors_path = self.cache_dir / VECTORS_NAME
+        self._stamp = self._index_stamp()
+        self._log_offset = 0
+        if index_path.exists() and vectors_path.exists():
+            try:
+                index = json.loads(index_path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError):
+                logging.warning(f"Unreadable embedding cache at {index_path}")
+                return
+            self.dim = index["dim"]
+            self._capacity = 0
+            self._map(index["capacity"])
+            self._rows = OrderedDict(index["rows"])
+            self._row_keys = {row: key for key, row in self._rows.items()}
+            self._free.difference_update(self._row_keys)
+        self._replay_log()
+
+    def _replay_log(self):
+        """Apply the log lines appended since the last replay."""
+        try:
+            with open(self.cache_dir / LOG_NAME, "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # a partial last line, left by a crashed writer, is skipped
+        complete = data[:data.rfind(b"\n") + 1]
+        self._log_offset += len(complete)
+        for line in complete.splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if self.dim is None:
+                self.dim = entry["dim"]
+            self._map(entry["capacity"])
+            for key, row in entry["rows"]:
+                self._assign(key, row)
+
+    def _map(self, capacity: int):
+        """Memory-map the first capacity rows of the vectors file."""
+        if capacity <= self._capacity:
+            return
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        self._matrix = np.memmap(
+            self.cache_dir / VECTORS_NAME, dtype=np.float32, mode="r+",
+            shape=(capacity, self.dim)
+        )
+        self._free.update(range(self._capacity, capacity))
+        self._capacity = capacity
+
+    def _grow(self, needed: int):
+        """Extend the memory-mapped matrix to hold at least needed rows."""
+        capacity = min(
+            self.max_entries, max(needed, 2 * self._capacity, 1024)
+        )
+        if capacity <= self._capacity:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_dir / VECTORS_NAME, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self._map(capacity)
+
+    def _allocate(self) -> int:
+        if not self._free:
+            self._grow(self._capacity + 1)
+        if not self._free:
+            _, row = self._rows.popitem(last=False)
+            return row
+        return self._free.pop()
+
+    def _assign(self, key: str, row: int):
+        """Map key to row, as most recently used, unmapping previous ones."""
+        old_row = self._rows.get(key)
+        if old_row is not None and old_row != row:
+            self._row_keys.pop(old_row, None)
+            self._free.add(old_row)
+        old_key = self._row_keys.get(row)
+        if old_key is not None and old_key != key:
+            self._rows.pop(old_key, None)
+        self._free.discard(row)
+        self._rows[key] = row
+        self._rows.move_to_end(key)
+        self._row_keys[row] = key
+
+    def get_many(self, keys: list[str]) -> list[list[float] | None]:
+        """Return the cached vector of each key, or None on a miss."""
+        results: list[list[float] | None] = []
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+            for key in keys:
+                row = self._rows.get(key)
+                if row is None:
+                    results.append(None)
+                    continue
+                self._rows.move_to_end(key)
+                results.append(self._matrix[row].tolist())
+        return results
+
+    def put_many(self, keys: list[str], vectors: list[list[float]]):
+        """Store vectors under their keys, evicting old entries if full.
+
+        The new rows are appended to the log, the index is only rewritten
+        by save().
+        """
+        if not keys:
+            return
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh()
+            if self.dim is None:
+                self.dim = len(vectors[0])
+            written = []
+            for key, vector in zip(keys, vectors):
+                if len(vector) != self.dim:
+                    raise ValueError(
+                        f"Expected a {self.dim}-dim vector, got {len(vector)}"
+                    )
+                row = self._rows.get(key)
+                if row is None:
+                    row = self._allocate()
+                self._assign(key, row)
+                self._matrix[row] = vector
+                written.append((key, row))
+            # vectors reach the file before the log lines pointing to them
+            self._matrix.flush()
+            entry = {
+                "dim": self.dim, "capacity": self._capacity, "rows": written
+            }
+            with open(self.cache_dir / LOG_NAME, "ab") as f:
+                f.write(json.dumps(entry).encode() + b"\n")
+                self._log_offset = f.tell()
+
+    def save(self):
+        """Flush the vectors and persist the key -> row index.
+
+        The log is folded into index.json and removed.
+        """
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh()
+            self._save()
+
+    def _save(self):
+        # must hold both locks
+        if self._matrix is None:
+            return
+        self._matrix.flush()
+        index = {
+            "dim": self.dim,
+            "capacity": self._capacity,
+            "rows": list(self._rows.items()),
+        }
+        tmp_path = self.cache_dir / (INDEX_NAME + ".tmp")
+        tmp_path.write_text(json.dumps(index), encoding="utf-8")
+        tmp_path.replace(self.cache_dir / INDEX_NAME)
+        # the index holds every logged row, replaying the log again after
+        # a crash right here only reorders recently used keys
+        (self.cache_dir / LOG_NAME).unlink(missing_ok=True)
+        self._stamp = self._index_stamp()
+        self._log_offset = 0
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only embeds documents missing from a cache.
+
+    Queries are passed through to the wrapped embeddings uncached.
+    """
+
+    def __init__(
+            self,
+            embeddings: Embeddings,
+            cache: EmbeddingCache,
+            namespace: str
+        ):
+        """Wrap embeddings, caching vectors in cache under namespace."""
+        self.embeddings = embeddings
+        self.cache = cache
+        self.namespace = namespace
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Return cached vectors, embedding and caching the missing ones."""
+        keys = [cache_key(self.namespace, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        logging.info(
+            f"Embedding cache: {len(texts) - len(missing)} hit(s), "
+            f"{len(missing)} miss(es)"
+        )
+        if missing:
+            computed = self.embeddings.embed_documents(
+                [texts[i] for i in missing]
+            )
+            self.cache.put_many([keys[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a query with the wrapped embeddings, uncached."""
+        return self.embeddings.embed_query(text)
@@ -0,0 +1,259 @@
+import logging
+from collections.abc import Callable
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# e5 models are trained on "query: ..." / "passage: ..." inputs
+QUERY_PREFIX = "query: "
+PASSAGE_PREFIX = "passage: "
+E5_MODELS = {
+    "large": "intfloat/multilingual-e5-large",
+    "base": "intfloat/multilingual-e5-base",
+    "small": "intfloat/multilingual-e5-small",
+}
+# torch: fp32 PyTorch, torch-int8: PyTorch with dynamically quantized
+# linear layers, onnx: ONNX Runtime export, onnx-int8: ONNX Runtime with
+# dynamically quantized weights
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+ONNX_DIR = "data/cache/onnx"
+ONNX_QUANTIZATION = "avx2"
+
+
+def resolve_model_name(model_name: str) -> str:
+    """Expand an e5 variant name ('large', 'base', 'small') to its model id.
+
+    Other names are returned unchanged.
+    """
+    return E5_MODELS.get(model_name, model_name)
+
+
+def _onnx_file(model_dir: Path, pattern: str) -> str | None:
+    found = sorted(model_dir.rglob(pattern))
+    return str(found[0].relative_to(model_dir)) if found else None
+
+
+def load_encoder(
+        model_name: str,
+        backend: str = "torch",
+        onnx_dir: str = ONNX_DIR
+    ):
+    """Load a sentence-transformers encoder on CPU with the given backend.
+
+    ONNX backends export the model to onnx_dir on first use, quantizing
+    it for 'onnx-int8', and reuse the exported files afterwards. They need
+    the ONNX extra of sentence-transformers:
+    ``pip install "sentence-transformers[onnx]"``.
+
+    Args:
+        model_name (str): Hugging Face model id
+        backend (str): One of BACKENDS
+        onnx_dir (str): Directory of the exported ONNX models
+    Returns:
+        SentenceTransformer: Encoder
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unknown encoder backend {backend!r}, expected one of {BACKENDS}"
+        )
+    if backend == "torch":
+        return SentenceTransformer(model_name, device="cpu")
+    if backend == "torch-int8":
+        import torch
+
+        model = SentenceTransformer(model_name, device="cpu")
+        return torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+    model_dir = Path(onnx_dir) / model_name.replace("/", "--")
+    if _onnx_file(model_dir, "model.onnx") is None:
+        logging.info(f"Exporting {model_name} to ONNX in {model_dir}...")
+        SentenceTransformer(
+            model_name, device="cpu", backend="onnx"
+        ).save_pretrained(str(model_dir))
+    pattern = "model.onnx"
+    if backend == "onnx-int8":
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        pattern = f"model_qint8_{ONNX_QUANTIZATION}.onnx"
+        if _onnx_file(model_dir, pattern) is None:
+            logging.info(f"Quantizing the ONNX export of {model_name}...")
+            export_dynamic_quantized_onnx_model(
+                SentenceTransformer(
+                    str(model_dir), device="cpu", backend="onnx"
+                ),
+                ONNX_QUANTIZATION,
+                str(model_dir),
+            )
+    return SentenceTransformer(
+        str(model_dir),
+        device="cpu",
+        backend="onnx",
+        model_kwargs={"file_name": _onnx_file(model_dir, pattern)},
+    )
+
+
+class E5Embeddings(Embeddings):
+    """LangChain embeddings of an e5 model on a pluggable CPU backend.
+
+    The query and passage prefixes the model was trained with are applied.
+    Documents are embedded as "passage: <text>" and queries as
+    "query: <text>". Embeddings are L2-normalized.
+    """
+
+    def __init__(
+            self,
+            model_name: str = "large",
+            backend: str = "torch",
+            batch_size: int = 32,
+            client=None
+        ):
+        """Load the encoder.
+
+        Args:
+            model_name (str): e5 model id, or 'large', 'base' or 'small'
+            backend (str): One of BACKENDS
+            batch_size (int): Encoder batch size
+            client: Already loaded SentenceTransformer, loaded from
+                model_name and backend if None
+        """
+        self.model_name = resolve_model_name(model_name)
+        self.backend = backend
+        self.batch_size = batch_size
+        self.client = client or load_encoder(self.model_name, backend)
+
+    @property
+    def identifier(self) -> str:
+        """Identifies the embedding space.
+
+        Vectors of two encoders can only be compared if their identifiers
+        are equal.
+        """
+        return (
+            f"{self.model_name}|backend={self.backend}"
+            "|e5-prefixes|normalize=True"
+        )
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        return self.client.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+        )
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed passages in one encoder call."""
+        return self._encode([PASSAGE_PREFIX + t for t in texts]).tolist()
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embed several queries in one encoder call."""
+        return self._encode([QUERY_PREFIX + t for t in texts]).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a single query."""
+        return self.embed_queries([text])[0]
+
+
+def encoder_id(embeddings) -> str:
+    """Identifier of the embedding space of any embeddings object."""
+    return (
+        getattr(embeddings, "identifier", None)
+        or getattr(embeddings, "model_name", None)
+        or repr(embeddings)
+    )
+
+
+def embed_queries(embeddings, texts: list[str]) -> list[list[float]]:
+    """Embed queries with embed_queries when the embeddings support it.
+
+    Other embeddings get one embed_query call per query.
+    """
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    return [embeddings.embed_query(text) for text in texts]
+
+
+class LazyEmbeddings(Embeddings):
+    """Embeddings whose model is only loaded when something is embedded.
+
+    An index can then be loaded, and searched lexically, without loading
+    the encoder.
+    """
+
+    def __init__(self, load: Callable[[], Embeddings]):
+        """Wrap load, called on every use and expected to cache its model."""
+        self._load = load
+
+    @property
+    def identifier(self) -> str:
+        """Identifier of the embedding space of the loaded model."""
+        return encoder_id(self._load())
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed passages with the loaded model."""
+        return self._load().embed_documents(texts)
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embed several queries with the loaded model."""
+        return embed_queries(self._load(), texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a single query with the loaded model."""
+        return self._load().embed_query(text)
+
+
+def parity_check(
+        candidate: E5Embeddings,
+        queries: list[str],
+        passages: list[str],
+        reference: E5Embeddings | None = None
+    ) -> dict:
+    """Compare the embeddings of a candidate encoder to the fp32 ones.
+
+    Args:
+        candidate (E5Embeddings): Encoder to check, e.g. quantized
+        queries (list[str]): Sample queries
+        passages (list[str]): Sample passages, e.g. transcript chunks
+        reference (E5Embeddings | None): Reference encoder, the fp32
+            torch encoder of the same model if None
+    Returns:
+        dict: Min and mean cosine similarity between candidate and
+            reference embeddings of queries and of passages, and the
+            fraction of queries whose nearest passage is the same with
+            both encoders ('top1_agreement')
+    """
+    if reference is None:
+        reference = E5Embeddings(
+            candidate.model_name, "torch", candidate.batch_size
+        )
+    report = {}
+    vectors = {}
+    for kind, embed, texts in [
+        ("queries", E5Embeddings.embed_queries, queries),
+        ("passages", E5Embeddings.embed_documents, passages),
+    ]:
+        ref = np.asarray(embed(reference, texts), dtype=np.float32)
+        cand = np.asarray(embed(candidate, texts), dtype=np.float32)
+        cosine = np.sum(ref * cand, axis=1)
+        report[kind] = {
+            "min_cosine": float(cosine.min()),
+            "mean_cosine": float(cosine.mean()),
+        }
+        vectors[kind] = (ref, cand)
+    (ref_q, cand_q), (ref_p, cand_p) = vectors["queries"], vectors["passages"]
+    ref_top1 = np.argmax(ref_q @ ref_p.T, axis=1)
+    cand_top1 = np.argmax(cand_q @ cand_p.T, axis=1)
+    report["top1_agreement"] = float(np.mean(ref_top1 == cand_top1))
+    logging.info(
+        f"Parity of {candidate.identifier}: "
+        f"min cosine {report['passages']['min_cosine']:.4f} (passages), "
+        f"{report['queries']['min_cosine']:.4f} (queries), "
+        f"top-1 agreement {report['top1_agreement']:.2%}"
+    )
+    return report
+
@@ -1,37 +1,58 @@
+import argparse
+import csv
+import json
+import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
+import numpy as np
 from langchain_community.vectorstores.faiss import FAISS
 
-from retrieve_timestamp import get_timestamp_for_chunk
+from lexical import BM25Index
+from metrics import timed, timer
+from registry import SHARDS_PATH, get_bm25, get_vectorstore
+from retrieve import build_bm25
+from retrieve_timestamp import get_timestamp_for_chunk_in_file
+from search import (SEARCH_MODES, search_moments, search_moments_batch,
+                    search_shards_batch)
+from timestamps import timestamps_to_millis
 from urls import make_timed_url
 from utils import timestamp_to_seconds
 
+RECALL_AT = (1, 3, 5, 10)
+PERCENTILES = (50, 90, 99)
 
+
+@timed("evaluation_query_seconds")
 def evaluate_query(
         query:str,
         gt_source:str,
         gt_ts:str,
-        vectorstore: FAISS,
+        vectorstore: FAISS | None,
         folder_path:str) -> dict:
     """
     Evaluate a single query:
     - query: the question string
     - gt_source: expected source filename (e.g. "s2-ep1.txt")
     - gt_ts: ground-truth timestamp string (e.g. "00:31:50.690")
-    - vectorstore: your FAISS/Chroma index
+    - vectorstore: your FAISS/Chroma index, None to use the shared one
     - folder_path: folder where the raw timestamped transcripts are stored
     """
+    if vectorstore is None:
+        vectorstore = get_vectorstore()
     relevant_documents = vectorstore.similarity_search(query, k=1)
     retrieved = relevant_documents[0].page_content
     source = relevant_documents[0].metadata["source"]
     url = relevant_documents[0].metadata["url"]
 
-    with open(os.path.join(folder_path, source), "r", encoding="utf-8") as f:
-        timed_doc = f.read()
-
-    pred_ts = get_timestamp_for_chunk(retrieved, timed_doc)
+    pred_ts = get_timestamp_for_chunk_in_file(
+        retrieved, os.path.join(folder_path, source)
+    )
 
     ts_error = None
+    pred_url = None
     if pred_ts is not None:
         ts_error = abs(timestamp_to_seconds(pred_ts) - timestamp_to_seconds(gt_ts))
         pred_url = make_timed_url(url, pred_ts)
@@ -49,23 +70,237 @@ def evaluate_query(
 
 def generate_url_from_query(
         query:str,
-        vectorstore: FAISS,
-        embed: bool = False
+        vectorstore: FAISS | None = None,
+        embed: bool = False,
+        mode: str = "dense"
         ) -> str:
-    """ Generate a timed URL from a query using the vectorstore and transcripts folder.
-     - query: the question string
-     - vectorstore: The FAISS/Chroma index
-     """
-    relevant_documents = vectorstore.similarity_search(query, k=1)
-    retrieved = relevant_documents[0].page_content
-    path = relevant_documents[0].metadata["path"]
+    """Generate a timed URL from a query using the vectorstore.
 
-    with open(path, "r", encoding="utf-8") as f:
-        timed_doc = f.read()
+    - query: the question string
+    - vectorstore: The FAISS/Chroma index, None to use the shared one
+    - mode: 'dense', 'lexical' (BM25 only, no encoder) or 'hybrid'
+    """
+    moments = search_moments(query, vectorstore, k=1, mode=mode)
+    if not moments:
+        return ""
+    return moments[0]["embed_url" if embed else "url"]
 
-    ts = get_timestamp_for_chunk(retrieved, timed_doc)
 
-    url = relevant_documents[0].metadata["url"]
-    if ts is None or url is None:
-        return ""
-    return make_timed_url(url, ts, embed)
+def load_labeled_queries(path: str | Path) -> list[dict]:
+    """Load labeled queries from a JSONL or CSV file.
+
+    Each record has a 'query' (or 'question'), the expected 'gt_source'
+    transcript filename and the 'gt_ts' timestamp of the answer.
+
+    Returns:
+        list[dict]: Records with 'query', 'gt_source' and 'gt_ts' keys
+    """
+    path = Path(path)
+    with path.open(encoding="utf-8", newline="") as f:
+        if path.suffix == ".csv":
+            records = list(csv.DictReader(f))
+        else:
+            records = [json.loads(line) for line in f if line.strip()]
+    labeled = []
+    for i, record in enumerate(records):
+        query = record.get("query") or record.get("question")
+        if not query or not record.get("gt_source") or not record.get("gt_ts"):
+            raise ValueError(
+                f"Record {i} of {path} lacks query, gt_source or gt_ts"
+            )
+        labeled.append({
+            "query": query,
+            "gt_source": record["gt_source"],
+            "gt_ts": record["gt_ts"],
+        })
+    return labeled
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {f"p{p}": None for p in PERCENTILES}
+    return {
+        f"p{p}": float(v)
+        for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))
+    }
+
+
+def _score_query(
+        labeled: dict,
+        moments: list[dict],
+        tolerance_sec: float
+    ) -> dict:
+    """Rank of the first correct moment and error of the best right one.
+
+    A correct moment has the right source and a timestamp within
+    tolerance_sec of the ground truth. The timestamp error is the one of
+    the best moment from the right source.
+    """
+    gt_ms = timestamps_to_millis([labeled["gt_ts"]])[0]
+    same_source = [
+        rank for rank, moment in enumerate(moments, start=1)
+        if moment["source"] == labeled["gt_source"]
+    ]
+    predicted = [moments[r - 1]["timestamp"] for r in same_source]
+    errors = np.abs(timestamps_to_millis(predicted) - gt_ms) / 1000
+    hits = [
+        r for r, error in zip(same_source, errors) if error <= tolerance_sec
+    ]
+    top = moments[0] if moments else {}
+    return {
+        "question": labeled["query"],
+        "gt_source": labeled["gt_source"],
+        "gt_ts": labeled["gt_ts"],
+        "pred_source": top.get("source"),
+        "pred_ts": top.get("timestamp"),
+        "pred_url": top.get("url"),
+        "source_correct": top.get("source") == labeled["gt_source"],
+        "source_rank": same_source[0] if same_source else None,
+        "rank": hits[0] if hits else None,
+        "ts_error_sec": float(errors[0]) if same_source else None,
+    }
+
+
+def evaluate_batch(
+        labeled: list[dict],
+        vectorstore: FAISS | None = None,
+        k: int = 10,
+        mode: str = "dense",
+        batch_size: int = 32,
+        workers: int = 4,
+        tolerance_sec: float = 30,
+        bm25: BM25Index | None = None,
+        shards_path: str = SHARDS_PATH
+    ) -> dict:
+    """Evaluate retrieval over a set of labeled queries.
+
+    Queries are searched in batches, so each batch is encoded in one call,
+    and batches run in parallel threads. By default the playlist shards
+    searched by the app are evaluated, with search_shards_batch.
+    Timestamps of retrieved chunks come from the index metadata, or from
+    the cached alignment of their transcript file for older indexes.
+
+    Args:
+        labeled (list[dict]): Records with 'query', 'gt_source' and
+            'gt_ts' keys, see load_labeled_queries
+        vectorstore (FAISS | None): The FAISS index, None to evaluate all
+            the shards under shards_path
+        k (int): Number of moments retrieved per query
+        mode (str): 'dense', 'lexical' or 'hybrid'
+        batch_size (int): Number of queries per batch
+        workers (int): Number of batches searched in parallel
+        tolerance_sec (float): Maximum timestamp error of a correct moment
+        bm25 (BM25Index | None): BM25 index of the vectorstore's chunks,
+            for 'lexical' and 'hybrid' modes. Built from the vectorstore
+            if None, shards use their own
+        shards_path (str): Directory holding one index per playlist
+    Returns:
+        dict: 'metrics' with recall@n and source_recall@n for n in
+            RECALL_AT up to k, 'mrr', timestamp error and per-query latency
+            percentiles, and the per-query results in 'queries'
+    """
+    if vectorstore is not None and bm25 is None and mode != "dense":
+        bm25 = build_bm25(vectorstore)
+    batches = [
+        labeled[i:i + batch_size] for i in range(0, len(labeled), batch_size)
+    ]
+
+    def run(batch: list[dict]) -> list[dict]:
+        start = time.perf_counter()
+        with timer("evaluation_batch_seconds"):
+            texts = [q["query"] for q in batch]
+            if vectorstore is None:
+                results = search_shards_batch(
+                    texts, None, k, mode=mode, shards_path=shards_path
+                )
+            else:
+                results = search_moments_batch(
+                    texts, vectorstore, k, mode=mode, bm25=bm25
+                )
+        # amortized over the batch, the queries being encoded together
+        latency_ms = 1000 * (time.perf_counter() - start) / len(batch)
+        return [
+            {
+                **_score_query(q, moments, tolerance_sec),
+                "latency_ms": latency_ms,
+            }
+            for q, moments in zip(batch, results)
+        ]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        queries = [
+            r for results in executor.map(run, batches) for r in results
+        ]
+    elapsed = time.perf_counter() - start
+
+    n = max(len(queries), 1)
+    ranks = [q["rank"] for q in queries]
+    source_ranks = [q["source_rank"] for q in queries]
+    metrics = {"queries": len(queries), "k": k, "mode": mode}
+    for at in (a for a in RECALL_AT if a <= k):
+        metrics[f"recall@{at}"] = (
+            sum(r is not None and r <= at for r in ranks) / n
+        )
+        metrics[f"source_recall@{at}"] = (
+            sum(r is not None and r <= at for r in source_ranks) / n
+        )
+    metrics["mrr"] = sum(1 / r for r in ranks if r is not None) / n
+    metrics["ts_error_sec"] = _percentiles(
+        [q["ts_error_sec"] for q in queries if q["ts_error_sec"] is not None]
+    )
+    metrics["latency_ms"] = _percentiles([q["latency_ms"] for q in queries])
+    metrics["queries_per_sec"] = len(queries) / max(elapsed, 1e-9)
+    logging.info(
+        f"Evaluated {len(queries)} queries: "
+        f"recall@1 {metrics.get('recall@1', 0):.3f}, MRR {metrics['mrr']:.3f}"
+    )
+    return {"metrics": metrics, "queries": queries}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Evaluate retrieval over a labeled query set"
+    )
+    parser.add_argument("labeled", help="JSONL or CSV file of labeled queries")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--mode", choices=SEARCH_MODES, default="dense")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--tolerance-sec", type=float, default=30)
+    parser.add_argument("--output", type=str, default=None,
+                        help="Write the JSON report to this file")
+    parser.add_argument("--shards-path", default=SHARDS_PATH,
+                        help="Playlist shards to evaluate, as the app does")
+    parser.add_argument("--vs-path", default=None,
+                        help="Evaluate this index instead of the shards, "
+                             "e.g. data/vs built with update_index")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    vectorstore = bm25 = None
+    if args.vs_path is not None:
+        vectorstore = get_vectorstore(args.vs_path)
+        if vectorstore is None:
+            parser.error(f"No index saved at {args.vs_path}")
+        bm25 = get_bm25(args.vs_path)
+    report = evaluate_batch(
+        load_labeled_queries(args.labeled),
+        vectorstore,
+        k=args.k,
+        mode=args.mode,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        tolerance_sec=args.tolerance_sec,
+        bm25=bm25,
+        shards_path=args.shards_path,
+    )
+    report["metrics"]["labeled"] = args.labeled
+    if args.output:
+        Path(args.output).write_text(
+            json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8"
+        )
+    print(json.dumps(report["metrics"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
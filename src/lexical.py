@@ -0,0 +1,135 @@
+import heapq
+import json
+import math
+import re
+from collections import Counter
+from pathlib import Path
+
+from retrieve_timestamp import _normalize
+
+BM25_NAME = "bm25.json"
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase, accent-free word tokens."""
+    return TOKEN_RE.findall(_normalize(text))
+
+
+class BM25Index:
+    """BM25 inverted index over chunks, keyed by their docstore ids.
+
+    Chunks can be added and removed one by one, so the index follows the
+    incremental updates of the FAISS index.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """Create an empty index with the BM25 parameters k1 and b."""
+        self.k1 = k1
+        self.b = b
+        # term -> {doc_id: term frequency}
+        self._postings: dict[str, dict[str, int]] = {}
+        self._doc_len: dict[str, int] = {}
+        self._total_len = 0
+
+    def __len__(self) -> int:
+        """Number of indexed chunks."""
+        return len(self._doc_len)
+
+    def __contains__(self, doc_id: str) -> bool:
+        """Whether the chunk doc_id is indexed."""
+        return doc_id in self._doc_len
+
+    def add(self, doc_id: str, text: str):
+        """Index a chunk's text under its id, replacing any previous one."""
+        if doc_id in self._doc_len:
+            self.remove(doc_id)
+        tokens = tokenize(text)
+        for term, tf in Counter(tokens).items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        self._doc_len[doc_id] = len(tokens)
+        self._total_len += len(tokens)
+
+    def remove(self, doc_id: str):
+        """Remove a chunk from the index, if present."""
+        self.remove_many([doc_id])
+
+    def remove_many(self, doc_ids: list[str]):
+        """Remove several chunks with a single pass over the postings."""
+        doc_ids = {i for i in doc_ids if i in self._doc_len}
+        if not doc_ids:
+            return
+        for doc_id in doc_ids:
+            self._total_len -= self._doc_len.pop(doc_id)
+        for term in list(self._postings):
+            postings = self._postings[term]
+            for doc_id in doc_ids & postings.keys():
+                del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+
+    def search(self, query: str, k: int = 10) -> list[tuple[str, float]]:
+        """Return the k best (doc_id, BM25 score) pairs, best first."""
+        n_docs = len(self._doc_len)
+        if not n_docs:
+            return []
+        avg_len = self._total_len / n_docs
+        scores: dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (
+                    1 - self.b + self.b * self._doc_len[doc_id] / avg_len
+                )
+                scores[doc_id] = scores.get(doc_id, 0.0) + (
+                    idf * tf * (self.k1 + 1) / (tf + norm)
+                )
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self, path: str | Path):
+        """Persist the index as JSON."""
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "doc_len": self._doc_len,
+            "postings": self._postings,
+        }
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(
+            json.dumps(data, ensure_ascii=False), encoding="utf-8"
+        )
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "BM25Index":
+        """Load an index saved with save()."""
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        index = cls(data["k1"], data["b"])
+        index._doc_len = data["doc_len"]
+        index._postings = data["postings"]
+        index._total_len = sum(index._doc_len.values())
+        return index
+
+
+def reciprocal_rank_fusion(
+        rankings: list[list[str]],
+        k: int = 60
+    ) -> list[tuple[str, float]]:
+    """Fuse several rankings of ids with reciprocal rank fusion.
+
+    Each id scores sum(1 / (k + rank)) over the rankings it appears in.
+
+    Returns:
+        list[tuple[str, float]]: (id, fused score) pairs, best first
+    """
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,205 @@
+import functools
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable
+from contextlib import contextmanager
+
+# histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0,
+)
+METRICS_PATH = "/metrics"
+
+logger = logging.getLogger("metrics")
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """In-process counters, histograms and timers.
+
+    Metrics are identified by a name and label values. Timers observe
+    their duration in a histogram and, at DEBUG level, log it as a JSON
+    record on the 'metrics' logger. Metrics are per process: work done in
+    background job processes is not counted by the app process.
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        """Create an empty registry with the given histogram buckets."""
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, tuple], float] = {}
+        self._histograms: dict[tuple[str, tuple], _Histogram] = {}
+        self._collectors: list[Callable[[], dict[str, float]]] = []
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        """Add value to a counter."""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Record a value, e.g. a duration in seconds, in a histogram."""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Time the enclosed block into the histogram name, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(name, elapsed, **labels)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(json.dumps(
+                    {"metric": name, "seconds": round(elapsed, 6), **labels},
+                    default=str,
+                ))
+
+    def timed(self, name: str, **labels) -> Callable:
+        """Decorator timing each call of a function, see timer."""
+        def decorator(fn: Callable) -> Callable:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add_collector(self, collector: Callable[[], dict[str, float]]) -> None:
+        """Register a function returning gauge values by name.
+
+        It is read at each export, e.g. for the sizes and hit counters of
+        caches.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def reset(self) -> None:
+        """Drop all counters and histograms, collectors are kept."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> dict:
+        """Return all metrics as a JSON-serializable dict."""
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in self._counters.items()
+            ]
+            histograms = [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": h.count,
+                    "sum": h.sum,
+                    "buckets": dict(zip(
+                        [*map(str, h.buckets), "+Inf"], h.counts
+                    )),
+                }
+                for (name, labels), h in self._histograms.items()
+            ]
+            collectors = list(self._collectors)
+        gauges = {}
+        for collector in collectors:
+            gauges.update(collector())
+        return {
+            "counters": counters, "histograms": histograms, "gauges": gauges
+        }
+
+    def log_snapshot(self, level: int = logging.INFO) -> None:
+        """Log all metrics as one JSON record on the 'metrics' logger."""
+        logger.log(level, json.dumps(self.snapshot(), default=str))
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, list(h.counts), h.sum, h.count)
+                for key, h in self._histograms.items()
+            )
+            collectors = list(self._collectors)
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), counts, total, count in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += bucket_count
+                le = _format_labels(labels, (("le", str(bound)),))
+                lines.append(f"{name}_bucket{le} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        for collector in collectors:
+            for name, value in sorted(collector().items()):
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+inc = metrics.inc
+observe = metrics.observe
+timer = metrics.timer
+timed = metrics.timed
+
+
+def register_metrics_endpoint(server, path: str = METRICS_PATH) -> None:
+    """Serve the metrics of the process in the Prometheus text format.
+
+    They are served on a Flask server, e.g. the one behind a Dash app
+    (app.server).
+    """
+    def prometheus_metrics():
+        return (
+            metrics.render_prometheus(),
+            200,
+            {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+    server.add_url_rule(path, "prometheus_metrics", prometheus_metrics)
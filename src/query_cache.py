@@ -0,0 +1,169 @@
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+
+import numpy as np
+
+QUERY_EMBEDDINGS_MAX_ENTRIES = 4096
+RESULTS_MAX_ENTRIES = 1024
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Strip a query and collapse its whitespace.
+
+    This does not change its embedding, so that trivially different
+    queries share cache entries.
+    """
+    return _SPACES_RE.sub(" ", query).strip()
+
+
+def query_cache_key(query: str) -> str:
+    """Key of a query embedding.
+
+    This is the normalized query with the e5 query prefix applied.
+    """
+    # encoders (and langchain) are imported on first use
+    from encoders import QUERY_PREFIX
+    return QUERY_PREFIX + normalize_query(query)
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache counting its hits and misses."""
+
+    def __init__(self, max_entries: int):
+        """Create an empty cache holding at most max_entries entries."""
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Number of cached entries."""
+        return len(self._entries)
+
+    def get(self, key: Hashable, default=None):
+        """Return the value cached under key, or default on a miss.
+
+        A hit marks the entry as recently used.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: Hashable, value) -> None:
+        """Cache value under key.
+
+        The least recently used entries beyond max_entries are evicted.
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop all entries, counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Return the entry count and hit/miss counters of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class VersionedCache(LRUCache):
+    """LRU cache whose entries are only valid for one version of the data.
+
+    The version is the one of the data the entries were computed from, e.g.
+    one build of the index. Every lookup passes the current version: when
+    it differs from the one of the cached entries, they are all dropped.
+    Entries can be grouped in namespaces, e.g. one per index, each with its
+    own version.
+    """
+
+    def __init__(self, max_entries: int):
+        """Create an empty cache holding at most max_entries entries."""
+        super().__init__(max_entries)
+        self.versions: dict[Hashable, Hashable] = {}
+
+    def _check_version(self, version: Hashable, namespace: Hashable):
+        with self._lock:
+            if namespace not in self.versions:
+                self.versions[namespace] = version
+            elif version != self.versions[namespace]:
+                for key in [k for k in self._entries if k[0] == namespace]:
+                    del self._entries[key]
+                self.versions[namespace] = version
+
+    def get(
+            self,
+            key: Hashable,
+            version: Hashable,
+            default=None,
+            namespace: Hashable = None
+        ):
+        """Return the value cached under key for version, see LRUCache.get."""
+        self._check_version(version, namespace)
+        return super().get((namespace, key), default)
+
+    def put(
+            self,
+            key: Hashable,
+            value,
+            version: Hashable,
+            namespace: Hashable = None
+        ) -> None:
+        """Cache value under key for version, see LRUCache.put."""
+        self._check_version(version, namespace)
+        super().put((namespace, key), value)
+
+
+query_embeddings = LRUCache(QUERY_EMBEDDINGS_MAX_ENTRIES)
+results = VersionedCache(RESULTS_MAX_ENTRIES)
+
+
+def embed_queries(queries: list[str], embeddings) -> np.ndarray:
+    """Embed queries, encoding only the ones missing from the cache.
+
+    Repeated queries are read from the query embedding cache, all the
+    others are encoded in a single call.
+
+    Returns:
+        np.ndarray: (len(queries), dim) float32 matrix
+    """
+    from encoders import embed_queries as encode_queries, encoder_id
+
+    model = encoder_id(embeddings)
+    keys = [(model, query_cache_key(q)) for q in queries]
+    vectors = [query_embeddings.get(key) for key in keys]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        # the normalized text is encoded, so that equal keys get equal vectors
+        texts = [normalize_query(queries[i]) for i in missing]
+        for i, vector in zip(missing, encode_queries(embeddings, texts)):
+            vectors[i] = np.asarray(vector, dtype=np.float32)
+            query_embeddings.put(keys[i], vectors[i])
+    return np.array(vectors, dtype=np.float32)
+
+
+def cache_stats() -> dict:
+    """Return the hit/miss counters of the query and result caches."""
+    return {
+        "query_embeddings": query_embeddings.stats(),
+        "results": results.stats(),
+    }
@@ -0,0 +1,314 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future, TimeoutError
+
+from metrics import inc, observe
+from registry import SHARDS_PATH, list_shards
+
+# how long the first query of a batch waits for others, in milliseconds
+BATCH_WINDOW_MS = 10
+MAX_BATCH_SIZE = 32
+# latencies kept for the percentiles reported by stats()
+LATENCY_SAMPLES = 2048
+LATENCY_PERCENTILES = (50, 99)
+REQUEST_TIMEOUT = 30.0
+# most moments a search returns, larger k are rejected by the endpoint and
+# clamped by QueryBatcher.submit
+MAX_K = 50
+SEARCH_PATH = "/api/search"
+
+_STOP = object()
+
+
+def _search_shards(
+        queries: list[str],
+        playlists,
+        k: int,
+        mode: str
+    ) -> list[list[dict]]:
+    # the search stack is imported by the worker thread, on the first batch
+    from search import search_shards_batch
+    return search_shards_batch(queries, playlists, k, mode=mode)
+
+
+def _percentile(values: list[float], p: float) -> float | None:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+class QueryBatcher:
+    """Serves concurrent searches in micro-batches.
+
+    Queries submitted from several threads (e.g. Dash callbacks or HTTP
+    requests) are queued. A worker thread takes the first one, gathers the
+    queries arriving within window_ms up to max_batch_size, and searches
+    each group of queries with the same parameters in a single call of
+    search_fn, so the batch gets one encoder forward pass and one FAISS
+    matrix search per index instead of one per query. While a batch is
+    searched, the next one fills up.
+
+    Args:
+        window_ms (float): How long the first query of a batch waits for
+            others, in milliseconds
+        max_batch_size (int): Maximum number of queries per batch
+        search_fn (Callable | None): Batched search, called as
+            search_fn(queries, playlists, k, mode) and returning the moments
+            of each query. Defaults to search.search_shards_batch.
+    """
+
+    def __init__(
+            self,
+            window_ms: float = BATCH_WINDOW_MS,
+            max_batch_size: int = MAX_BATCH_SIZE,
+            search_fn: Callable[..., list[list[dict]]] | None = None
+        ):
+        """Create the batcher, its worker thread starts on first use."""
+        if max_batch_size < 1:
+            raise ValueError(
+                f"max_batch_size must be at least 1, got {max_batch_size}"
+            )
+        self.window_ms = window_ms
+        self.max_batch_size = max_batch_size
+        self._search_fn = search_fn or _search_shards
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._latencies: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self._requests = 0
+        self._batches = 0
+
+    def _ensure_worker(self) -> None:
+        # started on first use, so importing the app starts no thread
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="query-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def submit(
+            self,
+            query: str,
+            k: int = 5,
+            mode: str = "dense",
+            playlists: list[str] | None = None
+        ) -> Future:
+        """Queue a search and return a Future of its moments.
+
+        See search.search_moments, k is clamped to MAX_K. A cancelled
+        future is skipped by the batch.
+        """
+        if isinstance(playlists, str):
+            raise TypeError("playlists must be a list of playlist names")
+        future: Future = Future()
+        params = (min(k, MAX_K), mode, tuple(playlists) if playlists else None)
+        self._ensure_worker()
+        self._queue.put((query, params, future, time.perf_counter()))
+        return future
+
+    def search(
+            self,
+            query: str,
+            k: int = 5,
+            mode: str = "dense",
+            playlists: list[str] | None = None,
+            timeout: float | None = REQUEST_TIMEOUT
+        ) -> list[dict]:
+        """Search a query in the next batch and wait for its moments."""
+        return self.submit(query, k, mode, playlists).result(timeout)
+
+    def close(self) -> None:
+        """Stop the worker thread once the queued queries are served."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stop = False
+            deadline = time.perf_counter() + self.window_ms / 1000
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._queue.get(
+                        timeout=max(0.0, deadline - time.perf_counter())
+                    )
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._run_batch(batch)
+            if stop:
+                return
+
+    def _run_batch(self, batch: list[tuple]) -> None:
+        inc("query_batches_total")
+        inc("query_batched_requests_total", len(batch))
+        try:
+            groups: dict[tuple, list[tuple]] = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+            for items in groups.values():
+                self._run_group(items)
+        except Exception as e:
+            # e.g. unhashable parameters: fail the batch, not the worker
+            logging.exception(f"Batch of {len(batch)} queries failed")
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        with self._lock:
+            self._batches += 1
+
+    def _run_group(self, items: list[tuple]) -> None:
+        """Search queries sharing the same parameters in one call.
+
+        Queries whose future was cancelled are skipped. If anything goes
+        wrong their futures fail, so the worker keeps running.
+        """
+        # running futures can no longer be cancelled
+        items = [
+            item for item in items if item[2].set_running_or_notify_cancel()
+        ]
+        if not items:
+            return
+        queries = [query for query, *_ in items]
+        try:
+            k, mode, playlists = items[0][1]
+            results = self._search_fn(
+                queries, list(playlists) if playlists else None, k, mode
+            )
+            if len(results) != len(items):
+                raise RuntimeError(
+                    f"Search returned {len(results)} results "
+                    f"for {len(items)} queries"
+                )
+        except Exception as e:
+            logging.exception(f"Batch of {len(queries)} queries failed")
+            for _, _, future, _ in items:
+                future.set_exception(e)
+            return
+        for (_, _, future, submitted), moments in zip(items, results):
+            future.set_result(moments)
+            self._record(time.perf_counter() - submitted)
+
+    def _record(self, latency: float) -> None:
+        observe("query_server_latency_seconds", latency)
+        with self._lock:
+            self._latencies.append(latency)
+            self._requests += 1
+
+    def stats(self) -> dict:
+        """Return the batching settings and statistics.
+
+        These are the number of requests and batches served, the mean batch
+        size and the p50/p99 latencies (in milliseconds, from submission to
+        result) of the latest requests.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            requests, batches = self._requests, self._batches
+        latency_ms = {}
+        for p in LATENCY_PERCENTILES:
+            value = _percentile(latencies, p)
+            latency_ms[f"p{p}"] = None if value is None else 1000 * value
+        return {
+            "window_ms": self.window_ms,
+            "max_batch_size": self.max_batch_size,
+            "requests": requests,
+            "batches": batches,
+            "mean_batch_size": requests / batches if batches else None,
+            "latency_ms": latency_ms,
+        }
+
+    def gauges(self) -> dict[str, float]:
+        """Latency percentiles as metrics gauges, see Metrics.add_collector."""
+        return {
+            f"query_server_latency_{p}_ms": value
+            for p, value in self.stats()["latency_ms"].items()
+            if value is not None
+        }
+
+
+def _validate_request(body, shards_path: str) -> str | None:
+    """Return what is wrong with a search request body, None if valid."""
+    if not isinstance(body, dict):
+        return "the body must be a JSON object"
+    query = body.get("query")
+    if not isinstance(query, str) or not query.strip():
+        return "'query' must be a non-empty string"
+    k = body.get("k", 5)
+    if not isinstance(k, int) or isinstance(k, bool) or not 1 <= k <= MAX_K:
+        return f"'k' must be an integer from 1 to {MAX_K}"
+    if not isinstance(body.get("mode", "dense"), str):
+        return "'mode' must be a string"
+    playlists = body.get("playlists")
+    if playlists is not None:
+        if not isinstance(playlists, list) or not all(
+            isinstance(p, str) for p in playlists
+        ):
+            return "'playlists' must be a list of playlist names"
+        # only indexes saved under shards_path, never paths from the request
+        unknown = set(playlists) - set(list_shards(shards_path))
+        if unknown:
+            return f"Unknown playlists: {sorted(unknown)}"
+    return None
+
+
+def register_search_endpoint(
+        server,
+        batcher: QueryBatcher,
+        path: str = SEARCH_PATH,
+        shards_path: str = SHARDS_PATH
+    ) -> None:
+    """Serve batched searches as JSON on a Flask server.
+
+    The server is e.g. the one behind a Dash app (app.server).
+
+    POST path with a JSON body {"query": ..., "k": 5, "mode": "dense",
+    "playlists": [...]} returns {"url", "embed_url", "moments"} for the best
+    moments of the query, or a 400 error for an invalid body. k is at most
+    MAX_K and playlists must be names of indexes saved under shards_path.
+    GET path + '/stats' returns batcher.stats().
+    """
+    from flask import jsonify, request
+
+    def search():
+        body = request.get_json(silent=True)
+        error = _validate_request(body, shards_path)
+        if error is not None:
+            return jsonify({"error": error}), 400
+        try:
+            moments = batcher.search(
+                body["query"], body.get("k", 5), body.get("mode", "dense"),
+                body.get("playlists"),
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except TimeoutError:
+            return jsonify({"error": "search timed out"}), 503
+        best = moments[0] if moments else {}
+        return jsonify({
+            "url": best.get("url", ""),
+            "embed_url": best.get("embed_url", ""),
+            "moments": moments,
+        })
+
+    def stats():
+        return jsonify(batcher.stats())
+
+    server.add_url_rule(path, "batched_search", search, methods=["POST"])
+    server.add_url_rule(path + "/stats", "batched_search_stats", stats)
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from lexical import BM25_NAME, BM25Index
+from metrics import inc, timer
+
+# faiss, langchain_community and the encoders are imported when the first
+# index or model is loaded, so that importing the registry stays cheap
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+
+    from encoders import E5Embeddings
+
+MODEL_NAME = "intfloat/multilingual-e5-large"
+# see encoders.BACKENDS, e.g. 'onnx-int8' for faster CPU inference
+ENCODER_BACKEND = "torch"
+VS_PATH = "data/vs"
+# one index per playlist, see shard_path
+SHARDS_PATH = "data/shards"
+# build and search parameters of a saved index, see ann.save_index_meta
+INDEX_META_NAME = "index_meta.json"
+# number of indexes (e.g. playlist shards) kept loaded, least recently
+# used ones are unloaded beyond it
+MAX_RESIDENT_INDEXES = 8
+
+_lock = threading.RLock()
+_embeddings: dict[tuple[str, str], E5Embeddings] = {}
+# vs_path -> (version of index.faiss and its metadata when loaded,
+# vectorstore), in LRU order
+_vectorstores: OrderedDict[str, tuple[tuple, FAISS]] = OrderedDict()
+# vs_path -> (mtime_ns of bm25.json when loaded, index), in LRU order
+_bm25_indexes: OrderedDict[str, tuple[int, BM25Index]] = OrderedDict()
+
+
+def get_embeddings(
+        model_name: str = MODEL_NAME,
+        backend: str = ENCODER_BACKEND
+    ) -> E5Embeddings:
+    """Return the process-wide embedding model, loading it on first use.
+
+    Args:
+        model_name (str): e5 model id, or 'large', 'base' or 'small'
+        backend (str): Encoder backend, see encoders.BACKENDS
+    """
+    with _lock:
+        key = (model_name, backend)
+        if key not in _embeddings:
+            from encoders import E5Embeddings
+            logging.info(
+                f"Loading embedding model {model_name} ({backend})..."
+            )
+            with timer("model_load_seconds", backend=backend):
+                _embeddings[key] = E5Embeddings(model_name, backend)
+        return _embeddings[key]
+
+
+def _get_resident(resident: OrderedDict, vs_path: str, version):
+    cached = resident.get(vs_path)
+    if cached is not None and (version is None or cached[0] == version):
+        resident.move_to_end(vs_path)
+        return cached[1]
+    return None
+
+
+def _set_resident(resident: OrderedDict, vs_path: str, version, value) -> None:
+    resident[vs_path] = (version, value)
+    resident.move_to_end(vs_path)
+    while len(resident) > MAX_RESIDENT_INDEXES:
+        evicted, _ = resident.popitem(last=False)
+        logging.info(f"Unloading index {evicted}")
+        inc("index_evictions_total")
+
+
+def _index_mtime(vs_path: str, name: str = "index.faiss") -> int | None:
+    try:
+        return (Path(vs_path) / name).stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _vectorstore_version(vs_path: str) -> tuple | None:
+    """Version of index.faiss and of its build metadata.
+
+    None if no index is saved. The metadata is written after the index, a
+    change of either reloads the index with its search parameters.
+    """
+    mtime = _index_mtime(vs_path)
+    if mtime is None:
+        return None
+    return mtime, _index_mtime(vs_path, INDEX_META_NAME)
+
+
+def index_version(vs_path: str = VS_PATH) -> tuple:
+    """Version of the indexes saved at vs_path.
+
+    It changes whenever index.faiss or bm25.json is rewritten.
+    """
+    return (_index_mtime(str(vs_path)), _index_mtime(str(vs_path), BM25_NAME))
+
+
+def get_vectorstore(vs_path: str = VS_PATH) -> FAISS | None:
+    """Return the shared vectorstore saved at vs_path.
+
+    The index is loaded on first use, memory-mapped so that processes
+    share its pages, with chunks read from index.sqlite on demand. It is
+    reloaded when index.faiss changed on disk since it was loaded, e.g.
+    after a rebuild by another process. The embedding model is only loaded
+    once a query is encoded, so lexical searches never load it.
+
+    Returns:
+        FAISS | None: Loaded vectorstore, or None if no index is saved yet
+    """
+    vs_path = str(vs_path)
+    version = _vectorstore_version(vs_path)
+    with _lock:
+        vectorstore = _get_resident(_vectorstores, vs_path, version)
+        if vectorstore is not None or version is None:
+            return vectorstore
+        from ann import apply_search_params, load_index_meta
+        from compact_store import load_vectorstore
+        from encoders import LazyEmbeddings
+        logging.info(f"Loading vectorstore from {vs_path}...")
+        with timer("index_load_seconds"):
+            vectorstore = load_vectorstore(
+                vs_path, LazyEmbeddings(lambda: get_embeddings())
+            )
+        meta = load_index_meta(vs_path)
+        apply_search_params(vectorstore.index, meta["params"])
+        _set_resident(_vectorstores, vs_path, version, vectorstore)
+        return vectorstore
+
+
+def set_vectorstore(vs_path: str, vectorstore: FAISS) -> None:
+    """Hot-swap the shared vectorstore after it was rebuilt.
+
+    The vectorstore must be saved to vs_path, next searches use it
+    without reloading from disk.
+    """
+    vs_path = str(vs_path)
+    with _lock:
+        _set_resident(
+            _vectorstores, vs_path, _vectorstore_version(vs_path) or 0,
+            vectorstore,
+        )
+
+
+def get_bm25(vs_path: str = VS_PATH) -> BM25Index | None:
+    """Return the shared BM25 index saved next to the vectorstore.
+
+    The index saved at vs_path is reloaded when bm25.json changed on disk.
+
+    Returns:
+        BM25Index | None: Loaded index, or None if none is saved yet
+    """
+    vs_path = str(vs_path)
+    mtime = _index_mtime(vs_path, BM25_NAME)
+    with _lock:
+        index = _get_resident(_bm25_indexes, vs_path, mtime)
+        if index is not None or mtime is None:
+            return index
+        logging.info(f"Loading BM25 index from {vs_path}...")
+        with timer("bm25_load_seconds"):
+            index = BM25Index.load(Path(vs_path) / BM25_NAME)
+        _set_resident(_bm25_indexes, vs_path, mtime, index)
+        return index
+
+
+def set_bm25(vs_path: str, index: BM25Index) -> None:
+    """Hot-swap the shared BM25 index after it was saved to vs_path."""
+    vs_path = str(vs_path)
+    with _lock:
+        version = _index_mtime(vs_path, BM25_NAME) or 0
+        _set_resident(_bm25_indexes, vs_path, version, index)
+
+
+def unload(vs_path: str) -> None:
+    """Drop the indexes loaded from vs_path, e.g. once it was deleted."""
+    vs_path = str(vs_path)
+    with _lock:
+        _vectorstores.pop(vs_path, None)
+        _bm25_indexes.pop(vs_path, None)
+
+
+def shard_path(playlist: str, shards_path: str = SHARDS_PATH) -> str:
+    """Directory of the index of one playlist."""
+    return str(Path(shards_path) / playlist)
+
+
+def list_shards(shards_path: str = SHARDS_PATH) -> list[str]:
+    """Return the playlists with a saved index under shards_path."""
+    root = Path(shards_path)
+    if not root.is_dir():
+        return []
+    return sorted(
+        p.name for p in root.iterdir() if (p / "index.faiss").exists()
+    )
+
+
+def warm_up(vs_path: str | None = VS_PATH) -> None:
+    """Load the embedding model and the saved index before the first query.
+
+    One encoding pass initialises the model. With vs_path None, only the
+    model is loaded, e.g. when indexes are shards loaded on demand.
+    """
+    get_embeddings().embed_query("warm up")
+    if vs_path is not None:
+        get_vectorstore(vs_path)
+        get_bm25(vs_path)
@@ -1,29 +1,584 @@
+import hashlib
+import json
+import logging
+import shutil
+import time
+import uuid
+from collections.abc import Iterable, Iterator
+from itertools import islice
+from pathlib import Path
+
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from ann import convert_vectorstore, load_index_meta, save_index_meta
+from build_dataset import iter_txt_folder_as_chunks, load_txt_file_as_chunks
+from catalog import Catalog, file_hash
+from compact_store import (DOCSTORE_SUFFIX, GENERATION_SUFFIX,
+                           load_vectorstore, save_vectorstore)
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from encoders import E5Embeddings, encoder_id
+from lexical import BM25_NAME, BM25Index
+from metrics import inc, timed, timer
+from registry import (SHARDS_PATH, VS_PATH, get_embeddings, get_vectorstore,
+                      list_shards, set_bm25, set_vectorstore, shard_path,
+                      unload)
+from utils import transcript_paths
+
+MANIFEST_NAME = "manifest.json"
+# exact flat copy of a compressed index, updated incrementally
+MASTER_INDEX_NAME = "master"
+MANIFEST_VERSION = 3
+EMBEDDING_CACHE_DIR = "data/cache/embeddings"
+BATCH_SIZE = 32
+# number of batches buffered and sorted together by text length
+SORT_WINDOW = 16
+# rough length of a token, to estimate the padded size of a batch
+CHARS_PER_TOKEN = 4
+
+
+def _get_embeddings() -> Embeddings:
+    return get_embeddings()
+
+
+def encoder_cache_dir(cache_dir: str | Path, namespace: str) -> Path:
+    """Return the embedding cache directory of one encoder.
+
+    Each encoder gets its own cache, as encoders of different models
+    produce vectors of different dimensions.
+    """
+    digest = hashlib.sha1(namespace.encode("utf-8")).hexdigest()[:16]
+    return Path(cache_dir) / digest
+
+
+def _get_cached_embeddings(
+        cache_dir: str | None = EMBEDDING_CACHE_DIR
+    ) -> CachedEmbeddings | Embeddings:
+    """Return the embedding model, wrapped in the on-disk embedding cache.
+
+    The cache is disabled if cache_dir is None. Cached vectors are kept
+    per encoder, see encoders.encoder_id and encoder_cache_dir.
+    """
+    embeddings = _get_embeddings()
+    if cache_dir is None:
+        return embeddings
+    namespace = encoder_id(embeddings)
+    return CachedEmbeddings(
+        embeddings,
+        EmbeddingCache(encoder_cache_dir(cache_dir, namespace)),
+        namespace,
+    )
+
+
+def _save_cache(embeddings):
+    if isinstance(embeddings, CachedEmbeddings):
+        embeddings.cache.save()
+
+
+def iter_transcript_chunks(
+        folder_path: str | Path,
+        workers: int | None = None
+    ) -> Iterator[Document]:
+    """Lazily yield the timed chunks of every transcript in a folder.
+
+    Transcripts are read file by file, in worker processes if workers is
+    set.
+    """
+    return iter_txt_folder_as_chunks(folder_path, workers)
+
+
+def _estimate_tokens(text: str) -> int:
+    # plus the special tokens added by the tokenizer
+    return len(text) // CHARS_PER_TOKEN + 2
+
 
-from build_dataset import load_txt_folder_as_documents
+def _length_sorted_batches(
+        texts: list[str],
+        batch_size: int,
+        max_batch_tokens: int | None = None
+    ) -> list[list[int]]:
+    """Group texts into batches of similar length, to minimize padding.
 
+    A batch holds at most batch_size texts and, with max_batch_tokens, at
+    most that many padded tokens: its size times the estimated token
+    count of its longest text. A text over the budget gets a batch of its
+    own.
 
-def embed_transcripts(folder_path: str) -> FAISS:
+    Returns:
+        list[list[int]]: Positions of the texts of each batch
+    """
+    batches: list[list[int]] = []
+    batch: list[int] = []
+    for i in sorted(range(len(texts)), key=lambda i: len(texts[i])):
+        # texts come by length: the new one is the longest of the batch
+        padded = (len(batch) + 1) * _estimate_tokens(texts[i])
+        if batch and (
+            len(batch) == batch_size
+            or (max_batch_tokens is not None and padded > max_batch_tokens)
+        ):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def configure_encoder(
+        embeddings,
+        batch_size: int | None = None,
+        max_seq_length: int | None = None,
+        num_threads: int | None = None
+    ) -> None:
+    """Tune the sentence-transformers encoder behind embeddings.
+
+    Settings apply to the shared model of the registry, hence to every
+    later embedding call of the process.
+
+    Args:
+        embeddings: E5Embeddings, possibly wrapped in CachedEmbeddings
+        batch_size (int | None): Encoder batch size
+        max_seq_length (int | None): Truncation length in tokens
+        num_threads (int | None): Number of torch intra-op threads
+    """
+    if isinstance(embeddings, CachedEmbeddings):
+        embeddings = embeddings.embeddings
+    if not isinstance(embeddings, E5Embeddings):
+        return
+    if batch_size is not None:
+        embeddings.batch_size = batch_size
+    if max_seq_length is not None:
+        embeddings.client.max_seq_length = max_seq_length
+    if num_threads is not None:
+        import torch
+        torch.set_num_threads(num_threads)
+
+
+def embed_documents_streaming(
+        docs: Iterable[Document],
+        embeddings,
+        vectorstore: FAISS | None = None,
+        batch_size: int = BATCH_SIZE,
+        sort_window: int = SORT_WINDOW,
+        max_batch_tokens: int | None = None
+    ) -> FAISS | None:
+    """Embed documents batch by batch and add them to a FAISS vectorstore.
+
+    Documents are consumed lazily and only one sort window of them is held
+    before its vectors are added to the index. Within a window, documents
+    are embedded in batches of similar length, and added to the index in
+    their input order. Document.id is used as docstore id when set.
+    Throughput is logged as chunks/sec.
+
+    Args:
+        docs (Iterable[Document]): Documents to embed
+        embeddings: Embedding model
+        vectorstore (FAISS | None): Vectorstore to add to, a new one is
+            created if None
+        batch_size (int): Number of documents embedded per call
+        sort_window (int): Number of batches sorted together by length
+        max_batch_tokens (int | None): Maximum number of padded tokens per
+            batch, see _length_sorted_batches. None only limits the number
+            of documents.
+
+    Returns:
+        FAISS | None: Vectorstore, or None if it was None and docs is empty
+    """
+    n_done = 0
+    start = time.perf_counter()
+    docs = iter(docs)
+    while window := list(islice(docs, batch_size * sort_window)):
+        texts = [d.page_content for d in window]
+        vectors: list = [None] * len(window)
+        batches = _length_sorted_batches(texts, batch_size, max_batch_tokens)
+        for batch in batches:
+            with timer("embed_batch_seconds"):
+                embedded = embeddings.embed_documents(
+                    [texts[i] for i in batch]
+                )
+            for i, vector in zip(batch, embedded):
+                vectors[i] = vector
+            inc("chunks_embedded_total", len(batch))
+            n_done += len(batch)
+            elapsed = time.perf_counter() - start
+            logging.info(
+                f"Embedded {n_done} chunks "
+                f"({n_done / max(elapsed, 1e-9):.1f} chunks/sec)"
+            )
+        metadatas = [d.metadata for d in window]
+        ids = [d.id or str(uuid.uuid4()) for d in window]
+        if vectorstore is None:
+            vectorstore = FAISS.from_embeddings(
+                list(zip(texts, vectors)), embeddings, metadatas, ids
+            )
+        else:
+            vectorstore.add_embeddings(zip(texts, vectors), metadatas, ids)
+    return vectorstore
+
+
+def embed_transcripts(
+        folder_path: str,
+        cache_dir: str | None = EMBEDDING_CACHE_DIR,
+        batch_size: int = BATCH_SIZE,
+        num_threads: int | None = None,
+        load_workers: int | None = None,
+        max_seq_length: int | None = None
+    ) -> FAISS | None:
     """Embed all transcripts in a folder and return a FAISS vectorstore.
     Args:
         folder_path (str): Path to folder with .txt files
+        cache_dir (str | None): Embedding cache directory, chunks already
+            embedded in a previous run are read from it. None disables the
+            cache.
+        batch_size (int): Number of chunks embedded per batch
+        num_threads (int | None): Number of torch threads, torch default
+            if None
+        load_workers (int | None): Number of processes reading and
+            chunking transcripts while chunks are embedded, None reads
+            them in the calling process
+        max_seq_length (int | None): Truncation length of the encoder in
+            tokens, the model default if None
     Returns:
-        FAISS: FAISS vectorstore with embedded transcripts
+        FAISS | None: FAISS vectorstore with embedded transcripts, or None
+            if the folder has no transcript
     """
-    
-    docs_before_split = load_txt_folder_as_documents(folder_path)
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size = 700,
-        chunk_overlap  = 50,
+    embeddings = _get_cached_embeddings(cache_dir)
+    configure_encoder(embeddings, batch_size, max_seq_length, num_threads)
+    vectorstore = embed_documents_streaming(
+        iter_transcript_chunks(folder_path, load_workers), embeddings,
+        batch_size=batch_size
     )
-    docs_after_split = text_splitter.split_documents(docs_before_split)
+    _save_cache(embeddings)
+    return vectorstore
 
-    huggingface_embeddings = HuggingFaceEmbeddings(
-        model_name="intfloat/multilingual-e5-large",
-        model_kwargs={'device':'cpu'},
-        encode_kwargs={'normalize_embeddings': True}
+
+def _chunk_ids(path: str, content_hash: str, n_chunks: int) -> list[str]:
+    """Deterministic docstore ids for the chunks of one transcript file."""
+    prefix = hashlib.sha256(
+        f"{path}\0{content_hash}".encode()
+    ).hexdigest()[:16]
+    return [f"{prefix}:{i}" for i in range(n_chunks)]
+
+
+def load_manifest(vs_path: str | Path) -> dict:
+    """Load the index manifest stored next to index.faiss.
+
+    The manifest records the encoder the index was built with, see
+    encoders.encoder_id, and maps each indexed transcript path to its
+    content hash and the docstore ids of its chunks:
+    ``{"version": 3, "encoder": str,
+    "files": {path: {"hash": str, "ids": [str]}}}``.
+    Returns an empty manifest if none exists or if it is unreadable.
+    """
+    manifest_path = Path(vs_path) / MANIFEST_NAME
+    empty = {"version": MANIFEST_VERSION, "encoder": None, "files": {}}
+    if not manifest_path.exists():
+        return empty
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        logging.warning(f"Unreadable manifest at {manifest_path}, ignoring")
+        return empty
+    if manifest.get("version") != MANIFEST_VERSION:
+        return empty
+    return manifest
+
+
+def save_manifest(vs_path: str | Path, manifest: dict) -> None:
+    """Write the index manifest next to index.faiss."""
+    Path(vs_path).mkdir(parents=True, exist_ok=True)
+    manifest_path = Path(vs_path) / MANIFEST_NAME
+    manifest_path.write_text(
+        json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8"
     )
-    vectorstore = FAISS.from_documents(docs_after_split, huggingface_embeddings)
-    return vectorstore
\ No newline at end of file
+
+
+def build_bm25(vectorstore: FAISS) -> BM25Index:
+    """Build a BM25 index over all the chunks of a vectorstore."""
+    bm25 = BM25Index()
+    for doc_id in vectorstore.index_to_docstore_id.values():
+        bm25.add(doc_id, vectorstore.docstore.search(doc_id).page_content)
+    return bm25
+
+
+@timed("index_update_seconds")
+def update_index(
+        folder_path: str,
+        vs_path: str = VS_PATH,
+        cache_dir: str | None = EMBEDDING_CACHE_DIR,
+        batch_size: int = BATCH_SIZE,
+        num_threads: int | None = None,
+        index_type: str | None = None,
+        index_params: dict | None = None,
+        catalog: Catalog | None = None,
+        max_seq_length: int | None = None
+    ) -> FAISS | None:
+    """Incrementally sync the FAISS index at vs_path with a transcripts folder.
+
+    Only transcripts that are new or whose content hash changed since the
+    last run are embedded. Chunks of changed and deleted transcripts are
+    removed from the index by id. The BM25 lexical index saved alongside
+    is kept in sync. The indexes and the manifest are saved back to
+    vs_path, and the shared indexes of the registry are swapped for the
+    updated ones.
+
+    With a compressed index type (see ann.INDEX_TYPES), an exact flat copy
+    is kept as master.faiss and updated incrementally, and the served
+    index.faiss is rebuilt from it, trained on all vectors, after each
+    change. Its build parameters are stored in index_meta.json.
+
+    Args:
+        folder_path (str): Path to folder with .txt files
+        vs_path (str): Directory holding index.faiss, index.sqlite and the
+            manifest. Defaults to 'data/vs'.
+        cache_dir (str | None): Embedding cache directory. None disables
+            the cache.
+        batch_size (int): Number of chunks embedded per batch
+        num_threads (int | None): Number of torch threads, torch default
+            if None
+        index_type (str | None): 'flat', 'ivf', 'ivfpq', 'sq8' or 'hnsw',
+            None keeps the type of the existing index (flat for a new one)
+        index_params (dict | None): Build and search parameters of the
+            index type, see ann.DEFAULT_PARAMS
+        catalog (Catalog | None): Synced catalog of the transcripts, whose
+            content hashes are used instead of hashing every file, and
+            which records the indexed content. None hashes the files.
+        max_seq_length (int | None): Truncation length of the encoder in
+            tokens, the model default if None
+
+    Returns:
+        FAISS | None: Up-to-date vectorstore, or None if there is nothing
+            to index
+    """
+    manifest = load_manifest(vs_path)
+    embeddings = _get_cached_embeddings(cache_dir)
+    encoder = encoder_id(_get_embeddings())
+    meta = load_index_meta(vs_path)
+    index_type = index_type or meta["index_type"]
+    # parameters as requested, e.g. an automatic nlist is re-resolved
+    # from the corpus size at each rebuild
+    if index_params is None:
+        index_params = (
+            meta.get("build_params", {})
+            if index_type == meta["index_type"] else {}
+        )
+    # index holding the exact vectors of the current index
+    source_name = (
+        "index" if meta["index_type"] == "flat" else MASTER_INDEX_NAME
+    )
+
+    vectorstore = None
+    if manifest["files"] and manifest["encoder"] != encoder:
+        logging.info(
+            f"Index was built with {manifest['encoder']}, "
+            f"re-embedding all transcripts with {encoder}"
+        )
+    elif (
+        manifest["files"]
+        and (Path(vs_path) / f"{source_name}.faiss").exists()
+    ):
+        vectorstore = load_vectorstore(
+            vs_path, embeddings, source_name, writable=True
+        )
+    if vectorstore is None:
+        # Without a manifest the existing ids are unknown, and vectors of
+        # another encoder cannot be reused: start over.
+        manifest = {
+            "version": MANIFEST_VERSION, "encoder": encoder, "files": {}
+        }
+
+    bm25_path = Path(vs_path) / BM25_NAME
+    if vectorstore is None:
+        bm25 = BM25Index()
+    elif bm25_path.exists():
+        bm25 = BM25Index.load(bm25_path)
+    else:
+        bm25 = build_bm25(vectorstore)
+
+    indexed = manifest["files"]
+    if catalog is not None:
+        # read first: deletions recorded during the update stay pending
+        deletions_until = catalog.deletion_mark()
+        current = {
+            row["path"]: row["hash"]
+            for row in catalog.transcripts(folder_path)
+        }
+    else:
+        current = {
+            str(path): file_hash(path)
+            for path in transcript_paths(folder_path)
+        }
+
+    stale = [
+        path for path, entry in indexed.items()
+        if current.get(path) != entry["hash"]
+    ]
+    to_embed = [
+        path for path, content_hash in current.items()
+        if path not in indexed or indexed[path]["hash"] != content_hash
+    ]
+    logging.info(
+        f"Index update: {len(to_embed)} file(s) to embed, "
+        f"{len(stale)} file(s) to remove or replace"
+    )
+
+    stale_ids = [i for path in stale for i in indexed.pop(path)["ids"]]
+    if vectorstore is not None and stale_ids:
+        vectorstore.delete(stale_ids)
+        bm25.remove_many(stale_ids)
+
+    def new_chunks() -> Iterator[Document]:
+        for path in to_embed:
+            chunks = load_txt_file_as_chunks(path)
+            ids = _chunk_ids(path, current[path], len(chunks))
+            indexed[path] = {"hash": current[path], "ids": ids}
+            for chunk, chunk_id in zip(chunks, ids):
+                chunk.id = chunk_id
+                bm25.add(chunk_id, chunk.page_content)
+                yield chunk
+
+    if to_embed:
+        configure_encoder(embeddings, batch_size, max_seq_length, num_threads)
+        vectorstore = embed_documents_streaming(
+            new_chunks(), embeddings, vectorstore, batch_size=batch_size
+        )
+        _save_cache(embeddings)
+
+    if vectorstore is None:
+        if catalog is not None:
+            catalog.mark_indexed(folder_path, current, deletions_until)
+        return None
+    if not (stale_ids or to_embed) and index_type == meta["index_type"]:
+        logging.info("Index is up to date")
+        if catalog is not None:
+            catalog.mark_indexed(folder_path, current, deletions_until)
+        return get_vectorstore(vs_path)
+
+    if index_type == "flat":
+        served = vectorstore
+        meta = {"index_type": "flat", "params": {}}
+        for suffix in (".faiss", ".pkl", DOCSTORE_SUFFIX, GENERATION_SUFFIX):
+            master_path = Path(vs_path) / f"{MASTER_INDEX_NAME}{suffix}"
+            master_path.unlink(missing_ok=True)
+    else:
+        save_vectorstore(vectorstore, vs_path, MASTER_INDEX_NAME)
+        served, meta = convert_vectorstore(
+            vectorstore, index_type, **index_params
+        )
+        meta["build_params"] = index_params
+    with timer("index_save_seconds"):
+        save_vectorstore(served, vs_path)
+        # after the index, which readers reload when it changes, see
+        # registry.get_vectorstore
+        save_index_meta(vs_path, meta)
+        bm25.save(bm25_path)
+        save_manifest(vs_path, manifest)
+    set_vectorstore(vs_path, served)
+    set_bm25(vs_path, bm25)
+    if catalog is not None:
+        catalog.mark_indexed(folder_path, current, deletions_until)
+    return served
+
+
+def rebuild_index(folder_path: str, vs_path: str = VS_PATH) -> int:
+    """Update the index at vs_path and return its number of vectors.
+
+    See update_index. Meant to run in a worker process: only the count is
+    sent back, processes sharing vs_path pick the new index up from disk.
+    """
+    vectorstore = update_index(folder_path, vs_path)
+    return 0 if vectorstore is None else vectorstore.index.ntotal
+
+
+def list_playlists(folder_path: str) -> list[str]:
+    """Return the playlists of a transcripts folder.
+
+    These are its subdirectories holding at least one transcript.
+    """
+    root = Path(folder_path)
+    if not root.is_dir():
+        return []
+    return sorted(
+        p.name for p in root.iterdir()
+        if p.is_dir() and transcript_paths(p)
+    )
+
+
+def update_shards(
+        folder_path: str,
+        shards_path: str = SHARDS_PATH,
+        playlists: list[str] | None = None,
+        catalog: Catalog | None = None,
+        **kwargs
+    ) -> dict[str, FAISS | None]:
+    """Sync one index per playlist with a transcripts folder.
+
+    Each playlist folder_path/<playlist> is indexed on its own at
+    shards_path/<playlist> by update_index, so that a change in one
+    playlist only updates its shard. Shards of playlists that no longer
+    have transcripts are deleted.
+
+    Args:
+        folder_path (str): Folder holding one subfolder per playlist
+        shards_path (str): Directory holding one index per playlist.
+            Defaults to 'data/shards'.
+        playlists (list[str] | None): Playlists to update, all the
+            playlists of folder_path and shards_path if None
+        catalog (Catalog | None): Synced catalog of folder_path, listing
+            its playlists and transcripts instead of the filesystem
+        **kwargs: Passed to update_index, e.g. index_type
+    Returns:
+        dict[str, FAISS | None]: Up-to-date vectorstore of each updated
+            playlist, None for deleted shards
+    """
+    if catalog is not None:
+        deletions_until = catalog.deletion_mark()
+        present = set(catalog.playlists())
+    else:
+        present = set(list_playlists(folder_path))
+    if playlists is None:
+        playlists = sorted(present | set(list_shards(shards_path)))
+    shards = {}
+    for playlist in playlists:
+        path = shard_path(playlist, shards_path)
+        if playlist not in present:
+            logging.info(f"Removing the index of playlist {playlist}")
+            shutil.rmtree(path, ignore_errors=True)
+            unload(path)
+            if catalog is not None:
+                catalog.mark_indexed(
+                    Path(folder_path) / playlist, {}, deletions_until
+                )
+            shards[playlist] = None
+            continue
+        logging.info(f"Updating the index of playlist {playlist}")
+        shards[playlist] = update_index(
+            str(Path(folder_path) / playlist), path, catalog=catalog, **kwargs
+        )
+    return shards
+
+
+def rebuild_shards(
+        folder_path: str,
+        shards_path: str = SHARDS_PATH,
+        playlists: list[str] | None = None
+    ) -> dict[str, int]:
+    """Update playlist shards and return their number of vectors.
+
+    See update_shards. Meant to run in a worker process, like
+    rebuild_index. The transcripts catalog of folder_path is synced first,
+    and records what the shards now hold.
+    """
+    catalog = Catalog(folder_path)
+    try:
+        catalog.sync()
+        shards = update_shards(
+            folder_path, shards_path, playlists, catalog=catalog
+        )
+    finally:
+        catalog.close()
+    return {
+        playlist: 0 if vectorstore is None else vectorstore.index.ntotal
+        for playlist, vectorstore in shards.items()
+    }
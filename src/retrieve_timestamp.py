@@ -1,11 +1,22 @@
+import hashlib
+import os
 import re
+import threading
 import unicodedata
-from difflib import SequenceMatcher
-from typing import List, Optional, Tuple
+from bisect import bisect_right
+from collections import Counter, OrderedDict, defaultdict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
-TIMESTAMP_LINE_RE = re.compile(
-    r"^\s*(\d{2}:\d{2}:\d{2}(?:[.,]\d{3})?)\s+(.*\S)\s*$"
-)
+from cleaning import TIMED_LINE_RE
+from metrics import inc, timer
+from utils import BINARY_SUFFIX
+
+# number of AlignmentIndex of transcript texts kept by build_alignment
+ALIGNMENT_CACHE_SIZE = 32
+# sha1 of a transcript text -> its AlignmentIndex, in LRU order
+_alignments: "OrderedDict[str, AlignmentIndex]" = OrderedDict()
+_alignments_lock = threading.Lock()
 
 def _strip_accents(s: str) -> str:
     """Strip accents from input string."""
@@ -33,19 +44,13 @@ def _first_sentence(text: str) -> str:
     return sent.strip()
 
 def _parse_timed_transcript(doc: str) -> List[Tuple[str, str]]:
-    """Parse a timestamped transcript into (timestamp, text) pairs. 
+    """Parse a timestamped transcript into (timestamp, text) pairs.
+
+    The whole text is parsed in a single regex pass.
     Lines without timestamps are ignored.
     Returns list of (timestamp, text) tuples.
     """
-    pairs = []
-    for line in doc.splitlines():
-        m = TIMESTAMP_LINE_RE.match(line)
-        if not m:
-            continue
-        ts, content = m.group(1), m.group(2)
-        if content.strip():
-            pairs.append((ts, content))
-    return pairs
+    return TIMED_LINE_RE.findall(doc)
 
 def _build_corpus(pairs: List[Tuple[str, str]]):
     """
@@ -74,58 +79,241 @@ def _build_corpus(pairs: List[Tuple[str, str]]):
             spans[-1] = (s0, e0 - 1, ts0)
     return corpus, spans
 
-def _timestamp_for_index(spans: List[Tuple[int, int, str]], idx: int) -> Optional[str]:
-    """
-    Map a character index in the corpus to the corresponding line's timestamp.
-    """
-    for start, end, ts in spans:
-        if start <= idx < end:
-            return ts
+def _last_sentence(text: str) -> str:
+    """Return the last sentence or last 20 words, whichever is shorter."""
+    stripped = text.strip()
+    ends = [m.end() for m in re.finditer(r"[\.!?…]+", stripped)]
+    # ignore the terminal punctuation of the text itself
+    ends = [e for e in ends if e < len(stripped)]
+    if ends and len(stripped) - ends[-1] > 10:
+        sent = stripped[ends[-1]:]
+    else:
+        words = stripped.split()
+        sent = " ".join(words[-20:])
+    return sent.strip()
 
-def get_timestamp_for_chunk(retrieved_chunk: str, timed_transcript_text: str) -> Optional[str]:
+class AlignmentIndex:
     """
-    Return the timestamp (e.g. '00:12:51.030') for where the FIRST SENTENCE
-    of the retrieved chunk begins in the timestamped transcript.
+    Alignment structure over one timestamped transcript, built once in
+    linear time and reused for every chunk to align:
+    - the normalized corpus and sorted span starts, so that mapping a
+      character position to its line's timestamp is a bisect;
+    - word n-gram postings (n-gram -> word indices where it starts), so
+      that locating text only verifies a few candidate positions and the
+      fuzzy fallback is a vote over n-gram hits instead of a quadratic
+      longest-common-substring search.
     """
-    pairs = _parse_timed_transcript(timed_transcript_text)
-    if not pairs:
+
+    def __init__(
+            self,
+            timed_transcript_text: str,
+            ngram: int = 3,
+            max_postings: int = 64,
+            pairs: Optional[List[Tuple[str, str]]] = None
+    ):
+        """Index a timestamped transcript, or its already parsed pairs."""
+        # pairs already parsed, e.g. read from a .tsb file, skip the parsing
+        if pairs is None:
+            pairs = _parse_timed_transcript(timed_transcript_text)
+        self.corpus, spans = _build_corpus(pairs) if pairs else ("", [])
+        self.ngram = ngram
+        self.max_postings = max_postings
+        self._span_starts = [start for start, _, _ in spans]
+        self._span_ends = [end for _, end, _ in spans]
+        self._span_ts = [ts for _, _, ts in spans]
+
+        # char position of each corpus word, and postings of word n-grams
+        self._word_pos = []
+        words = []
+        for m in re.finditer(r"\S+", self.corpus):
+            self._word_pos.append(m.start())
+            words.append(m.group())
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        for i in range(len(words) - ngram + 1):
+            self._postings[" ".join(words[i:i + ngram])].append(i)
+
+    def timestamp_at(self, idx: int) -> Optional[str]:
+        """Map a character index in the corpus to its line's timestamp."""
+        i = bisect_right(self._span_starts, idx) - 1
+        if i >= 0 and idx < self._span_ends[i]:
+            return self._span_ts[i]
         return None
 
-    corpus, spans = _build_corpus(pairs)
+    def _find_exact(self, query: str) -> int:
+        words = query.split()
+        if len(words) < self.ngram:
+            return self.corpus.find(query)
+        for i in self._postings.get(" ".join(words[:self.ngram]), ()):
+            pos = self._word_pos[i]
+            if self.corpus.startswith(query, pos):
+                return pos
+        return -1
+
+    def _find_fuzzy(
+            self,
+            words: List[str],
+            min_coverage: float
+    ) -> Tuple[int, int]:
+        """Vote for the alignment offset supported by the most query n-grams.
+
+        The offset is the corpus word index minus the query word index.
+        """
+        n_grams = len(words) - self.ngram + 1
+        if n_grams <= 0:
+            return -1, 0
+        votes: Counter = Counter()
+        for qi in range(n_grams):
+            ngram = " ".join(words[qi:qi + self.ngram])
+            postings = self._postings.get(ngram, ())
+            # very frequent n-grams carry no location information
+            if len(postings) > self.max_postings:
+                continue
+            for ci in postings:
+                votes[ci - qi] += 1
+        if not votes:
+            return -1, 0
+        offset, count = votes.most_common(1)[0]
+        if count / n_grams < min_coverage:
+            return -1, 0
+        first = max(offset, 0)
+        last = min(offset + len(words), len(self._word_pos)) - 1
+        last_word = self.corpus[self._word_pos[last]:].split(" ", 1)[0]
+        end = self._word_pos[last] + len(last_word)
+        return self._word_pos[first], end - self._word_pos[first]
+
+    def find(self, text: str, min_coverage: float = 0.5) -> Tuple[int, int]:
+        """Return (position, length) of the normalized text in the corpus.
+
+        Returns (-1, 0) if it cannot be found.
+        """
+        query = _normalize(text)
+
+        if not query or not self.corpus:
+            inc("alignment_lookups_total", method="miss")
+            return -1, 0
+
+        # 1) Exact search on normalized text
+        pos = self._find_exact(query)
+        if pos != -1:
+            inc("alignment_lookups_total", method="exact")
+            return pos, len(query)
+
+        # 2) Try a shorter prefix (first 12–18 words) for small mismatches
+        words = query.split()
+        for n_words in (18, 12):
+            if len(words) > n_words:
+                prefix = " ".join(words[:n_words])
+                pos = self._find_exact(prefix)
+                if pos != -1:
+                    inc("alignment_lookups_total", method="prefix")
+                    return pos, len(prefix)
 
-    first_sent = _first_sentence(retrieved_chunk)
-    query = _normalize(first_sent)
+        # 3) Light fuzzy backup: best supported n-gram alignment
+        with timer("alignment_fuzzy_seconds"):
+            pos, size = self._find_fuzzy(words, min_coverage)
+        inc("alignment_lookups_total", method="fuzzy" if pos != -1 else "miss")
+        return pos, size
 
-    if not query or not corpus:
+def build_alignment(timed_transcript_text: str) -> AlignmentIndex:
+    """Parse a timestamped transcript once into an AlignmentIndex.
+
+    This aligns many chunks of the same transcript with locate_text. Indexes
+    of recently seen transcripts are cached.
+    """
+    # keyed by a digest, so that cached entries do not keep the texts alive
+    key = hashlib.sha1(timed_transcript_text.encode("utf-8")).hexdigest()
+    with _alignments_lock:
+        index = _alignments.get(key)
+        if index is not None:
+            _alignments.move_to_end(key)
+            return index
+    with timer("alignment_build_seconds"):
+        index = AlignmentIndex(timed_transcript_text)
+    with _alignments_lock:
+        _alignments[key] = index
+        _alignments.move_to_end(key)
+        while len(_alignments) > ALIGNMENT_CACHE_SIZE:
+            _alignments.popitem(last=False)
+    return index
+
+def alignment_for_file(path: str) -> AlignmentIndex:
+    """Return the AlignmentIndex of a transcript file.
+
+    The index is cached until the file changes on disk.
+    """
+    stat = os.stat(path)
+    return _cached_file_alignment(str(path), stat.st_mtime_ns, stat.st_size)
+
+@lru_cache(maxsize=64)
+def _cached_file_alignment(
+        path: str,
+        mtime_ns: int,
+        size: int
+) -> AlignmentIndex:
+    if path.endswith(BINARY_SUFFIX):
+        from binary_transcripts import BinaryTranscript
+        with timer("transcript_read_seconds"):
+            with BinaryTranscript(path) as transcript:
+                pairs = [
+                    (ts, txt) for ts, txt in transcript.lines()
+                    if ts is not None
+                ]
+        with timer("alignment_build_seconds"):
+            return AlignmentIndex("", pairs=pairs)
+    with timer("transcript_read_seconds"):
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    with timer("alignment_build_seconds"):
+        return AlignmentIndex(text)
+
+def locate_text(text: str, index: AlignmentIndex) -> Optional[str]:
+    """Return the timestamp of the line where text begins."""
+    pos, _ = index.find(text)
+    if pos == -1:
         return None
+    return index.timestamp_at(pos)
 
-    # 1) Exact substring search on normalized text
-    pos = corpus.find(query)
+def get_timestamp_range_for_chunk(
+        retrieved_chunk: str,
+        index: AlignmentIndex
+) -> Tuple[Optional[str], Optional[str]]:
+    """Return the (start, end) timestamps of a chunk in the transcript.
+
+    These are the timestamps of the lines where its FIRST sentence begins
+    and where its LAST sentence ends.
+    """
+    start = locate_text(_first_sentence(retrieved_chunk), index)
+    pos, size = index.find(_last_sentence(retrieved_chunk))
+    end = None
     if pos != -1:
-        return _timestamp_for_index(spans, pos)
-
-    # 2) Try a shorter prefix (first 12–18 words) to handle small mismatches
-    words = query.split()
-    if len(words) > 18:
-        prefix = " ".join(words[:18])
-        pos2 = corpus.find(prefix)
-        if pos2 != -1:
-            return _timestamp_for_index(spans, pos2)
-
-    if len(words) > 12:
-        prefix = " ".join(words[:12])
-        pos3 = corpus.find(prefix)
-        if pos3 != -1:
-            return _timestamp_for_index(spans, pos3)
-
-    # 3) Light fuzzy backup: longest common match location
-    sm = SequenceMatcher(None, corpus, query, autojunk=False)
-    match = sm.find_longest_match(0, len(corpus), 0, len(query))
-    coverage = match.size / max(1, len(query))
-    if coverage >= 0.6:
-        return _timestamp_for_index(spans, match.a)
+        end = index.timestamp_at(pos + max(size, 1) - 1)
+    return start, end
 
-    return None
+def get_timestamp_for_chunk(
+        retrieved_chunk: str,
+        timed_transcript_text: str
+) -> Optional[str]:
+    """Return the timestamp (e.g. '00:12:51.030') of a chunk.
+
+    This is where the FIRST SENTENCE of the retrieved chunk begins in the
+    timestamped transcript.
+    """
+    return locate_text(
+        _first_sentence(retrieved_chunk),
+        build_alignment(timed_transcript_text)
+    )
+
+def get_timestamp_for_chunk_in_file(
+        retrieved_chunk: str,
+        path: str
+) -> Optional[str]:
+    """Same as get_timestamp_for_chunk for a transcript file.
+
+    The alignment index of the file is cached until the file changes.
+    """
+    return locate_text(
+        _first_sentence(retrieved_chunk), alignment_for_file(path)
+    )
 
 
 def test():
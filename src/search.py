@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+import query_cache
+from lexical import BM25Index, reciprocal_rank_fusion
+from metrics import inc, timer
+from registry import (SHARDS_PATH, VS_PATH, get_bm25, get_embeddings,
+                      get_vectorstore, index_version, list_shards, shard_path)
+from retrieve_timestamp import get_timestamp_for_chunk_in_file
+from urls import make_timed_url
+from utils import timestamp_to_seconds
+
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+
+SNIPPET_LENGTH = 200
+SEARCH_MODES = ("dense", "lexical", "hybrid")
+# threads searching playlist shards in parallel
+FANOUT_WORKERS = 4
+
+
+def _resolve_timestamp(doc: Document) -> str | None:
+    # timestamps are resolved at index time, older indexes lack them
+    ts = doc.metadata.get("start_ts")
+    if ts is None:
+        ts = get_timestamp_for_chunk_in_file(
+            doc.page_content, doc.metadata["path"]
+        )
+    return ts
+
+
+def _to_moment(doc: Document, score: float) -> dict | None:
+    video_url = doc.metadata.get("url")
+    ts = _resolve_timestamp(doc)
+    if ts is None or video_url is None:
+        return None
+    snippet = doc.page_content
+    if len(snippet) > SNIPPET_LENGTH:
+        snippet = snippet[:SNIPPET_LENGTH].rsplit(" ", 1)[0] + "…"
+    return {
+        "score": float(score),
+        "video_url": video_url,
+        "timestamp": ts,
+        "end_timestamp": doc.metadata.get("end_ts"),
+        "url": make_timed_url(video_url, ts),
+        "embed_url": make_timed_url(video_url, ts, embed=True),
+        "snippet": snippet,
+        "source": doc.metadata.get("source"),
+        "path": doc.metadata.get("path"),
+    }
+
+
+def _top_moments(
+        docs_and_scores: list[tuple[Document, float]],
+        k: int,
+        window_sec: int
+    ) -> list[dict]:
+    """Turn ranked (Document, score) pairs into at most k timed moments.
+
+    Moments of a video within window_sec of a better one are skipped.
+    """
+    moments: list[dict] = []
+    kept: dict[str, list[int]] = {}
+    for doc, score in docs_and_scores:
+        moment = _to_moment(doc, score)
+        if moment is None:
+            continue
+        seconds = timestamp_to_seconds(moment["timestamp"])
+        video_times = kept.setdefault(moment["video_url"], [])
+        if any(abs(seconds - t) < window_sec for t in video_times):
+            continue
+        video_times.append(seconds)
+        moments.append(moment)
+        if len(moments) == k:
+            break
+    return moments
+
+
+def search_moments(
+        query: str,
+        vectorstore: FAISS | None = None,
+        k: int = 5,
+        fetch_k: int | None = None,
+        window_sec: int = 60,
+        mode: str = "dense",
+        bm25: BM25Index | None = None,
+        vs_path: str = VS_PATH
+    ) -> list[dict]:
+    """Return the top-k video moments matching a query.
+
+    Each moment is a dict with a 'score', 'video_url', 'timestamp',
+    'end_timestamp', timed 'url' and 'embed_url', a text 'snippet',
+    'source' and 'path'. Moments of the same video less than window_sec
+    apart are deduplicated.
+
+    Args:
+        query (str): The question string
+        vectorstore (FAISS | None): The FAISS index, None to use the
+            shared one
+        k (int): Number of moments to return
+        fetch_k (int | None): Number of chunks retrieved before
+            deduplication, 4 * k by default
+        window_sec (int): Deduplication window in seconds
+        mode (str): 'dense' for FAISS similarity search (score is a
+            distance, lower is better), 'lexical' for BM25 keyword search
+            without running the encoder (score is the BM25 score), or
+            'hybrid' for reciprocal rank fusion of both (score is the fused
+            score)
+        bm25 (BM25Index | None): Lexical index of the vectorstore's chunks,
+            None to use the shared one
+        vs_path (str): Directory of the shared indexes used when
+            vectorstore or bm25 is None. Defaults to 'data/vs'.
+
+    Returns:
+        list[dict]: Moments, best first
+    """
+    return search_moments_batch(
+        [query], vectorstore, k, fetch_k, window_sec, mode, bm25, vs_path
+    )[0]
+
+
+def _dense_rankings(
+        queries: list[str],
+        vectorstore: FAISS,
+        fetch_k: int
+    ) -> list[list[tuple[str, float]]]:
+    """Encode all queries in one call and search them in one FAISS search.
+
+    Returns (doc_id, distance) pairs per query. Repeated queries are not
+    re-encoded, see query_cache.embed_queries.
+    """
+    with timer("query_encode_seconds"):
+        matrix = query_cache.embed_queries(
+            list(queries), vectorstore.embeddings
+        )
+    if vectorstore._normalize_L2:
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    with timer("faiss_search_seconds"):
+        distances, indices = vectorstore.index.search(matrix, fetch_k)
+    return [
+        [
+            (vectorstore.index_to_docstore_id[i], float(distance))
+            for distance, i in zip(row_distances, row_indices)
+            if i != -1
+        ]
+        for row_distances, row_indices in zip(distances, indices)
+    ]
+
+
+def search_moments_batch(
+        queries: list[str],
+        vectorstore: FAISS | None = None,
+        k: int = 5,
+        fetch_k: int | None = None,
+        window_sec: int = 60,
+        mode: str = "dense",
+        bm25: BM25Index | None = None,
+        vs_path: str = VS_PATH
+    ) -> list[list[dict]]:
+    """Return the top-k moments of each query, see search_moments.
+
+    In 'dense' and 'hybrid' modes, all queries are encoded in one call to
+    the embedding model and searched with a single FAISS matrix search.
+    When searching the shared indexes, results are cached per query and
+    search parameters, and dropped once the indexes are rebuilt.
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(
+            f"Unknown search mode {mode!r}, expected one of {SEARCH_MODES}"
+        )
+    inc("search_queries_total", len(queries), mode=mode)
+    if vectorstore is not None or bm25 is not None:
+        with timer("search_seconds", mode=mode):
+            return _search(
+                queries, vectorstore, k, fetch_k, window_sec, mode, bm25,
+                vs_path
+            )
+
+    vs_path = str(vs_path)
+    version = index_version(vs_path)
+    keys = [
+        (query_cache.normalize_query(q), k, fetch_k, window_sec, mode)
+        for q in queries
+    ]
+    results = [
+        query_cache.results.get(key, version, namespace=vs_path)
+        for key in keys
+    ]
+    missing = [i for i, moments in enumerate(results) if moments is None]
+    if missing:
+        with timer("search_seconds", mode=mode):
+            found = _search(
+                [queries[i] for i in missing], None, k, fetch_k, window_sec,
+                mode, None, vs_path
+            )
+        for i, moments in zip(missing, found):
+            results[i] = moments
+            query_cache.results.put(
+                keys[i], moments, version, namespace=vs_path
+            )
+    # copies, so that callers cannot alter cached moments
+    return [[dict(m) for m in moments] for moments in results]
+
+
+def _search(
+        queries: list[str],
+        vectorstore: FAISS | None,
+        k: int,
+        fetch_k: int | None,
+        window_sec: int,
+        mode: str,
+        bm25: BM25Index | None,
+        vs_path: str = VS_PATH
+    ) -> list[list[dict]]:
+    from compact_store import get_documents
+
+    if vectorstore is None:
+        vectorstore = get_vectorstore(vs_path)
+    if vectorstore is None or not queries:
+        return [[] for _ in queries]
+    fetch_k = fetch_k or 4 * k
+    if mode != "dense" and bm25 is None:
+        bm25 = get_bm25(vs_path)
+        if bm25 is None:
+            logging.warning(
+                f"No BM25 index found, falling back from {mode} "
+                "to dense search"
+            )
+            mode = "dense"
+
+    dense = None
+    if mode != "lexical":
+        dense = _dense_rankings(queries, vectorstore, fetch_k)
+
+    results = []
+    for i, query in enumerate(queries):
+        if mode == "dense":
+            ranked = dense[i]
+        else:
+            with timer("bm25_search_seconds"):
+                lexical = bm25.search(query, fetch_k)
+            ranked = lexical if mode == "lexical" else reciprocal_rank_fusion([
+                [doc_id for doc_id, _ in dense[i]],
+                [doc_id for doc_id, _ in lexical],
+            ])[:fetch_k]
+        with timer("docstore_lookup_seconds"):
+            docs = get_documents(
+                vectorstore.docstore, [doc_id for doc_id, _ in ranked]
+            )
+        docs_and_scores = [
+            (docs[doc_id], score) for doc_id, score in ranked if doc_id in docs
+        ]
+        with timer("timestamp_resolve_seconds"):
+            results.append(_top_moments(docs_and_scores, k, window_sec))
+    return results
+
+
+def _merge_moments(
+        moments: list[dict],
+        k: int,
+        window_sec: int,
+        mode: str
+    ) -> list[dict]:
+    """Keep the k best moments of several indexes.
+
+    Moments of a video within window_sec of a better one are skipped, e.g.
+    of a video found in two playlists.
+    """
+    # dense scores are distances, the others are similarities
+    ranked = sorted(moments, key=lambda m: m["score"], reverse=mode != "dense")
+    merged: list[dict] = []
+    kept: dict[str, list[int]] = {}
+    for moment in ranked:
+        seconds = timestamp_to_seconds(moment["timestamp"])
+        video_times = kept.setdefault(moment["video_url"], [])
+        if any(abs(seconds - t) < window_sec for t in video_times):
+            continue
+        video_times.append(seconds)
+        merged.append(moment)
+        if len(merged) == k:
+            break
+    return merged
+
+
+def search_shards_batch(
+        queries: list[str],
+        playlists: list[str] | None = None,
+        k: int = 5,
+        fetch_k: int | None = None,
+        window_sec: int = 60,
+        mode: str = "dense",
+        shards_path: str = SHARDS_PATH,
+        max_workers: int = FANOUT_WORKERS
+    ) -> list[list[dict]]:
+    """Return the top-k moments of each query over playlist shards.
+
+    Only the shards of the requested playlists are searched, or all the
+    shards under shards_path if playlists is None. Shards are searched in
+    parallel threads with search_moments_batch, loaded on demand by the
+    registry, and their top-k moments are merged by score. Each moment
+    gets the 'playlist' it was found in. BM25 scores are computed with the
+    statistics of each shard, so lexical scores of different shards are
+    only roughly comparable.
+
+    Args:
+        queries (list[str]): The question strings
+        playlists (list[str] | None): Playlists to search, None for all
+        k (int): Number of moments to return per query
+        fetch_k (int | None): Number of chunks retrieved per shard before
+            deduplication, 4 * k by default
+        window_sec (int): Deduplication window in seconds
+        mode (str): 'dense', 'lexical' or 'hybrid', see search_moments
+        shards_path (str): Directory holding one index per playlist.
+            Defaults to 'data/shards'.
+        max_workers (int): Number of shards searched in parallel
+    Returns:
+        list[list[dict]]: Moments of each query, best first
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(
+            f"Unknown search mode {mode!r}, expected one of {SEARCH_MODES}"
+        )
+    shards = list_shards(shards_path) if playlists is None else list(playlists)
+    if not shards or not queries:
+        return [[] for _ in queries]
+    if mode != "lexical" and len(shards) > 1:
+        # encode once for all shards, which then read the query cache
+        with timer("query_encode_seconds"):
+            query_cache.embed_queries(list(queries), get_embeddings())
+
+    def search_shard(playlist: str) -> list[list[dict]]:
+        results = search_moments_batch(
+            queries, None, k, fetch_k, window_sec, mode, None,
+            shard_path(playlist, shards_path),
+        )
+        for moments in results:
+            for moment in moments:
+                moment["playlist"] = playlist
+        return results
+
+    inc("shard_searches_total", len(shards))
+    with timer("shard_fanout_seconds"):
+        if len(shards) == 1:
+            per_shard = [search_shard(shards[0])]
+        else:
+            with ThreadPoolExecutor(min(max_workers, len(shards))) as pool:
+                per_shard = list(pool.map(search_shard, shards))
+    return [
+        _merge_moments(
+            [m for results in per_shard for m in results[i]], k, window_sec,
+            mode
+        )
+        for i in range(len(queries))
+    ]
+
+
+def search_shards(
+        query: str,
+        playlists: list[str] | None = None,
+        k: int = 5,
+        **kwargs
+    ) -> list[dict]:
+    """Return the top-k moments of a query over playlist shards.
+
+    See search_shards_batch.
+    """
+    return search_shards_batch([query], playlists, k, **kwargs)[0]
@@ -0,0 +1,129 @@
+from collections.abc import Sequence
+from typing import NamedTuple
+
+import numpy as np
+
+from cleaning import TIMED_LINE_RE
+from utils import timestamp_to_seconds
+
+# "HH:MM:SS.mmm" as fixed-width bytes
+_WIDTH = 12
+_DIGITS = [0, 1, 3, 4, 6, 7, 9, 10, 11]
+# weight of each digit of _DIGITS in milliseconds
+_WEIGHTS = np.array(
+    [36_000_000, 3_600_000, 600_000, 60_000, 10_000, 1_000, 100, 10, 1],
+    dtype=np.int64,
+)
+
+
+class TimedColumns(NamedTuple):
+    """Timed lines of a transcript, stored column-wise.
+
+    offsets[i] is the position of texts[i] in the parsed text, seconds[i]
+    its start time in seconds (with milliseconds) and timestamps[i] the
+    original timestamp string.
+    """
+    offsets: np.ndarray
+    seconds: np.ndarray
+    texts: list[str]
+    timestamps: list[str]
+
+
+def timestamps_to_millis(timestamps: Sequence[str]) -> np.ndarray:
+    """Convert timestamps to milliseconds in one vectorized pass.
+
+    'HH:MM:SS', 'HH:MM:SS.mmm' and 'HH:MM:SS,mmm' timestamps, with 1 to 3
+    fraction digits, are decoded as fixed-width byte rows. Any other
+    format, e.g. 'MM:SS', falls back to timestamp_to_seconds (whole
+    seconds).
+
+    Returns:
+        np.ndarray: int64 milliseconds, one per timestamp
+    Raises:
+        ValueError: If a timestamp has an unrecognized format
+    """
+    lengths = np.fromiter(map(len, timestamps), dtype=np.int64)
+    if lengths.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    # longer strings are truncated, and rejected below by their length
+    raw = np.asarray(timestamps, dtype=f"S{_WIDTH}")
+    chars = raw.view(np.uint8).reshape(-1, _WIDTH)
+    digits = chars[:, _DIGITS].astype(np.int64) - ord("0")
+
+    has_millis = (
+        (lengths >= 10)
+        & (lengths <= _WIDTH)
+        & np.isin(chars[:, 8], list(b".,"))
+    )
+    # short fractions are padded to 3 digits ('.12' is 120 ms), rows
+    # without one are padded with zero bytes
+    for k in range(3):
+        digits[lengths <= 9 + k, 6 + k] = 0
+    valid = (
+        (has_millis | (lengths == 8))
+        & (chars[:, 2] == ord(":"))
+        & (chars[:, 5] == ord(":"))
+        & ((digits >= 0) & (digits <= 9)).all(axis=1)
+    )
+    millis = digits @ _WEIGHTS
+    for i in np.flatnonzero(~valid):
+        millis[i] = 1000 * timestamp_to_seconds(str(timestamps[i]))
+    return millis
+
+
+def timestamps_to_seconds(timestamps: Sequence[str]) -> np.ndarray:
+    """Convert timestamps to whole seconds in one vectorized pass.
+
+    This is like timestamp_to_seconds applied to each of them.
+
+    Returns:
+        np.ndarray: int64 seconds, one per timestamp
+    """
+    return timestamps_to_millis(timestamps) // 1000
+
+
+def seconds_to_timestamps(seconds: Sequence[float]) -> np.ndarray:
+    """Format seconds as 'HH:MM:SS.mmm' in one vectorized pass.
+
+    This is like second_to_timestamp applied to each of them.
+
+    Returns:
+        np.ndarray: Unicode array of timestamps
+    """
+    seconds = np.asarray(seconds, dtype=np.float64)
+    # rounded to the microsecond then truncated, as timedelta does
+    millis = np.round(seconds * 1e6).astype(np.int64) // 1000
+    hours, millis = np.divmod(millis, 3_600_000)
+    fields = [
+        # whole days are dropped, as in second_to_timestamp
+        hours % 24, millis // 60_000, millis // 1000 % 60, millis % 1000
+    ]
+    chars = np.full((seconds.size, _WIDTH), ord(":"), dtype=np.uint8)
+    chars[:, 8] = ord(".")
+    for field, (start, width) in zip(fields, [(0, 2), (3, 2), (6, 2), (9, 3)]):
+        for k in range(width):
+            digit = field.ravel() // 10**k % 10
+            chars[:, start + width - 1 - k] = digit + ord("0")
+    return chars.view(f"S{_WIDTH}").ravel().astype(str)
+
+
+def parse_timed_columns(text: str) -> TimedColumns:
+    """Parse the "timestamp text" lines of a transcript into columns.
+
+    The whole text is parsed in a single regex pass, lines without a
+    timestamp being ignored like in retrieve_timestamp.
+
+    Returns:
+        TimedColumns: offsets, seconds, texts and timestamps of the lines
+    """
+    offsets, texts, timestamps = [], [], []
+    for m in TIMED_LINE_RE.finditer(text):
+        offsets.append(m.start(2))
+        timestamps.append(m.group(1))
+        texts.append(m.group(2))
+    return TimedColumns(
+        offsets=np.array(offsets, dtype=np.int64),
+        seconds=timestamps_to_millis(timestamps) / 1000,
+        texts=texts,
+        timestamps=timestamps,
+    )
@@ -28,3 +28,10 @@ def make_timed_url(base_url: str, ts: str, embed: bool = False) -> str:
             return urlunparse(parsed._replace(query=new_query))
 
     return f"{url}#t={seconds}s"
+
+
+def video_id_from_url(url: str | None) -> str | None:
+    """Return the 'v' parameter of a YouTube URL, None if it has none."""
+    if not url:
+        return None
+    return parse_qs(urlparse(url.strip()).query).get("v", [None])[0]
@@ -1,6 +1,11 @@
 import re
+from collections.abc import Iterable
 from datetime import timedelta
-from pathlib import Path
+from pathlib import Path, PurePath
+
+# columnar binary transcripts, see binary_transcripts.py
+BINARY_SUFFIX = ".tsb"
+TRANSCRIPT_SUFFIXES = (".txt", BINARY_SUFFIX)
 
 
 def timestamp_to_seconds(ts: str) -> int:
@@ -32,20 +37,49 @@ def second_to_timestamp(seconds: float) -> str:
 
 def extract_number_from_name(name: str) -> int:
     """Extract the last integer from something like 'folder/15.txt'"""
-    match = re.search(r"(\d+)(?=\.txt$)", name)
+    match = re.search(r"(\d+)(?=\.(?:txt|tsb)$)", name)
     return int(match.group(1)) if match else -1
 
+def drop_converted(paths: Iterable[PurePath]) -> list[PurePath]:
+    """Drop the .txt transcripts that have a .tsb conversion next to them.
+
+    A transcript kept in both formats is then only read once.
+    """
+    paths = list(paths)
+    binaries = {p.with_suffix("") for p in paths if p.suffix == BINARY_SUFFIX}
+    return [
+        p for p in paths
+        if p.suffix != ".txt" or p.with_suffix("") not in binaries
+    ]
+
+
+def transcript_paths(folder: str | Path) -> list[Path]:
+    """Return the transcript files (.txt or binary .tsb) under a folder.
+
+    They are sorted by path. A .txt with a .tsb of the same name is
+    skipped, see drop_converted.
+    """
+    return sorted(drop_converted(
+        p for p in Path(folder).rglob("*")
+        if p.suffix in TRANSCRIPT_SUFFIXES and p.is_file()
+    ))
+
+
 def list_txt_rows(data_dir: Path = Path("data/dash")) -> list[dict[str, str]]:
-    """List all .txt files in the given directory and its subdirectories.
-        Returns a list of dicts with 'name' and 'path' keys,
-        sorted by the number in the filename.
+    """List all transcript files (.txt or .tsb) in a directory tree.
+
+    Returns a list of dicts with 'name' and 'path' keys, sorted by the
+    number in the filename.
+
     Args:
-        data_dir (Path): Path to the directory to search. Defaults to 'data/dash'.
+        data_dir (Path): Path to the directory to search. Defaults to
+            'data/dash'.
+
     Returns:
         list[dict[str, str]]: List of dicts with 'name' and 'path' keys.
     """
     rows = []
-    for p in data_dir.rglob("*.txt"):
+    for p in transcript_paths(data_dir):
         rows.append({
             "name": f"{p.parent.name}/{p.name}",
             "path": str(p.resolve()),
@@ -0,0 +1,57 @@
+from pathlib import Path
+
+import faiss
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import src.retrieve as retrieve
+from src.ann import (apply_search_params, build_index, load_index_meta,
+                     save_index_meta)
+
+
+def _write(path: Path, text: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+def test_search_params_of_another_index_type_are_ignored():
+    vectors = np.random.default_rng(0).random((64, 8), dtype=np.float32)
+    index, _ = build_index(vectors, "flat")
+    apply_search_params(index, {"nprobe": 16, "ef_search": 64})
+    ivf, params = build_index(vectors, "ivf", nprobe=4)
+    assert faiss.extract_index_ivf(ivf).nprobe == 4
+
+
+def test_save_index_meta_replaces_the_file(tmp_path: Path):
+    save_index_meta(tmp_path, {"index_type": "ivf", "params": {"nprobe": 8}})
+    save_index_meta(tmp_path, {"index_type": "flat", "params": {}})
+    assert load_index_meta(tmp_path)["index_type"] == "flat"
+    assert [p.name for p in tmp_path.iterdir()] == ["index_meta.json"]
+
+
+def test_compressed_index_without_transcripts_stays_flat(
+        tmp_path: Path, monkeypatch
+):
+    monkeypatch.setattr(
+        retrieve, "_get_embeddings", lambda: DeterministicFakeEmbedding(size=8)
+    )
+    folder = tmp_path / "dash"
+    vs_path = str(tmp_path / "vs")
+    cache_dir = str(tmp_path / "cache")
+    _write(folder / "pl" / "0.txt", "00:00:00.000 first video\n")
+    _write(folder / "pl" / "1.txt", "00:00:00.000 second video\n")
+
+    vs = retrieve.update_index(
+        str(folder), vs_path, cache_dir, index_type="ivfpq",
+        index_params={"m": 2}
+    )
+    assert vs.index.ntotal == 2
+
+    # every transcript of the shard deleted: nothing to train on
+    for path in (folder / "pl").glob("*.txt"):
+        path.unlink()
+    vs = retrieve.update_index(
+        str(folder), vs_path, cache_dir, index_type="ivfpq",
+        index_params={"m": 2}
+    )
+    assert vs is None or vs.index.ntotal == 0
@@ -0,0 +1,91 @@
+from pathlib import Path
+
+from src.binary_transcripts import (BinaryTranscript, binary_to_txt,
+                                    convert_folder, txt_to_binary)
+from src.build_dataset import (load_txt_file_as_chunks,
+                               load_txt_file_as_document)
+from src.catalog import Catalog
+from src.retrieve_timestamp import get_timestamp_for_chunk_in_file
+from src.utils import list_txt_rows, transcript_paths
+
+TRANSCRIPT = (
+    "# https://www.youtube.com/watch/?v=abc\n\n"
+    "00:00:00.000 Bonjour à tous\n"
+    "No text\n"
+    "00:00:05.500 aujourd'hui   on parle des onduleurs\n"
+    "00:01:10.250 et de leur maintenance.\n"
+)
+
+
+def _write_txt(tmp_path: Path) -> Path:
+    path = tmp_path / "pl" / "Title" / "0.txt"
+    path.parent.mkdir(parents=True)
+    path.write_text(TRANSCRIPT, encoding="utf-8")
+    return path
+
+
+def test_binary_transcript_stores_columns_and_metadata(tmp_path: Path):
+    path = txt_to_binary(_write_txt(tmp_path), language="fr")
+    assert path.suffix == ".tsb"
+    with BinaryTranscript(path) as transcript:
+        assert transcript.header["video_id"] == "abc"
+        assert transcript.header["title"] == "Title"
+        assert transcript.header["language"] == "fr"
+        assert len(transcript) == 3
+        assert transcript.starts.tolist() == [0.0, 5.5, 70.25]
+        assert transcript.segment(1) == "aujourd'hui on parle des onduleurs"
+        assert transcript.segments(*transcript.between(5, 80)) == [
+            "aujourd'hui on parle des onduleurs", "et de leur maintenance."
+        ]
+        assert transcript.timestamps()[2] == "00:01:10.250"
+
+
+def test_loaders_read_binary_like_txt(tmp_path: Path):
+    txt = _write_txt(tmp_path)
+    tsb = txt_to_binary(txt)
+    doc_txt = load_txt_file_as_document(txt)
+    doc_tsb = load_txt_file_as_document(tsb)
+    assert doc_tsb.page_content == doc_txt.page_content
+    assert doc_tsb.metadata["url"] == doc_txt.metadata["url"]
+
+    chunks_txt = load_txt_file_as_chunks(txt, chunk_size=40, chunk_overlap=0)
+    chunks_tsb = load_txt_file_as_chunks(tsb, chunk_size=40, chunk_overlap=0)
+    assert [(c.page_content, c.metadata["start_ts"]) for c in chunks_tsb] == [
+        (c.page_content, c.metadata["start_ts"]) for c in chunks_txt
+    ]
+    ts = get_timestamp_for_chunk_in_file("et de leur maintenance.", tsb)
+    assert ts == "00:01:10.250"
+
+
+def test_convert_folder_round_trip(tmp_path: Path):
+    txt = _write_txt(tmp_path)
+    original = load_txt_file_as_document(txt).page_content
+
+    converted = convert_folder(tmp_path, remove_source=True)
+    assert converted == [txt.with_suffix(".tsb")]
+    assert not txt.exists()
+    assert binary_to_txt(txt.with_suffix(".tsb")) == txt
+    assert load_txt_file_as_document(txt).page_content == original
+
+
+def test_converted_transcripts_kept_in_both_formats_are_listed_once(
+        tmp_path: Path
+):
+    txt = _write_txt(tmp_path)
+    catalog = Catalog(tmp_path)
+    catalog.sync()
+
+    # the default keeps the sources
+    assert convert_folder(tmp_path) == [txt.with_suffix(".tsb")]
+    assert txt.exists()
+    assert transcript_paths(tmp_path) == [txt.with_suffix(".tsb")]
+    assert [row["path"] for row in list_txt_rows(tmp_path)] == [
+        str(txt.with_suffix(".tsb"))
+    ]
+    changes = catalog.sync()
+    assert changes["added"] == [str(txt.with_suffix(".tsb"))]
+    assert changes["removed"] == [str(txt)]
+    assert [t["path"] for t in catalog.transcripts()] == [
+        str(txt.with_suffix(".tsb"))
+    ]
+    catalog.close()
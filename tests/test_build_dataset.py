@@ -1,6 +1,9 @@
 from pathlib import Path
+from types import SimpleNamespace
 
-from src.build_dataset import load_txt_folder_as_documents
+from src.build_dataset import (fetch_transcripts, iter_txt_folder_as_documents,
+                               load_txt_file_as_chunks,
+                               load_txt_folder_as_documents)
 
 
 def test_load_txt_folder_as_documents(tmp_path: Path):
@@ -34,3 +37,85 @@ def test_load_txt_folder_as_documents(tmp_path: Path):
     assert d1.page_content == "start end"
 
 
+def test_iter_txt_folder_as_documents_is_lazy_and_cached(tmp_path: Path):
+    for i in range(3):
+        (tmp_path / f"{i}.txt").write_text(
+            f"00:00:00.000 video {i}\n", encoding="utf-8"
+        )
+
+    docs = iter_txt_folder_as_documents(tmp_path)
+    assert next(docs).page_content == "video 0"
+    (tmp_path / "2.txt").write_text("00:00:00.000 edited\n", encoding="utf-8")
+    assert [d.page_content for d in docs] == ["video 1", "edited"]
+
+    # files are cleaned in worker processes, in the same order
+    (tmp_path / "2.txt").write_text(
+        "00:00:00.000 edited again\n", encoding="utf-8"
+    )
+    parallel = list(iter_txt_folder_as_documents(tmp_path, workers=2))
+    assert [d.page_content for d in parallel] == [
+        "video 0", "video 1", "edited again"
+    ]
+
+
+def test_load_txt_file_as_chunks(tmp_path: Path):
+    path = tmp_path / "0.txt"
+    path.write_text(
+        "# https://example.com/video\n"
+        "00:00:00.000 Hello\n"
+        "00:00:01.000 world!\n",
+        encoding="utf-8",
+    )
+
+    chunks = load_txt_file_as_chunks(path, chunk_size=700, chunk_overlap=50)
+    assert len(chunks) == 1
+    assert chunks[0].page_content == "Hello world!"
+    assert chunks[0].metadata == {
+        "source": "0.txt",
+        "path": str(path),
+        "url": "https://example.com/video",
+        "start_index": 0,
+        "end_index": 12,
+        "start_ts": "00:00:00.000",
+        "end_ts": "00:00:01.000",
+    }
+
+
+class _StubTranscriptApi:
+    """Local stand-in for YouTubeTranscriptApi."""
+
+    def __init__(self, transient_failures: int = 0):
+        self.transient_failures = transient_failures
+        self.calls: list[str] = []
+
+    def fetch(self, video_id, languages):
+        self.calls.append(video_id)
+        if video_id == "broken":
+            raise RuntimeError("no transcript")
+        if self.transient_failures:
+            self.transient_failures -= 1
+            raise ConnectionError("timeout")
+        return [
+            SimpleNamespace(start=1.0, text="Bonjour " + video_id),
+            SimpleNamespace(start=2.5, text="à tous"),
+        ]
+
+
+def test_fetch_transcripts_reports_failures(tmp_path: Path):
+    api = _StubTranscriptApi(transient_failures=1)
+    videos = {
+        "abc": str(tmp_path / "pl" / "0.txt"),
+        "broken": str(tmp_path / "pl" / "1.txt"),
+    }
+    failures = fetch_transcripts(
+        videos, max_workers=2, requests_per_second=1000, retries=2,
+        backoff=0, transcript_api=api,
+    )
+
+    assert list(failures) == ["broken"]
+    assert api.calls.count("broken") == 3
+    assert (tmp_path / "pl" / "0.txt").read_text(encoding="utf-8") == (
+        "# https://www.youtube.com/watch/?v=abc\n\n"
+        "00:00:01.000 Bonjour abc à tous"
+    )
+    assert not (tmp_path / "pl" / "1.txt").exists()
@@ -0,0 +1,131 @@
+from pathlib import Path
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import src.retrieve as retrieve
+from src.catalog import Catalog
+
+
+def _write(path: Path, text: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+def test_sync_detects_added_modified_and_removed(tmp_path: Path):
+    folder = tmp_path / "dash"
+    _write(folder / "pl" / "video" / "0.txt",
+           "# https://www.youtube.com/watch?v=abc\n00:00:00.000 first\n")
+    _write(folder / "pl" / "video" / "1.txt", "00:00:00.000 second\n")
+    catalog = Catalog(folder)
+
+    changes = catalog.sync()
+    assert sorted(Path(p).name for p in changes["added"]) == ["0.txt", "1.txt"]
+    assert changes["modified"] == changes["removed"] == []
+    transcripts = catalog.transcripts()
+    assert [t["playlist"] for t in transcripts] == ["pl", "pl"]
+    assert transcripts[0]["video_id"] == "abc"
+    assert {t["status"] for t in transcripts} == {"pending"}
+
+    # nothing changed
+    assert catalog.sync() == {"added": [], "modified": [], "removed": []}
+
+    # same size, other content: found by its hash
+    _write(folder / "pl" / "video" / "0.txt",
+           "# https://www.youtube.com/watch?v=abc\n00:00:00.000 FIRST\n")
+    (folder / "pl" / "video" / "1.txt").unlink()
+    changes = catalog.sync()
+    assert [Path(p).name for p in changes["modified"]] == ["0.txt"]
+    assert [Path(p).name for p in changes["removed"]] == ["1.txt"]
+    assert [row["name"] for row in catalog.rows()] == ["video/0.txt"]
+    catalog.close()
+
+    # the catalog persists across instances
+    catalog = Catalog(folder)
+    assert catalog.sync() == {"added": [], "modified": [], "removed": []}
+    assert catalog.playlists() == ["pl"]
+    catalog.close()
+
+
+def test_pending_playlists_until_indexed(tmp_path: Path):
+    folder = tmp_path / "dash"
+    _write(folder / "a" / "0.txt", "00:00:00.000 first\n")
+    _write(folder / "b" / "0.txt", "00:00:00.000 second\n")
+    catalog = Catalog(folder)
+    catalog.sync()
+    assert catalog.pending_playlists() == ["a", "b"]
+
+    catalog.mark_indexed(folder / "a", {
+        t["path"]: t["hash"] for t in catalog.transcripts(folder / "a")
+    })
+    assert catalog.pending_playlists() == ["b"]
+    statuses = [t["status"] for t in catalog.transcripts(folder / "a")]
+    assert statuses == ["indexed"]
+
+    # deleting an indexed transcript leaves its playlist pending until the
+    # index drops it
+    (folder / "a" / "0.txt").unlink()
+    catalog.sync()
+    assert catalog.transcripts(folder / "a") == []
+    assert catalog.pending_playlists() == ["a", "b"]
+    catalog.mark_indexed(folder / "a", {})
+    assert catalog.pending_playlists() == ["b"]
+    catalog.close()
+
+
+def test_update_shards_with_catalog(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(
+        retrieve, "_get_embeddings", lambda: DeterministicFakeEmbedding(size=8)
+    )
+    folder = tmp_path / "dash"
+    shards_path = str(tmp_path / "shards")
+    cache_dir = str(tmp_path / "cache")
+    _write(folder / "a" / "video" / "0.txt", "00:00:00.000 first playlist\n")
+    _write(folder / "b" / "video" / "0.txt", "00:00:00.000 second playlist\n")
+    catalog = Catalog(folder)
+    catalog.sync()
+
+    shards = retrieve.update_shards(
+        str(folder), shards_path, catalog=catalog, cache_dir=cache_dir
+    )
+    assert {p: vs.index.ntotal for p, vs in shards.items()} == {"a": 1, "b": 1}
+    assert catalog.pending_playlists() == []
+
+    _write(
+        folder / "b" / "video" / "1.txt",
+        "00:00:00.000 second playlist again\n"
+    )
+    catalog.sync()
+    assert catalog.pending_playlists() == ["b"]
+    shards = retrieve.update_shards(
+        str(folder), shards_path, catalog.pending_playlists(),
+        catalog=catalog, cache_dir=cache_dir,
+    )
+    assert shards["b"].index.ntotal == 2
+    assert catalog.pending_playlists() == []
+    catalog.close()
+
+
+def test_deletions_during_an_update_stay_pending(tmp_path: Path):
+    folder = tmp_path / "dash"
+    _write(folder / "a" / "0.txt", "00:00:00.000 first\n")
+    _write(folder / "a" / "1.txt", "00:00:00.000 second\n")
+    catalog = Catalog(folder)
+    catalog.sync()
+    catalog.mark_indexed(folder / "a", {
+        t["path"]: t["hash"] for t in catalog.transcripts(folder / "a")
+    })
+
+    # an update starts, then a transcript is deleted before it finishes
+    mark = catalog.deletion_mark()
+    indexed = {t["path"]: t["hash"] for t in catalog.transcripts(folder / "a")}
+    (folder / "a" / "1.txt").unlink()
+    catalog.sync()
+    catalog.mark_indexed(folder / "a", indexed, mark)
+    assert catalog.pending_playlists() == ["a"]
+
+    # the next update applies it
+    mark = catalog.deletion_mark()
+    indexed = {t["path"]: t["hash"] for t in catalog.transcripts(folder / "a")}
+    catalog.mark_indexed(folder / "a", indexed, mark)
+    assert catalog.pending_playlists() == []
+    catalog.close()
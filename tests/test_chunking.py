@@ -0,0 +1,37 @@
+from src.chunking import chunk_timed_lines, chunk_timed_transcript
+from src.cleaning import clean_transcript_and_extract_url
+
+RAW = (
+    "# https://www.youtube.com/watch?v=abc\n"
+    "00:00:00.000 first  line\n"
+    "No text\n"
+    "00:00:02.500 second line\n"
+    "# header\n"
+    "00:00:05.000 third line\n"
+    "00:00:07.000 fourth line\n"
+)
+
+
+def test_chunk_offsets_match_cleaned_text():
+    chunks, url = chunk_timed_transcript(RAW, chunk_size=25, chunk_overlap=12)
+    cleaned, cleaned_url = clean_transcript_and_extract_url(RAW)
+    assert url == cleaned_url
+    assert [c.text for c in chunks] == [
+        "first line second line",
+        "second line third line",
+        "third line fourth line",
+    ]
+    for c in chunks:
+        assert cleaned[c.start_index:c.end_index] == c.text
+    assert [(c.start_ts, c.end_ts) for c in chunks] == [
+        ("00:00:00.000", "00:00:02.500"),
+        ("00:00:02.500", "00:00:05.000"),
+        ("00:00:05.000", "00:00:07.000"),
+    ]
+
+
+def test_chunk_without_overlap_and_long_lines():
+    lines = [("00:00:00", "a" * 30), ("00:00:01", "b"), ("00:00:02", "c")]
+    chunks = chunk_timed_lines(lines, chunk_size=10, chunk_overlap=0)
+    assert [c.text for c in chunks] == ["a" * 30, "b c"]
+    assert chunk_timed_lines([]) == []
@@ -0,0 +1,91 @@
+import shutil
+from pathlib import Path
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import src.compact_store as compact_store
+from src.compact_store import (SQLiteDocstore, get_documents, load_vectorstore,
+                               migrate_pickled_indexes, save_vectorstore)
+
+
+def _vectorstore():
+    docs = [
+        Document(
+            id=f"id{i}",
+            page_content=text,
+            metadata={"source": f"{i}.txt", "start_ts": ts},
+        )
+        for i, (text, ts) in enumerate([
+            ("onduleurs solaires", "00:01:00.000"),
+            ("maintenance du système", "00:10:00.000"),
+        ])
+    ]
+    return FAISS.from_documents(docs, DeterministicFakeEmbedding(size=8))
+
+
+def test_save_and_load_without_pickle(tmp_path: Path):
+    vs = _vectorstore()
+    save_vectorstore(vs, tmp_path)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "index.faiss", "index.generation", "index.sqlite"
+    ]
+
+    loaded = load_vectorstore(tmp_path, vs.embeddings)
+    assert isinstance(loaded.docstore, SQLiteDocstore)
+    assert loaded.index_to_docstore_id == vs.index_to_docstore_id
+    expected = vs.similarity_search_with_score("maintenance du système", k=2)
+    found = loaded.similarity_search_with_score("maintenance du système", k=2)
+    assert [(d.page_content, d.metadata) for d, _ in found] == [
+        (d.page_content, d.metadata) for d, _ in expected
+    ]
+    docs = get_documents(loaded.docstore, ["id1", "missing"])
+    assert docs.keys() == {"id1"}
+
+
+def test_writable_load_can_be_updated(tmp_path: Path):
+    save_vectorstore(_vectorstore(), tmp_path)
+    vs = load_vectorstore(
+        tmp_path, DeterministicFakeEmbedding(size=8), writable=True
+    )
+    vs.delete(["id0"])
+    save_vectorstore(vs, tmp_path)
+    loaded = load_vectorstore(tmp_path, vs.embeddings)
+    assert loaded.index.ntotal == 1
+    doc = loaded.docstore.search("id1")
+    assert doc.page_content == "maintenance du système"
+
+
+def test_files_of_different_saves_are_not_paired(
+        tmp_path: Path, monkeypatch
+    ):
+    monkeypatch.setattr(compact_store, "LOAD_RETRY_SEC", 0)
+    vs = _vectorstore()
+    save_vectorstore(vs, tmp_path / "old")
+    vs.delete(["id0"])
+    save_vectorstore(vs, tmp_path / "new")
+    # a reader between the moves of the .sqlite and of the .generation
+    shutil.copy(tmp_path / "new" / "index.sqlite", tmp_path / "old")
+    shutil.copy(tmp_path / "new" / "index.faiss", tmp_path / "old")
+    with pytest.raises(ValueError, match="different saves"):
+        load_vectorstore(tmp_path / "old", vs.embeddings)
+
+    shutil.copy(tmp_path / "new" / "index.generation", tmp_path / "old")
+    assert load_vectorstore(tmp_path / "old", vs.embeddings).index.ntotal == 1
+
+
+def test_pickled_index_must_be_migrated(tmp_path: Path):
+    vs = _vectorstore()
+    vs.save_local(str(tmp_path))
+    with pytest.raises(FileNotFoundError, match="compact_store.py"):
+        load_vectorstore(tmp_path, vs.embeddings)
+
+    assert migrate_pickled_indexes(tmp_path) == ["index"]
+    assert not (tmp_path / "index.pkl").exists()
+    loaded = load_vectorstore(tmp_path, vs.embeddings)
+    assert loaded.index.ntotal == 2
+    assert loaded.docstore.search("id1").page_content == (
+        "maintenance du système"
+    )
@@ -0,0 +1,73 @@
+from pathlib import Path
+
+from src.embedding_cache import CachedEmbeddings, EmbeddingCache, cache_key
+
+
+class _CountingEmbeddings:
+    def __init__(self):
+        self.embedded: list[str] = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+
+def test_cached_embeddings_only_embed_new_text(tmp_path: Path):
+    model = _CountingEmbeddings()
+    cached = CachedEmbeddings(model, EmbeddingCache(tmp_path), "m|norm")
+    assert cached.embed_documents(["a", "bb"]) == [[1.0, 1.0], [2.0, 1.0]]
+    cached.cache.save()
+
+    # a fresh cache instance reads the persisted vectors back
+    cached = CachedEmbeddings(model, EmbeddingCache(tmp_path), "m|norm")
+    assert cached.embed_documents(["bb", "ccc"]) == [[2.0, 1.0], [3.0, 1.0]]
+    assert model.embedded == ["a", "bb", "ccc"]
+
+
+def test_cache_key_depends_on_namespace():
+    assert cache_key("m1", "text") != cache_key("m2", "text")
+
+
+def test_embedding_cache_evicts_least_recently_used(tmp_path: Path):
+    cache = EmbeddingCache(tmp_path, max_entries=2)
+    cache.put_many(["a", "b"], [[1.0], [2.0]])
+    cache.get_many(["a"])
+    cache.put_many(["c"], [[3.0]])
+    assert len(cache) == 2
+    assert cache.get_many(["a", "b", "c"]) == [[1.0], None, [3.0]]
+
+
+def test_caches_sharing_a_directory_do_not_overwrite_each_other(
+        tmp_path: Path
+):
+    # e.g. two rebuild jobs, in two processes, on the same cache
+    first = EmbeddingCache(tmp_path)
+    second = EmbeddingCache(tmp_path)
+    first.put_many(["text-a"], [[1.0, 0.0]])
+    second.put_many(["text-b"], [[0.0, 1.0]])
+    first.save()
+    second.save()
+
+    assert first.get_many(["text-a", "text-b"]) == [[1.0, 0.0], [0.0, 1.0]]
+    fresh = EmbeddingCache(tmp_path)
+    assert fresh.get_many(["text-a", "text-b"]) == [[1.0, 0.0], [0.0, 1.0]]
+
+
+def test_put_many_appends_to_the_log_until_saved(tmp_path: Path):
+    writer = EmbeddingCache(tmp_path, max_entries=2)
+    reader = EmbeddingCache(tmp_path, max_entries=2)
+    writer.put_many(["a", "b"], [[1.0], [2.0]])
+    assert not (tmp_path / "index.json").exists()
+    assert reader.get_many(["a", "b"]) == [[1.0], [2.0]]
+
+    # the reader replays the eviction of "a" as well
+    writer.put_many(["c"], [[3.0]])
+    assert reader.get_many(["a", "b", "c"]) == [None, [2.0], [3.0]]
+
+    writer.save()
+    assert not (tmp_path / "index.log").exists()
+    fresh = EmbeddingCache(tmp_path, max_entries=2)
+    assert fresh.get_many(["a", "b", "c"]) == [None, [2.0], [3.0]]
@@ -0,0 +1,34 @@
+import numpy as np
+
+from src.encoders import E5Embeddings, encoder_id, parity_check
+
+
+class _RecordingClient:
+    def __init__(self):
+        self.texts: list[str] = []
+
+    def encode(self, texts, **kwargs):
+        self.texts.extend(texts)
+        vectors = np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_e5_embeddings_apply_query_and_passage_prefixes():
+    client = _RecordingClient()
+    embeddings = E5Embeddings("small", "onnx-int8", client=client)
+    embeddings.embed_documents(["onduleurs solaires"])
+    embeddings.embed_query("onduleur")
+    assert client.texts == ["passage: onduleurs solaires", "query: onduleur"]
+    assert encoder_id(embeddings) == (
+        "intfloat/multilingual-e5-small|backend=onnx-int8|e5-prefixes|normalize=True"
+    )
+
+
+def test_parity_check_of_identical_encoders():
+    reference = E5Embeddings("small", "torch", client=_RecordingClient())
+    candidate = E5Embeddings("small", "onnx", client=_RecordingClient())
+    report = parity_check(
+        candidate, ["a", "bbbb"], ["ccc", "dddddd"], reference
+    )
+    assert report["passages"]["min_cosine"] > 0.999
+    assert report["top1_agreement"] == 1.0
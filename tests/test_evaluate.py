@@ -0,0 +1,101 @@
+import json
+from pathlib import Path
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.compact_store import save_vectorstore
+from src.evaluate import evaluate_batch, evaluate_query, load_labeled_queries
+from src.lexical import BM25_NAME
+from src.retrieve import build_bm25
+
+URL = "https://www.youtube.com/watch?v=abc"
+
+
+def _vectorstore():
+    docs = [
+        Document(
+            page_content=text,
+            metadata={"source": source, "path": source, "url": URL,
+                      "start_ts": ts, "end_ts": ts},
+        )
+        for text, source, ts in [
+            ("onduleurs solaires", "0.txt", "00:01:00.000"),
+            ("maintenance du système", "0.txt", "00:10:00.000"),
+            ("panneaux photovoltaïques", "1.txt", "00:02:00.000"),
+        ]
+    ]
+    return FAISS.from_documents(docs, DeterministicFakeEmbedding(size=16))
+
+
+def test_load_labeled_queries_from_jsonl_and_csv(tmp_path: Path):
+    jsonl = tmp_path / "q.jsonl"
+    record = {"question": "q1", "gt_source": "0.txt", "gt_ts": "00:01:00.000"}
+    jsonl.write_text(json.dumps(record) + "\n", encoding="utf-8")
+    csv_path = tmp_path / "q.csv"
+    csv_path.write_text(
+        "query,gt_source,gt_ts\nq1,0.txt,00:01:00.000\n", encoding="utf-8"
+    )
+    assert load_labeled_queries(jsonl) == load_labeled_queries(csv_path) == [
+        {"query": "q1", "gt_source": "0.txt", "gt_ts": "00:01:00.000"}
+    ]
+
+
+def test_evaluate_batch_reports_retrieval_metrics():
+    labeled = [
+        {"query": query, "gt_source": source, "gt_ts": ts}
+        for query, source, ts in [
+            ("maintenance du système", "0.txt", "00:10:05.000"),
+            ("panneaux photovoltaïques", "1.txt", "00:02:00.000"),
+            ("maintenance du système", "2.txt", "00:00:00.000"),
+        ]
+    ]
+    report = evaluate_batch(
+        labeled, _vectorstore(), k=3, batch_size=2, workers=2
+    )
+    metrics = report["metrics"]
+    assert [q["rank"] for q in report["queries"]] == [1, 1, None]
+    assert report["queries"][0]["ts_error_sec"] == 5.0
+    assert metrics["recall@1"] == metrics["mrr"] == 2 / 3
+    assert metrics["ts_error_sec"]["p50"] == 2.5
+    assert "recall@5" not in metrics
+
+
+def test_evaluate_batch_searches_the_given_vectorstore_lexically():
+    labeled = [
+        {"query": "maintenance", "gt_source": "0.txt",
+         "gt_ts": "00:10:00.000"},
+        {"query": "photovoltaïques", "gt_source": "1.txt",
+         "gt_ts": "00:02:00.000"},
+    ]
+    # the BM25 index is built from the given vectorstore, not data/vs
+    report = evaluate_batch(labeled, _vectorstore(), k=1, mode="lexical")
+    assert report["metrics"]["recall@1"] == 1.0
+
+
+def test_evaluate_batch_defaults_to_the_shards(tmp_path: Path):
+    vs = _vectorstore()
+    shard = tmp_path / "playlist"
+    save_vectorstore(vs, shard)
+    build_bm25(vs).save(shard / BM25_NAME)
+    labeled = [
+        {"query": "maintenance", "gt_source": "0.txt",
+         "gt_ts": "00:10:00.000"},
+    ]
+    report = evaluate_batch(
+        labeled, k=1, mode="lexical", shards_path=str(tmp_path)
+    )
+    assert report["metrics"]["recall@1"] == 1.0
+
+
+def test_evaluate_query_without_timestamp(tmp_path: Path):
+    (tmp_path / "0.txt").write_text("no timestamps here", encoding="utf-8")
+    metadata = {"source": "0.txt", "url": URL}
+    docs = [Document(page_content="texte", metadata=metadata)]
+    vs = FAISS.from_documents(docs, DeterministicFakeEmbedding(size=8))
+    result = evaluate_query(
+        "texte", "0.txt", "00:00:01.000", vs, str(tmp_path)
+    )
+    assert result["pred_ts"] is None
+    assert result["pred_url"] is None
@@ -0,0 +1,73 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import src.dash.jobs as jobs
+from src.dash.jobs import JobManager
+
+
+def _wait_idle(manager: JobManager, key: str, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while manager.is_active(key) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not manager.is_active(key)
+
+
+def test_job_manager_coalesces_duplicate_submissions():
+    manager = JobManager(executor_factory=lambda: ThreadPoolExecutor(1))
+    release = threading.Event()
+    started = threading.Event()
+    calls = []
+
+    def work(n):
+        calls.append(n)
+        started.set()
+        release.wait(5)
+        return n
+
+    first = manager.submit("rebuild", work, 1)
+    started.wait(5)
+    # while running, duplicates collapse into a single re-run
+    assert manager.submit("rebuild", work, 2) == first
+    assert manager.submit("rebuild", work, 3) == first
+    release.set()
+    _wait_idle(manager, "rebuild")
+
+    assert calls == [1, 3]
+    history = manager.jobs("rebuild")
+    assert [j["status"] for j in history] == ["done", "done"]
+    assert [j["result"] for j in history] == [3, 1]
+
+
+def test_job_manager_records_failures():
+    manager = JobManager(executor_factory=lambda: ThreadPoolExecutor(1))
+
+    def fail():
+        raise ValueError("boom")
+
+    job_id = manager.submit("fetch:pl", fail)
+    _wait_idle(manager, "fetch:pl")
+    job = manager.get(job_id)
+    assert job["status"] == "failed"
+    assert "boom" in job["error"]
+
+
+def test_job_manager_imports_string_targets_in_the_worker():
+    manager = JobManager(executor_factory=lambda: ThreadPoolExecutor(1))
+    job_id = manager.submit("join", "os.path:join", "data", "dash")
+    _wait_idle(manager, "join")
+    assert manager.get(job_id)["result"] == "data/dash"
+
+
+def test_job_manager_prunes_old_finished_jobs(monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_FINISHED_JOBS_PER_KEY", 2)
+    manager = JobManager(executor_factory=lambda: ThreadPoolExecutor(1))
+    for n in range(4):
+        manager.submit("rebuild", lambda n=n: n)
+        _wait_idle(manager, "rebuild")
+    manager.submit("fetch:pl", lambda: "other")
+    _wait_idle(manager, "fetch:pl")
+
+    assert [j["result"] for j in manager.jobs("rebuild")] == [3, 2]
+    assert len(manager.jobs("fetch:pl")) == 1
+    assert len(manager._futures) == 3
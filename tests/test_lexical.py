@@ -0,0 +1,32 @@
+from pathlib import Path
+
+from src.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_normalizes_case_accents_and_quotes():
+    assert tokenize("L’Onduleur Hybride, été!") == [
+        "l", "onduleur", "hybride", "ete"
+    ]
+
+
+def test_bm25_ranks_exact_terms_first(tmp_path: Path):
+    index = BM25Index()
+    index.add("a", "installation d'un onduleur Fronius Symo sur le toit")
+    index.add("b", "le rendement des panneaux en hiver")
+    index.add("c", "onduleur et batterie, le choix du matériel")
+
+    assert [i for i, _ in index.search("Fronius symo", k=3)] == ["a"]
+    assert [i for i, _ in index.search("onduleur", k=3)] == ["c", "a"]
+
+    index.remove("a")
+    assert [i for i, _ in index.search("onduleur fronius", k=3)] == ["c"]
+
+    index.save(tmp_path / "bm25.json")
+    loaded = BM25Index.load(tmp_path / "bm25.json")
+    assert loaded.search("hiver", k=3) == index.search("hiver", k=3)
+    assert len(loaded) == 2
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["a", "c", "b"]
@@ -0,0 +1,59 @@
+import flask
+
+from src.metrics import Metrics, register_metrics_endpoint
+
+
+def test_counters_and_timers_are_labeled():
+    metrics = Metrics(buckets=(0.1, 1.0))
+    metrics.inc("queries_total", mode="dense")
+    metrics.inc("queries_total", 2, mode="dense")
+    metrics.inc("queries_total", mode="lexical")
+    with metrics.timer("search_seconds", mode="dense"):
+        pass
+    metrics.observe("search_seconds", 5.0, mode="dense")
+
+    snapshot = metrics.snapshot()
+    counters = {c["labels"]["mode"]: c["value"] for c in snapshot["counters"]}
+    assert counters == {"dense": 3.0, "lexical": 1.0}
+    (histogram,) = snapshot["histograms"]
+    assert histogram["count"] == 2
+    assert histogram["buckets"] == {"0.1": 1, "1.0": 0, "+Inf": 1}
+
+
+def test_timed_records_failed_calls():
+    metrics = Metrics()
+
+    @metrics.timed("load_seconds", kind="chunks")
+    def load():
+        raise ValueError("boom")
+
+    try:
+        load()
+    except ValueError:
+        pass
+    assert metrics.snapshot()["histograms"][0]["count"] == 1
+
+
+def test_render_prometheus_has_cumulative_buckets_and_gauges():
+    metrics = Metrics(buckets=(0.1, 1.0))
+    metrics.observe("search_seconds", 0.05)
+    metrics.observe("search_seconds", 0.5)
+    metrics.inc("errors_total", error='say "hi"')
+    metrics.add_collector(lambda: {"cache_size": 3})
+
+    text = metrics.render_prometheus()
+    assert "# TYPE search_seconds histogram" in text
+    assert 'search_seconds_bucket{le="0.1"} 1' in text
+    assert 'search_seconds_bucket{le="1.0"} 2' in text
+    assert 'search_seconds_bucket{le="+Inf"} 2' in text
+    assert "search_seconds_count 2" in text
+    assert 'errors_total{error="say \\"hi\\""} 1.0' in text
+    assert "cache_size 3" in text
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    server = flask.Flask(__name__)
+    register_metrics_endpoint(server)
+    response = server.test_client().get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
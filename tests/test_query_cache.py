@@ -0,0 +1,52 @@
+from src.query_cache import (LRUCache, VersionedCache, embed_queries,
+                             query_cache_key)
+
+
+class _CountingEmbeddings:
+    model_name = "counting"
+
+    def __init__(self):
+        self.texts = []
+
+    def embed_queries(self, texts):
+        self.texts.extend(texts)
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_versioned_cache_drops_entries_of_older_versions():
+    cache = VersionedCache(max_entries=10)
+    cache.put("q", ["moment"], version=1)
+    assert cache.get("q", version=1) == ["moment"]
+    assert cache.get("q", version=2) is None
+    assert len(cache) == 0
+
+
+def test_embed_queries_encodes_each_normalized_query_once():
+    embeddings = _CountingEmbeddings()
+    key = query_cache_key("  onduleurs   solaires ")
+    assert key == "query: onduleurs solaires"
+    first = embed_queries(["onduleurs solaires", "maintenance"], embeddings)
+    second = embed_queries(["onduleurs  solaires ", "panneaux"], embeddings)
+    assert embeddings.texts == [
+        "onduleurs solaires", "maintenance", "panneaux"
+    ]
+    assert (first[0] == second[0]).all()
+
+
+def test_versioned_cache_namespaces_have_their_own_version():
+    cache = VersionedCache(max_entries=10)
+    cache.put("q", "a1", version=1, namespace="a")
+    cache.put("q", "b1", version=1, namespace="b")
+    assert cache.get("q", version=2, namespace="b") is None
+    assert cache.get("q", version=1, namespace="a") == "a1"
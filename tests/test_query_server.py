@@ -0,0 +1,128 @@
+import threading
+
+import flask
+import pytest
+
+from src.query_server import MAX_K, QueryBatcher, register_search_endpoint
+
+
+def _fake_search(calls):
+    def search(queries, playlists, k, mode):
+        calls.append((list(queries), playlists, k, mode))
+        return [
+            [{"url": f"u/{q}", "embed_url": f"e/{q}", "score": 0.0}][:k]
+            for q in queries
+        ]
+    return search
+
+
+def test_concurrent_queries_are_searched_in_one_batch():
+    calls = []
+    batcher = QueryBatcher(
+        window_ms=200, max_batch_size=8, search_fn=_fake_search(calls)
+    )
+    barrier = threading.Barrier(4)
+    results = {}
+
+    def worker(i):
+        barrier.wait()
+        results[i] = batcher.search(f"q{i}")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+
+    assert len(calls) == 1
+    assert sorted(calls[0][0]) == ["q0", "q1", "q2", "q3"]
+    assert {i: r[0]["url"] for i, r in results.items()} == {
+        i: f"u/q{i}" for i in range(4)
+    }
+    stats = batcher.stats()
+    assert stats["requests"] == 4 and stats["batches"] == 1
+    assert stats["latency_ms"]["p50"] <= stats["latency_ms"]["p99"]
+
+
+def test_batches_are_split_by_size_and_parameters():
+    calls = []
+    batcher = QueryBatcher(
+        window_ms=200, max_batch_size=2, search_fn=_fake_search(calls)
+    )
+    futures = [
+        batcher.submit("a"), batcher.submit("b"), batcher.submit("c", k=1)
+    ]
+    assert [f.result(5)[0]["url"] for f in futures] == ["u/a", "u/b", "u/c"]
+    batcher.close()
+    assert [(queries, k) for queries, _, k, _ in calls] == [
+        (["a", "b"], 5), (["c"], 1)
+    ]
+
+
+def test_cancelled_queries_are_skipped_and_k_is_clamped():
+    calls = []
+    batcher = QueryBatcher(window_ms=200, search_fn=_fake_search(calls))
+    cancelled = batcher.submit("cancelled")
+    assert cancelled.cancel()
+    kept = batcher.submit("kept", k=10 * MAX_K)
+    assert kept.result(5)[0]["url"] == "u/kept"
+    batcher.close()
+    assert calls == [(["kept"], None, MAX_K, "dense")]
+
+
+def test_failed_batch_fails_its_queries():
+    def search(*_):
+        raise ValueError("Unknown search mode")
+
+    batcher = QueryBatcher(window_ms=1, search_fn=search)
+    with pytest.raises(ValueError):
+        batcher.search("q", mode="other")
+    batcher.close()
+
+
+def test_worker_survives_unhashable_parameters():
+    calls = []
+    batcher = QueryBatcher(window_ms=200, search_fn=_fake_search(calls))
+    bad = batcher.submit("bad", playlists=[["x"]])
+    good = batcher.submit("good")
+    with pytest.raises(TypeError):
+        bad.result(5)
+    # the batch failed as a whole, the worker keeps serving
+    assert good.exception(5) is not None
+    assert batcher.search("later", timeout=5)[0]["url"] == "u/later"
+    batcher.close()
+
+
+def test_search_endpoint_returns_json(tmp_path):
+    (tmp_path / "pl").mkdir()
+    (tmp_path / "pl" / "index.faiss").touch()
+    calls = []
+    batcher = QueryBatcher(window_ms=1, search_fn=_fake_search(calls))
+    server = flask.Flask(__name__)
+    register_search_endpoint(server, batcher, shards_path=str(tmp_path))
+    client = server.test_client()
+
+    response = client.post("/api/search", json={"query": "inverter", "k": 3})
+    assert response.status_code == 200
+    assert response.get_json()["url"] == "u/inverter"
+    response = client.post(
+        "/api/search", json={"query": "inverter", "playlists": ["pl"]}
+    )
+    assert response.status_code == 200
+    assert calls[-1][1] == ["pl"]
+    for body in (
+        {},
+        ["inverter"],
+        {"query": "inverter", "k": "3"},
+        {"query": "inverter", "k": MAX_K + 1},
+        {"query": "inverter", "playlists": "pl"},
+        {"query": "inverter", "playlists": [["pl"]]},
+        {"query": "inverter", "playlists": ["../pl"]},
+        {"query": "inverter", "playlists": [str(tmp_path / "pl")]},
+    ):
+        assert client.post("/api/search", json=body).status_code == 400
+    assert len(calls) == 2
+    stats = client.get("/api/search/stats").get_json()
+    assert stats["requests"] == 2 and stats["latency_ms"]["p99"] is not None
+    batcher.close()
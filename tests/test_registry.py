@@ -0,0 +1,108 @@
+import os
+from pathlib import Path
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import src.registry as registry
+from src.compact_store import save_vectorstore
+from src.lexical import BM25_NAME, BM25Index
+from src.search import search_moments
+
+
+class _CountingEmbeddings(DeterministicFakeEmbedding):
+    queries: int = 0
+
+    def embed_query(self, text: str) -> list[float]:
+        self.queries += 1
+        return super().embed_query(text)
+
+
+def _save(vs_path: Path, texts: list[str]):
+    docs = [
+        Document(page_content=text, metadata={"source": f"{i}.txt"})
+        for i, text in enumerate(texts)
+    ]
+    vs = FAISS.from_documents(docs, DeterministicFakeEmbedding(size=8))
+    save_vectorstore(vs, vs_path)
+    # a rebuild within the mtime granularity of the filesystem still
+    # has to look changed
+    index_path = vs_path / "index.faiss"
+    mtime_ns = index_path.stat().st_mtime_ns + len(texts) * 10**9
+    os.utime(index_path, ns=(mtime_ns, mtime_ns))
+
+
+def test_rebuilt_index_is_picked_up(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(
+        registry, "get_embeddings", lambda: DeterministicFakeEmbedding(size=8)
+    )
+    _save(tmp_path, ["onduleurs solaires"])
+    version = registry.index_version(tmp_path)
+
+    first = registry.get_vectorstore(tmp_path)
+    assert first.index.ntotal == 1
+    # unchanged on disk: the loaded index is reused
+    assert registry.get_vectorstore(tmp_path) is first
+    assert registry.index_version(tmp_path) == version
+
+    _save(tmp_path, ["onduleurs solaires", "maintenance du système"])
+    assert registry.index_version(tmp_path) != version
+    second = registry.get_vectorstore(tmp_path)
+    assert second is not first
+    assert second.index.ntotal == 2
+    registry.unload(tmp_path)
+
+
+def test_warm_up_loads_the_model_and_the_index(tmp_path: Path, monkeypatch):
+    embeddings = _CountingEmbeddings(size=8)
+    monkeypatch.setattr(registry, "get_embeddings", lambda: embeddings)
+    _save(tmp_path, ["onduleurs solaires"])
+
+    registry.warm_up(None)
+    assert embeddings.queries == 1
+    assert str(tmp_path) not in registry._vectorstores
+
+    registry.warm_up(tmp_path)
+    assert embeddings.queries == 2
+    assert registry._vectorstores[str(tmp_path)][1].index.ntotal == 1
+    registry.unload(tmp_path)
+
+
+def test_lexical_search_does_not_load_the_model(tmp_path: Path, monkeypatch):
+    def fail():
+        raise AssertionError("the embedding model was loaded")
+
+    monkeypatch.setattr(registry, "get_embeddings", fail)
+    url = "https://www.youtube.com/watch?v=abc"
+    docs = [
+        Document(
+            page_content=text,
+            metadata={"source": "0.txt", "path": "0.txt", "url": url,
+                      "start_ts": ts, "end_ts": ts},
+        )
+        for text, ts in [
+            ("onduleurs solaires", "00:01:00.000"),
+            ("maintenance du système", "00:10:00.000"),
+        ]
+    ]
+    vs = FAISS.from_documents(docs, DeterministicFakeEmbedding(size=8))
+    save_vectorstore(vs, tmp_path)
+    bm25 = BM25Index()
+    for doc_id, doc in vs.docstore._dict.items():
+        bm25.add(doc_id, doc.page_content)
+    bm25.save(tmp_path / BM25_NAME)
+
+    loaded = registry.get_vectorstore(tmp_path)
+    moments = search_moments(
+        "maintenance", loaded, k=1, mode="lexical",
+        bm25=registry.get_bm25(tmp_path),
+    )
+    assert moments[0]["timestamp"] == "00:10:00.000"
+
+    # a dense search loads the model on first use
+    embeddings = _CountingEmbeddings(size=8)
+    monkeypatch.setattr(registry, "get_embeddings", lambda: embeddings)
+    search_moments("onduleurs solaires", loaded, k=1)
+    assert embeddings.queries == 1
+    registry.unload(tmp_path)
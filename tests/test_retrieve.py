@@ -0,0 +1,159 @@
+from pathlib import Path
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import src.retrieve as retrieve
+
+
+def _write(path: Path, text: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+def test_update_index_is_incremental(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(
+        retrieve, "_get_embeddings", lambda: DeterministicFakeEmbedding(size=8)
+    )
+    folder = tmp_path / "dash"
+    vs_path = tmp_path / "vs"
+    cache_dir = tmp_path / "cache"
+    _write(folder / "pl" / "0.txt", "00:00:00.000 first video\n")
+    _write(folder / "pl" / "1.txt", "00:00:00.000 second video\n")
+
+    vs = retrieve.update_index(str(folder), str(vs_path), str(cache_dir))
+    assert vs.index.ntotal == 2
+    manifest = retrieve.load_manifest(vs_path)
+    assert set(manifest["files"]) == {
+        str(folder / "pl" / "0.txt"), str(folder / "pl" / "1.txt")
+    }
+
+    # edit one file, delete the other, add a new one
+    _write(folder / "pl" / "0.txt", "00:00:00.000 first video, edited\n")
+    (folder / "pl" / "1.txt").unlink()
+    _write(folder / "pl" / "2.txt", "00:00:00.000 third video\n")
+
+    vs = retrieve.update_index(str(folder), str(vs_path), str(cache_dir))
+    contents = sorted(d.page_content for d in vs.docstore._dict.values())
+    assert contents == ["first video, edited", "third video"]
+    assert vs.index.ntotal == 2
+
+
+def test_update_shards_indexes_each_playlist_separately(
+        tmp_path: Path, monkeypatch
+):
+    monkeypatch.setattr(
+        retrieve, "_get_embeddings", lambda: DeterministicFakeEmbedding(size=8)
+    )
+    folder = tmp_path / "dash"
+    shards_path = tmp_path / "shards"
+    cache_dir = str(tmp_path / "cache")
+    _write(folder / "a" / "video" / "0.txt", "00:00:00.000 first playlist\n")
+    _write(folder / "b" / "video" / "0.txt", "00:00:00.000 second playlist\n")
+    _write(
+        folder / "b" / "video" / "1.txt",
+        "00:00:00.000 second playlist again\n"
+    )
+
+    counts = {
+        playlist: vs.index.ntotal
+        for playlist, vs in retrieve.update_shards(
+            str(folder), str(shards_path), cache_dir=cache_dir
+        ).items()
+    }
+    assert counts == {"a": 1, "b": 2}
+    assert retrieve.list_shards(str(shards_path)) == ["a", "b"]
+
+    # only the requested playlist is updated, and a playlist without
+    # transcripts loses its shard
+    for path in (folder / "b").rglob("*.txt"):
+        path.unlink()
+    shards = retrieve.update_shards(
+        str(folder), str(shards_path), ["b"], cache_dir=cache_dir
+    )
+    assert shards == {"b": None}
+    assert retrieve.list_shards(str(shards_path)) == ["a"]
+
+
+def test_update_index_after_switching_to_smaller_encoder(
+        tmp_path: Path, monkeypatch
+):
+    folder = tmp_path / "dash"
+    cache_dir = str(tmp_path / "cache")
+    _write(folder / "pl" / "0.txt", "00:00:00.000 first video\n")
+
+    for size in (8, 4):
+        monkeypatch.setattr(
+            retrieve, "_get_embeddings",
+            lambda size=size: DeterministicFakeEmbedding(size=size),
+        )
+        vs = retrieve.update_index(
+            str(folder), str(tmp_path / f"vs{size}"), cache_dir
+        )
+        assert vs.index.d == size
+    assert len(list(Path(cache_dir).iterdir())) == 2
+
+
+class _RecordingEmbeddings(DeterministicFakeEmbedding):
+    batches: list = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.batches.append(texts)
+        return super().embed_documents(texts)
+
+
+def test_embed_documents_streaming_keeps_the_input_order():
+    texts = ["a" * n for n in (30, 5, 20, 10, 25, 15)]
+    docs = [Document(id=f"id{i}", page_content=t) for i, t in enumerate(texts)]
+    embeddings = _RecordingEmbeddings(size=8, batches=[])
+
+    vs = retrieve.embed_documents_streaming(
+        docs, embeddings, batch_size=2, sort_window=2
+    )
+    # batches of similar lengths, within windows of 4 documents
+    assert [[len(t) for t in b] for b in embeddings.batches] == [
+        [5, 10], [20, 30], [15, 25]
+    ]
+    assert list(vs.index_to_docstore_id.values()) == [
+        f"id{i}" for i in range(6)
+    ]
+    expected = DeterministicFakeEmbedding(size=8).embed_documents(texts)
+    assert np.allclose(vs.index.reconstruct_n(0, 6), expected)
+
+
+def test_length_sorted_batches_follow_the_token_budget():
+    texts = ["a" * n for n in (400, 8, 40, 12, 36, 4, 1000)]
+    batches = retrieve._length_sorted_batches(
+        texts, batch_size=3, max_batch_tokens=40
+    )
+    assert sorted(i for batch in batches for i in batch) == list(range(7))
+    for batch in batches:
+        assert len(batch) <= 3
+        longest = max(retrieve._estimate_tokens(texts[i]) for i in batch)
+        # a text over the budget is alone in its batch
+        assert len(batch) * longest <= 40 or len(batch) == 1
+    assert [[len(texts[i]) for i in batch] for batch in batches] == [
+        [4, 8, 12], [36, 40], [400], [1000]
+    ]
+
+
+def test_update_index_passes_max_seq_length(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(
+        retrieve, "_get_embeddings", lambda: DeterministicFakeEmbedding(size=8)
+    )
+    configured = []
+    monkeypatch.setattr(
+        retrieve, "configure_encoder",
+        lambda embeddings, *args: configured.append(args)
+    )
+    folder = tmp_path / "dash"
+    _write(folder / "pl" / "0.txt", "00:00:00.000 first video\n")
+
+    retrieve.update_index(
+        str(folder), str(tmp_path / "vs"), None, max_seq_length=128
+    )
+    retrieve.embed_transcripts(str(folder), None, max_seq_length=256)
+    assert [max_seq_length for _, max_seq_length, _ in configured] == [
+        128, 256
+    ]
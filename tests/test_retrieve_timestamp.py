@@ -0,0 +1,49 @@
+from src.retrieve_timestamp import (build_alignment,
+                                    get_timestamp_for_chunk,
+                                    get_timestamp_range_for_chunk)
+
+TIMED_DOC = (
+    "# https://www.youtube.com/watch?v=abc\n"
+    "00:00:01.000 Bonjour à tous. Aujourd’hui on parle\n"
+    "00:00:05.000 des onduleurs solaires et de leur installation.\n"
+    "00:00:09.000 Ensuite nous verrons la maintenance du système.\n"
+)
+
+
+def test_get_timestamp_for_chunk_ignores_case_and_accents():
+    chunk = "DES ONDULEURS solaires et de leur installation. Ensuite"
+    assert get_timestamp_for_chunk(chunk, TIMED_DOC) == "00:00:05.000"
+
+
+def test_get_timestamp_for_chunk_not_found():
+    assert get_timestamp_for_chunk("rien à voir ici", TIMED_DOC) is None
+    assert get_timestamp_for_chunk("anything", "no timestamps") is None
+
+
+def test_get_timestamp_range_for_chunk():
+    index = build_alignment(TIMED_DOC)
+    chunk = (
+        "Aujourd'hui on parle des onduleurs solaires et de leur "
+        "installation. Ensuite nous verrons la maintenance du système."
+    )
+    assert get_timestamp_range_for_chunk(chunk, index) == (
+        "00:00:01.000", "00:00:09.000"
+    )
+
+
+def test_get_timestamp_for_chunk_fuzzy_match():
+    # one word differs from the transcript
+    chunk = "des onduleurs solaires et de leur pose. Ensuite nous verrons"
+    assert get_timestamp_for_chunk(chunk, TIMED_DOC) == "00:00:05.000"
+
+
+def test_alignment_index_timestamp_at():
+    index = build_alignment(TIMED_DOC)
+    assert index.timestamp_at(0) == "00:00:01.000"
+    assert index.timestamp_at(len(index.corpus) - 1) == "00:00:09.000"
+    assert index.timestamp_at(len(index.corpus)) is None
+
+
+def test_build_alignment_is_cached_by_content():
+    assert build_alignment(TIMED_DOC) is build_alignment(TIMED_DOC[:-1] + "\n")
+    assert build_alignment(TIMED_DOC) is not build_alignment(TIMED_DOC + "\n")
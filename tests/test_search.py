@@ -0,0 +1,115 @@
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.lexical import BM25Index
+from src.search import search_moments, search_moments_batch
+
+URL = "https://www.youtube.com/watch?v=abc"
+
+
+def _vectorstore():
+    docs = [
+        Document(
+            page_content=text,
+            metadata={"source": "0.txt", "path": "0.txt", "url": URL,
+                      "start_ts": ts, "end_ts": ts},
+        )
+        for text, ts in [
+            ("onduleurs solaires", "00:01:00.000"),
+            ("onduleurs solaires encore", "00:01:20.000"),
+            ("maintenance du système", "00:10:00.000"),
+        ]
+    ]
+    return FAISS.from_documents(docs, DeterministicFakeEmbedding(size=16))
+
+
+def test_search_moments_returns_timed_urls():
+    moments = search_moments("maintenance du système", _vectorstore(), k=3)
+    assert moments[0]["timestamp"] == "00:10:00.000"
+    assert moments[0]["url"] == URL + "&t=600"
+    assert moments[0]["embed_url"] == "https://www.youtube.com/embed/abc?start=600"
+    # the two chunks 20s apart in the same video count as one moment
+    assert len(moments) == 2
+
+
+def test_search_moments_batch_matches_single_queries():
+    vs = _vectorstore()
+    queries = ["onduleurs solaires", "maintenance du système"]
+    batch = search_moments_batch(queries, vs, k=1)
+    assert batch == [search_moments(q, vs, k=1) for q in queries]
+    assert [m[0]["timestamp"] for m in batch] == [
+        "00:01:00.000", "00:10:00.000"
+    ]
+
+
+def test_search_moments_lexical_and_hybrid_modes():
+    vs = _vectorstore()
+    bm25 = BM25Index()
+    for doc_id in vs.index_to_docstore_id.values():
+        bm25.add(doc_id, vs.docstore.search(doc_id).page_content)
+
+    lexical = search_moments("Maintenance", vs, k=1, mode="lexical", bm25=bm25)
+    assert lexical[0]["timestamp"] == "00:10:00.000"
+    hybrid = search_moments(
+        "maintenance du système", vs, k=1, mode="hybrid", bm25=bm25
+    )
+    assert hybrid[0]["timestamp"] == "00:10:00.000"
+
+
+def test_search_moments_caches_results_per_index_version(monkeypatch):
+    import src.search as search
+
+    calls = []
+    vs = _vectorstore()
+    monkeypatch.setattr(
+        search, "get_vectorstore", lambda *_: calls.append(1) or vs
+    )
+    monkeypatch.setattr(search, "index_version", lambda *_: (1, None))
+    search.query_cache.results.clear()
+
+    first = search_moments("maintenance du système", k=1)
+    assert search_moments("maintenance  du système ", k=1) == first
+    assert len(calls) == 1
+
+    monkeypatch.setattr(search, "index_version", lambda *_: (2, None))
+    search_moments("maintenance du système", k=1)
+    assert len(calls) == 2
+
+
+def test_search_shards_merges_requested_playlists(monkeypatch):
+    import src.search as search
+
+    other_url = "https://www.youtube.com/watch?v=def"
+    other = FAISS.from_documents(
+        [Document(
+            page_content="maintenance du système",
+            metadata={"source": "1.txt", "path": "1.txt", "url": other_url,
+                      "start_ts": "00:02:00.000"},
+        )],
+        DeterministicFakeEmbedding(size=16),
+    )
+    shards = {"shards/a": _vectorstore(), "shards/b": other}
+    searched = []
+    monkeypatch.setattr(
+        search, "get_embeddings", lambda: DeterministicFakeEmbedding(size=16)
+    )
+    monkeypatch.setattr(
+        search, "get_vectorstore",
+        lambda path: searched.append(path) or shards.get(path)
+    )
+    search.query_cache.results.clear()
+
+    moments = search.search_shards(
+        "maintenance du système", ["a", "b"], k=2, shards_path="shards"
+    )
+    # the exact matches of both shards come first, with their playlist
+    assert {(m["playlist"], m["score"]) for m in moments} == {
+        ("a", 0.0), ("b", 0.0)
+    }
+    assert sorted(searched) == ["shards/a", "shards/b"]
+
+    only_b = search.search_shards(
+        "maintenance du système", ["b"], k=2, shards_path="shards"
+    )
+    assert [m["video_url"] for m in only_b] == [other_url]
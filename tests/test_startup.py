@@ -0,0 +1,32 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+# loaded on first index, model or fetch, not when the modules are imported
+HEAVY_MODULES = [
+    "langchain_community", "faiss", "torch", "pytube",
+    "youtube_transcript_api",
+]
+
+
+def _loaded_after_import(module: str) -> list[str]:
+    code = (
+        f"import json, sys; import {module}; "
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} "
+        "if m in sys.modules]))"
+    )
+    python_path = os.pathsep.join([str(ROOT / "src"), str(ROOT)])
+    env = dict(os.environ, PYTHONPATH=python_path)
+    proc = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True, text=True, env=env, check=True
+    )
+    return json.loads(proc.stdout)
+
+
+def test_search_and_registry_imports_are_light():
+    assert _loaded_after_import("search") == []
+    assert _loaded_after_import("registry") == []
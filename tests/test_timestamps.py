@@ -0,0 +1,40 @@
+import numpy as np
+
+from src.timestamps import (parse_timed_columns, seconds_to_timestamps,
+                            timestamps_to_millis, timestamps_to_seconds)
+from src.utils import second_to_timestamp, timestamp_to_seconds
+
+
+def test_timestamps_to_seconds_matches_scalar_version():
+    timestamps = ["00:00:05.123", "01:02:03.999", "12:00:00", "02:03"]
+    assert timestamps_to_seconds(timestamps).tolist() == [
+        timestamp_to_seconds(ts) for ts in timestamps
+    ]
+    assert timestamps_to_millis(["00:00:05,500"]).tolist() == [5500]
+    assert timestamps_to_millis(
+        ["00:00:05.12", "00:00:05.1", "00:00:05.", "00:00:05.123"]
+    ).tolist() == [5120, 5100, 5000, 5123]
+    assert timestamps_to_millis([]).shape == (0,)
+
+
+def test_seconds_to_timestamps_matches_scalar_version():
+    seconds = np.array([0, 5.1234, 5.9999, 59, 3723.5])
+    assert seconds_to_timestamps(seconds).tolist() == [
+        second_to_timestamp(s) for s in seconds
+    ]
+
+
+def test_parse_timed_columns():
+    text = (
+        "# https://www.youtube.com/watch?v=abc\n"
+        "00:00:01.000 Bonjour\r\n"
+        "No text\n"
+        "  00:00:05,500   des onduleurs  \n"
+        "00:00:09.000    \n"
+    )
+    columns = parse_timed_columns(text)
+    assert columns.texts == ["Bonjour", "des onduleurs"]
+    assert columns.seconds.tolist() == [1.0, 5.5]
+    assert [
+        text[o:o + len(t)] for o, t in zip(columns.offsets, columns.texts)
+    ] == columns.texts